@@ -0,0 +1,152 @@
+'''
+The simulation backend used by the intersection, the main loop and the workers. The domains of the
+selected TraCI-compatible module (edge, vehicle, trafficlight, simulation, ...) are available as
+attributes of this module, e.g. backend.trafficlight.setPhase(...).
+'''
+import importlib
+
+# backend name -> module implementing the TraCI API
+BACKENDS = {
+    'traci': 'traci',       # separate sumo process, every call is a round trip over a TCP socket
+    'libsumo': 'libsumo',   # sumo loaded into this process, same API without the socket
+    'replay': 'replay_backend',     # serves an episode recorded with episode_trace.TraceRecorder, no sumo
+}
+
+_name = None
+_module = None
+_step_listeners = []
+_call_counter = None
+_counting_proxies = {}
+
+
+def register_backend(name, module_name):
+    '''
+    Make another module implementing the TraCI API selectable, e.g. a local stand-in for SUMO.
+    '''
+    BACKENDS[name] = module_name
+
+
+def select_backend(name):
+    '''
+    Select the backend for the following simulations. Must not be called while a simulation is running.
+    '''
+    global _name, _module
+    if name not in BACKENDS:
+        raise ValueError("unknown simulation backend '%s', expected one of %s" % (name, sorted(BACKENDS)))
+    _module = importlib.import_module(BACKENDS[name])
+    _name = name
+    _counting_proxies.clear()
+
+
+def backend_name():
+    '''
+    Return the name of the selected backend.
+    '''
+    if _module is None:
+        select_backend('traci')
+    return _name
+
+
+def start(cmd, label='default'):
+    '''
+    Start a simulation with the selected backend. The label distinguishes simultaneous traci connections
+    and is ignored by in-process backends, which can only run one simulation per process.
+    '''
+    if backend_name() == 'traci':
+        return _module.start(cmd, label=label)
+    return _module.start(cmd)
+
+
+def can_load():
+    '''
+    Return whether the selected backend can load a new simulation into the running one with load.
+    '''
+    if backend_name() == 'traci':
+        return True
+    return hasattr(_module, 'load')
+
+
+def load(args, label='default'):
+    '''
+    Replace the running simulation by one started with the sumo arguments args, the command without the
+    binary. The sumo process, or the in-process libsumo, is kept, so this is much cheaper than close and
+    start.
+    '''
+    if backend_name() == 'traci':
+        return _module.getConnection(label).load(args)
+    return _module.load(args)
+
+
+def close():
+    '''
+    Close the running simulation without waiting for a sumo process to exit.
+    '''
+    if backend_name() == 'traci':
+        _module.close(wait=False)
+    else:
+        _module.close()
+
+
+def simulationStep():
+    '''
+    Advance the running simulation by one step and then call the step listeners.
+    '''
+    if _call_counter is not None:
+        _call_counter['simulationStep'] += 1
+    _module.simulationStep()
+    for listener in _step_listeners:
+        listener()
+
+
+def add_step_listener(listener):
+    '''
+    Call listener() after every simulation step of the selected backend, e.g. to record the simulation.
+    '''
+    _step_listeners.append(listener)
+
+
+def remove_step_listener(listener):
+    '''
+    Stop calling a step listener.
+    '''
+    _step_listeners.remove(listener)
+
+
+def set_call_counter(counter):
+    '''
+    Count the calls made through this module by name, e.g. counter['vehicle.getSpeed'], in a
+    collections.Counter, or stop counting if counter is None.
+    '''
+    global _call_counter
+    _call_counter = counter
+    _counting_proxies.clear()
+
+
+class _CountingProxy:
+    def __init__(self, target, name, counter):
+        self._target = target
+        self._name = name
+        self._counter = counter
+
+    def __call__(self, *args, **kwargs):
+        self._counter[self._name] += 1
+        return self._target(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if callable(attribute):
+            attribute = _CountingProxy(attribute, self._name + '.' + name, self._counter)
+        # cache in the instance so later lookups do not come here
+        setattr(self, name, attribute)
+        return attribute
+
+
+def __getattr__(name):
+    # forward the TraCI domains and functions to the selected backend
+    if _module is None:
+        select_backend('traci')
+    if _call_counter is not None:
+        if name not in _counting_proxies:
+            _counting_proxies[name] = _CountingProxy(getattr(_module, name), name, _call_counter)
+        return _counting_proxies[name]
+    return getattr(_module, name)
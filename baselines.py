@@ -0,0 +1,89 @@
+'''
+Baseline signal controllers to compare the agent against. They choose the same actions as the agent, 1
+for north-south green and 0 for west-east green, so they run the same phase programs and their sum of
+staying times is read at the same points as the agent's.
+
+    policy = ActuatedPolicy()
+    policy.reset()                       # at the start of every episode
+    action = policy.choose_action(state)
+'''
+import numpy as np
+from traffic_signal_env import HALTING_SPEED, INT_SPEED_LIMIT
+
+# rows of the position and speed grids of the west, north, east and south roads, three lanes each
+_NS_ROWS = [3, 4, 5, 9, 10, 11]
+_WE_ROWS = [0, 1, 2, 6, 7, 8]
+
+
+def ns_green(state):
+    '''
+    Return whether north-south has green in a state.
+    '''
+    return state[2][0][0][0] == 0
+
+
+def halting_vehicles(state, rows, speed_limit=INT_SPEED_LIMIT):
+    '''
+    Count the occupied cells of the given grid rows whose vehicle is halting.
+    '''
+    p, v = state[0][0, rows], state[1][0, rows]
+    return int(np.count_nonzero((p > 0) & (v < HALTING_SPEED / speed_limit)))
+
+
+class FixedTimePolicy:
+    def __init__(self, green_decisions=3):
+        # every direction keeps green for green_decisions decisions of 10 steps, then switches
+        self._green_decisions = green_decisions
+        self.reset()
+
+    def reset(self):
+        '''
+        Start the cycle again for a new episode.
+        '''
+        self._held = 0
+
+    def choose_action(self, state):
+        '''
+        Keep the green direction until it has been held for its decisions, then switch.
+        '''
+        self._held += 1
+        if self._held > self._green_decisions:
+            self._held = 0
+            return 0 if ns_green(state) else 1
+        return 1 if ns_green(state) else 0
+
+
+class ActuatedPolicy:
+    def __init__(self, min_green_decisions=1, max_green_decisions=6):
+        # queue actuated: green is kept for at least min and at most max decisions of 10 steps, and in
+        # between switches as soon as more vehicles halt at red than at green
+        self._min_green_decisions = min_green_decisions
+        self._max_green_decisions = max_green_decisions
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget the green time held for a new episode.
+        '''
+        self._held = 0
+
+    def choose_action(self, state):
+        '''
+        Keep the green direction or switch to the other one, depending on the halting vehicles.
+        '''
+        green_rows, red_rows = (_NS_ROWS, _WE_ROWS) if ns_green(state) else (_WE_ROWS, _NS_ROWS)
+        self._held += 1
+        switch = (self._held > self._max_green_decisions or
+                  (self._held > self._min_green_decisions and
+                   halting_vehicles(state, red_rows) > halting_vehicles(state, green_rows)))
+        if switch:
+            self._held = 0
+            return 0 if ns_green(state) else 1
+        return 1 if ns_green(state) else 0
+
+
+# name -> policy factory
+BASELINES = {
+    'fixed-time': FixedTimePolicy,
+    'actuated': ActuatedPolicy,
+}
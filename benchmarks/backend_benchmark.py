@@ -0,0 +1,60 @@
+'''
+Compare simulation steps per second of the simulation backends on config/run.sumocfg, running a
+fixed-time signal program while observing intersection one as the training loop does. Also checks
+that every backend produces the same states. Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.backend_benchmark
+'''
+import optparse
+import os
+import tempfile
+import timeit
+import numpy as np
+import backend
+from intersection import TrafficGenerator, set_sumo
+from traffic_signal_env import NS_GREEN_PHASE, TLS_INT1_ID, WE_GREEN_PHASE, create_int1
+
+
+def run_episode(backend_name, sumo_cmd, steps):
+    '''
+    Run one episode and return the wall time and the observed states.
+    '''
+    int1 = create_int1()
+    backend.start(sumo_cmd, label='benchmark')
+    int1.subscribe()
+    states = []
+    start_time = timeit.default_timer()
+    for step in range(steps):
+        if step % 10 == 0:
+            states.append(int1.get_state())
+            backend.trafficlight.setPhase(TLS_INT1_ID, NS_GREEN_PHASE if step % 20 == 0 else WE_GREEN_PHASE)
+        backend.simulationStep()
+        int1.update_staying_times()
+    elapsed = timeit.default_timer() - start_time
+    backend.close()
+    return elapsed, states
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--backends', default='traci,libsumo', help='comma separated backend names')
+    options, args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        routes_file = os.path.join(tmp_dir, 'routes.rou.xml')
+        TrafficGenerator(options.steps, cache_dir=None, routes_file=routes_file).generate_routefile(options.seed)
+
+        results = []
+        for backend_name in options.backends.split(','):
+            sumo_cmd = set_sumo('run.sumocfg', options.steps, nogui=True, backend_name=backend_name)
+            sumo_cmd += ['--route-files', routes_file, '--no-warnings', 'true']
+            elapsed, states = run_episode(backend_name, sumo_cmd, options.steps)
+            results.append((backend_name, elapsed, states))
+
+    reference_states = results[0][2]
+    print('%10s %12s %8s %16s' % ('backend', 'steps/sec', 'speedup', 'same states'))
+    for backend_name, elapsed, states in results:
+        same = all(np.array_equal(a, b) for state, reference in zip(states, reference_states) for a, b in zip(state, reference))
+        print('%10s %12.1f %7.2fx %16s' % (backend_name, options.steps / elapsed, results[0][1] / elapsed, same))
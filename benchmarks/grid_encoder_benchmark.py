@@ -0,0 +1,52 @@
+'''
+Compare GridEncoder against the original list-of-lists grid construction on synthetic vehicles,
+without SUMO.
+
+Run from the repository root with: python -m benchmarks.grid_encoder_benchmark
+'''
+import optparse
+import timeit
+import numpy as np
+from grid_encoder import GridEncoder
+from benchmarks.legacy import legacy_encode_grids
+
+JUNCTION_X, JUNCTION_Y = -200.0, 0.0
+ROAD_LENGTH, CELL_LENGTH, SPEED_LIMIT = 500, 40, 15.64
+
+
+def synthetic_vehicles(count):
+    '''
+    Place vehicles uniformly along the four 500 m approaches of a junction.
+    '''
+    roads = np.random.randint(0, 4, size=count)
+    lanes = np.random.randint(0, 3, size=count)
+    distance = np.random.uniform(0, ROAD_LENGTH, size=count)    # distance from the far end of the road
+    positions = np.empty((count, 2))
+    positions[:, 0] = np.select([roads == 0, roads == 2], [JUNCTION_X - ROAD_LENGTH + distance, JUNCTION_X + distance], JUNCTION_X)
+    positions[:, 1] = np.select([roads == 1, roads == 3], [JUNCTION_Y + ROAD_LENGTH - distance, JUNCTION_Y - distance], JUNCTION_Y)
+    speeds = np.random.uniform(0, SPEED_LIMIT, size=count)
+    return roads, lanes, positions, speeds
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--repeats', type='int', default=2000)
+    options, args = parser.parse_args()
+
+    np.random.seed(0)
+    encoder = GridEncoder(JUNCTION_X, JUNCTION_Y, ROAD_LENGTH, CELL_LENGTH, SPEED_LIMIT)
+    print('%9s %12s %12s %8s %6s' % ('vehicles', 'legacy us', 'encoder us', 'speedup', 'equal'))
+    for count in [10, 50, 150, 400]:
+        vehicles = synthetic_vehicles(count)
+        # the encoder takes arrays, the legacy code iterates over Python values as TraCI returned them
+        python_vehicles = [v.tolist() for v in vehicles]
+
+        legacy = legacy_encode_grids(*python_vehicles, JUNCTION_X, JUNCTION_Y, ROAD_LENGTH, CELL_LENGTH, SPEED_LIMIT)
+        encoded = encoder.encode(*vehicles)
+        equal = all(np.array_equal(a.reshape(12, 12).astype(np.float32), b) for a, b in zip(legacy, encoded))
+
+        legacy_time = timeit.timeit(lambda: legacy_encode_grids(*python_vehicles, JUNCTION_X, JUNCTION_Y, ROAD_LENGTH,
+                                                                CELL_LENGTH, SPEED_LIMIT), number=options.repeats)
+        encoder_time = timeit.timeit(lambda: encoder.encode(*vehicles), number=options.repeats)
+        print('%9d %12.1f %12.1f %7.1fx %6s' % (count, legacy_time / options.repeats * 1e6, encoder_time / options.repeats * 1e6,
+                                                 legacy_time / encoder_time, equal))
@@ -0,0 +1,95 @@
+'''
+Compare CorridorStats against the original highway speed dictionary over a long horizon on the TraCI
+stand-in of benchmarks/mock_traci.py (no SUMO needed): time per step, the memory held after every block of
+steps, and the mean entry speed, which must agree. Also prints the percentiles of the sketch against the
+exact ones.
+
+Run from the repository root with: python -m benchmarks.highway_stats_benchmark
+'''
+import optparse
+import os
+import timeit
+import tracemalloc
+import numpy as np
+import backend
+from benchmarks import mock_traci
+from benchmarks.legacy import legacy_average_highway_speed, legacy_update_highway_speeds
+from traffic_signal_env import NE_HIGHWAY_ID, SE_HIGHWAY_ID, create_highway_stats
+
+MOCK_CMD = ['sumo', '-c', os.path.join('config', 'run.sumocfg')]
+
+
+def run(update, steps, blocks, trace, subscribe=None):
+    '''
+    Step the stand-in and call update after every step, and subscribe after starting it if given. Returns
+    the seconds spent in update and, if trace, the traced memory after every block of steps. Tracing slows
+    allocations down, so time without it.
+    '''
+    backend.start(MOCK_CMD)
+    if subscribe is not None:
+        subscribe()
+    update()
+    elapsed = 0.0
+    memory = []
+    if trace:
+        tracemalloc.start()
+    for block in range(blocks):
+        for i in range(steps // blocks):
+            backend.simulationStep()
+            start_time = timeit.default_timer()
+            update()
+            elapsed += timeit.default_timer() - start_time
+        if trace:
+            memory.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    backend.close()
+    return elapsed, memory
+
+
+def run_legacy(steps, blocks, trace):
+    '''
+    Run the original dictionary of entry speeds, returning it with the results of run.
+    '''
+    highway_speeds = {}
+    return (highway_speeds,) + run(lambda: (legacy_update_highway_speeds(highway_speeds, NE_HIGHWAY_ID),
+                                            legacy_update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)),
+                                   steps, blocks, trace)
+
+
+def run_streaming(steps, blocks, trace):
+    '''
+    Run CorridorStats, returning it with the results of run.
+    '''
+    highway_stats = create_highway_stats()
+    return (highway_stats,) + run(highway_stats.update, steps, blocks, trace, subscribe=highway_stats.subscribe)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=20000)
+    parser.add_option('--blocks', type='int', default=4)
+    parser.add_option('--vehicles-per-lane', type='int', default=4)
+    options, args = parser.parse_args()
+
+    backend.register_backend('mock', 'benchmarks.mock_traci')
+    backend.select_backend('mock')
+    mock_traci.configure(vehicles_per_lane=options.vehicles_per_lane)
+
+    highway_speeds, legacy_time, _ = run_legacy(options.steps, options.blocks, trace=False)
+    highway_stats, stats_time, _ = run_streaming(options.steps, options.blocks, trace=False)
+    legacy_memory = run_legacy(options.steps, options.blocks, trace=True)[2]
+    stats_memory = run_streaming(options.steps, options.blocks, trace=True)[2]
+
+    legacy_mean = legacy_average_highway_speed(highway_speeds)
+    combined = highway_stats.combined()
+    assert combined.count() == len(highway_speeds)
+    assert abs(combined.mean() - legacy_mean) < 1e-9 * legacy_mean, (combined.mean(), legacy_mean)
+    print('%d vehicles entered, mean entry speed %.6f (dictionary) %.6f (streaming)'
+          % (len(highway_speeds), legacy_mean, combined.mean()))
+    speeds = np.array(list(highway_speeds.values()))
+    for q in [10, 50, 90, 99]:
+        print('p%d: exact %.3f, sketch %.3f' % (q, np.percentile(speeds, q), combined.percentile(q)))
+
+    print('%12s %12s %s' % ('', 'us/step', 'memory held after each block (KB)'))
+    for name, elapsed, memory in [('dictionary', legacy_time, legacy_memory), ('streaming', stats_time, stats_memory)]:
+        print('%12s %12.2f %s' % (name, elapsed / options.steps * 1e6, ' '.join('%.0f' % (m / 1024) for m in memory)))
@@ -0,0 +1,71 @@
+'''
+Compare the per-call latency of the inference paths of DQNAgent.q_values (Keras predict_on_batch, the
+compiled forward function and the NumPy forward pass) with Keras predict, for single decisions and replay
+mini-batches of the online and target networks, and check that all paths give the same action values.
+The NumPy path is timed with cached weights and with a weight snapshot taken on every call, as happens
+when the agent trains between decisions.
+
+Run from the repository root with: python -m benchmarks.inference_benchmark
+'''
+import optparse
+import timeit
+import numpy as np
+from dqn_agent import DQNAgent
+
+
+def random_states(batch_size, rng):
+    '''
+    Return a batch of random [position, speed, light] states.
+    '''
+    positions = (rng.random((batch_size, 12, 12, 1)) < 0.2).astype(np.float32)
+    speeds = (positions * rng.random((batch_size, 12, 12, 1))).astype(np.float32)
+    lights = np.zeros((batch_size, 2, 1), dtype=np.float32)
+    lights[np.arange(batch_size), rng.integers(2, size=batch_size)] = 1
+    return [positions, speeds, lights]
+
+
+def latencies(function, states, calls):
+    '''
+    Return the wall time of every call of the function on the states, after a warm up call.
+    '''
+    function(states)
+    times = np.empty(calls)
+    for i in range(calls):
+        start_time = timeit.default_timer()
+        function(states)
+        times[i] = timeit.default_timer() - start_time
+    return times
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--calls', type='int', default=200)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    rng = np.random.default_rng(options.seed)
+    agent = DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                     memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+
+    print('%8s %8s %20s %10s %10s %14s' % ('network', 'batch', 'path', 'p50 ms', 'p99 ms', 'max abs diff'))
+    for batch_size in [1, 32]:
+        states = random_states(batch_size, rng)
+        for network, model, target in [('online', agent._model, False), ('target', agent._target_model, True)]:
+            reference = model.predict(states, verbose=0)
+
+            def q_values(s, inference, new_weights=False):
+                agent._inference = inference
+                if new_weights:
+                    agent._numpy_weights = [None, None]
+                return agent.q_values(s, target=target)
+
+            paths = [('predict', lambda s: model.predict(s, verbose=0)),
+                     ('predict_on_batch', lambda s: q_values(s, 'predict')),
+                     ('compiled', lambda s: q_values(s, 'compiled')),
+                     ('numpy', lambda s: q_values(s, 'numpy')),
+                     ('numpy new weights', lambda s: q_values(s, 'numpy', new_weights=True))]
+            for path, function in paths:
+                times = latencies(function, states, options.calls)
+                difference = np.abs(function(states) - reference).max()
+                print('%8s %8d %20s %10.3f %10.3f %14.2e' % (network, batch_size, path, np.percentile(times, 50) * 1e3,
+                                                             np.percentile(times, 99) * 1e3, difference))
@@ -0,0 +1,80 @@
+'''
+Measure the overhead of the instrumentation on the decision loop run against the TraCI stand-in of
+benchmarks/mock_traci.py (no SUMO needed): disabled, enabled, and enabled with cProfile or sampling, plus
+the cost of one disabled phase() hook. Prints the report of the instrumented episode.
+
+Run from the repository root with: python -m benchmarks.instrumentation_benchmark
+'''
+import json
+import optparse
+import os
+import timeit
+import backend
+import instrumentation
+from benchmarks import mock_traci
+from dqn_agent import DQNAgent
+from phase_scheduler import PhaseScheduler
+from traffic_signal_env import TLS_INT1_ID, create_highway_stats, create_int1, execute_action
+
+MOCK_CMD = ['sumo', '-c', os.path.join('config', 'run.sumocfg')]
+
+
+def run_episode(agent, episode, decisions):
+    '''
+    Run an episode of decisions on the stand-in and return its wall time and instrumentation report.
+    '''
+    instrumentation.begin_episode(episode)
+    start_time = timeit.default_timer()
+    backend.start(MOCK_CMD)
+    int1 = create_int1()
+    int1.subscribe()
+    int1.reset_staying_time_info()
+    scheduler = PhaseScheduler([TLS_INT1_ID])
+    highway_stats = create_highway_stats()
+    highway_stats.subscribe()
+    with instrumentation.phase('get_state'):
+        state = int1.get_state()
+    for i in range(decisions):
+        with instrumentation.phase('choose_action'):
+            action = agent.choose_action(state)
+        execute_action(scheduler, int1, action, state, highway_stats)
+        with instrumentation.phase('get_state'):
+            state = int1.get_state()
+    backend.close()
+    elapsed = timeit.default_timer() - start_time
+    return elapsed, instrumentation.end_episode()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--decisions', type='int', default=200)
+    parser.add_option('--vehicles-per-lane', type='int', default=4)
+    parser.add_option('--hooks', type='int', default=1000000, help='disabled phase() hooks to time')
+    options, args = parser.parse_args()
+
+    backend.register_backend('mock', 'benchmarks.mock_traci')
+    backend.select_backend('mock')
+    mock_traci.configure(vehicles_per_lane=options.vehicles_per_lane)
+    agent = DQNAgent(discount_rate=0.95, exploration_rate=0.0, learning_rate=0.0002,
+                     memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+
+    start_time = timeit.default_timer()
+    for i in range(options.hooks):
+        with instrumentation.phase('disabled'):
+            pass
+    hook_time = (timeit.default_timer() - start_time) / options.hooks
+
+    run_episode(agent, 0, 10)    # warm up
+    results = [('disabled',) + run_episode(agent, 1, options.decisions)]
+    instrumentation.enable(profile_episodes=[3, 4])
+    instrumentation.instrument_agent(agent)
+    results.append(('enabled',) + run_episode(agent, 2, options.decisions))
+    results.append(('cProfile',) + run_episode(agent, 3, options.decisions))
+    instrumentation.enable(profile_episodes=[4], profile_mode='sample')
+    results.append(('sampling',) + run_episode(agent, 4, options.decisions))
+
+    print(json.dumps(results[1][2], indent=2))
+    print('disabled phase() hook: %.0f ns' % (hook_time * 1e9))
+    print('%10s %14s %10s' % ('mode', 'episode s', 'overhead'))
+    for mode, elapsed, report in results:
+        print('%10s %14.3f %9.1f%%' % (mode, elapsed, (elapsed / results[0][1] - 1) * 100))
@@ -0,0 +1,205 @@
+'''
+Reference copies of code paths that have been replaced by faster versions. They are
+only kept so the benchmarks can compare against them and check equivalence.
+'''
+import numpy as np
+import backend
+
+
+def legacy_replay_experience(agent):
+    '''
+    The original per-sample replay: one predict/predict/fit call per experience.
+    '''
+    if len(agent._replay_memory) < agent._batch_size:
+        return
+
+    states, actions, rewards, next_states, dones = agent._replay_memory.sample(agent._batch_size)
+    for i in range(agent._batch_size):
+        state = [x[i:i + 1] for x in states]
+        next_state = [x[i:i + 1] for x in next_states]
+        target = rewards[i]
+        if not dones[i]:
+            target = rewards[i] + agent._discount_rate * np.amax(agent._target_model.predict(next_state, verbose=0)[0])
+        target_f = agent._model.predict(state, verbose=0)
+        target_f[0][actions[i]] = target
+        agent._model.fit(state, target_f, epochs=1, verbose=0)
+    agent.soft_update_target_network()
+
+
+def legacy_soft_update_target_network(agent):
+    '''
+    The original soft update: every weight is copied to host, averaged in a list and copied back.
+    '''
+    model_weights = agent._model.get_weights()
+    target_model_weights = agent._target_model.get_weights()
+    agent._target_model.set_weights([agent._update_rate * w + (1 - agent._update_rate) * tw for w, tw in zip(model_weights, target_model_weights)])
+
+
+def legacy_get_state(intersection):
+    '''
+    The original Intersection.get_state: three TraCI queries per vehicle and a junction position
+    query on every call.
+    '''
+    import traci
+
+    position_matrix = [[0 for j in range(12)] for i in range(12)]
+    speed_matrix = [[0 for j in range(12)] for i in range(12)]
+
+    junction_x, junction_y = traci.junction.getPosition(intersection._junction_id)
+    roads = [(intersection._w_id, 0, 0, 1, intersection._road_length - junction_x),
+             (intersection._n_id, 3, 1, -1, intersection._road_length + junction_y),
+             (intersection._e_id, 6, 0, 1, -junction_x),
+             (intersection._s_id, 9, 1, -1, junction_y)]
+    for road, row_offset, axis, sign, offset in roads:
+        for vehID in traci.edge.getLastStepVehicleIDs(road):
+            row = traci.vehicle.getLaneIndex(vehID) + row_offset
+            col = int((sign * traci.vehicle.getPosition(vehID)[axis] + offset) // intersection._cell_length)
+            col = min(col, 11)
+
+            position_matrix[row][col] = 1
+            speed_matrix[row][col] = traci.vehicle.getSpeed(vehID) / intersection._speed_limit
+
+    if traci.trafficlight.getPhase(intersection._tls_id) == intersection._ns_green_phase:
+        light_matrix = [0, 1]
+    else:
+        light_matrix = [1, 0]
+
+    p = np.array(position_matrix).reshape(1, 12, 12, 1)
+    v = np.array(speed_matrix).reshape(1, 12, 12, 1)
+    l = np.array(light_matrix).reshape(1, 2, 1)
+    return [p, v, l]
+
+
+def legacy_vehicles_in_roads(intersection):
+    '''
+    The original per-step query of the vehicles on the roads of an intersection.
+    '''
+    import traci
+
+    vehicles_in_roads = []
+    for road in [intersection._n_id, intersection._e_id, intersection._s_id, intersection._w_id]:
+        vehicles_in_roads += traci.edge.getLastStepVehicleIDs(road)
+    return vehicles_in_roads
+
+
+def legacy_encode_grids(roads, lanes, positions, speeds, junction_x, junction_y, road_length, cell_length, speed_limit):
+    '''
+    The original list-of-lists grid construction of get_state, applied to vehicle arrays instead of
+    TraCI queries. Roads are numbered west, north, east, south.
+    '''
+    position_matrix = [[0 for j in range(12)] for i in range(12)]
+    speed_matrix = [[0 for j in range(12)] for i in range(12)]
+
+    for road, lane, (x, y), speed in zip(roads, lanes, positions, speeds):
+        if road == 0:
+            row = lane
+            col = int((x + road_length - junction_x) // cell_length)
+        elif road == 1:
+            row = lane + 3
+            col = int((road_length + junction_y - y) // cell_length)
+        elif road == 2:
+            row = lane + 6
+            col = int((x - junction_x) // cell_length)
+        else:
+            row = lane + 9
+            col = int((junction_y - y) // cell_length)
+        col = min(col, 11)
+
+        position_matrix[row][col] = 1
+        speed_matrix[row][col] = speed / speed_limit
+
+    p = np.array(position_matrix).reshape(1, 12, 12, 1)
+    v = np.array(speed_matrix).reshape(1, 12, 12, 1)
+    return p, v
+
+
+class LegacyStayingTimes:
+    '''
+    The original staying time bookkeeping of Intersection, fed with the vehicle IDs on the roads.
+    '''
+    def __init__(self):
+        self._staying_times = {}
+        self._sum_of_staying_times = 0
+
+    def update(self, vehicles_in_roads):
+        for vehID in vehicles_in_roads:
+            if vehID not in self._staying_times:
+                self._staying_times[vehID] = 1
+            else:
+                self._staying_times[vehID] += 1
+
+    def cumultative_staying_time(self, vehicles_in_roads):
+        for vehID in self._staying_times:
+            if vehID not in vehicles_in_roads:
+                self._staying_times[vehID] = 0
+
+        cumultative_staying_time = sum(self._staying_times.values())
+        self._sum_of_staying_times += cumultative_staying_time
+        return cumultative_staying_time
+
+    def sum_of_staying_times(self):
+        return self._sum_of_staying_times
+
+
+def legacy_generate_routefile(time_steps, seed, routes_file):
+    '''
+    The original route generation: per-second np.random.uniform/randint draws for every destination and
+    one print per vehicle. Uses the route tables of intersection.py instead of the original branch ladder,
+    with the same draws and writes.
+    '''
+    from intersection import DEFAULT_DEMAND, ROUTE_CHOICES, ROUTES
+
+    np.random.seed(seed)
+    num_cars = 0
+    with open(routes_file, 'w') as routes:
+        print('''<routes>\n\t<vType id="average_car" vClass="passenger" accel="3" decel="4.5" minGap="2.5" maxSpeed="45" />
+            ''', file=routes)
+        for route in ROUTES:
+            print('    <route id="%s" edges="%s" />' % route, file=routes)
+
+        for i in range(time_steps):
+            for destination, thresholds, kinds in ROUTE_CHOICES:
+                if np.random.uniform() < DEFAULT_DEMAND[destination]:
+                    kind = kinds[np.searchsorted(thresholds, np.random.uniform(), side='right')]
+                    choice = kind[np.random.randint(0, len(kind))] if len(kind) > 1 else kind[0]
+                    print('    <vehicle id="%s_%i" type="average_car" route="%s" depart="%i" departLane="random" />'
+                          % (choice[0], num_cars, choice[1], i), file=routes)
+                    num_cars += 1
+
+        print('</routes>', file=routes)
+
+
+def legacy_update_highway_speeds(highway_speeds, highway_id):
+    '''
+    The original highway bookkeeping: every vehicle that ever entered the highway stays in the dictionary
+    with the speed it entered at.
+    '''
+    for vehID in backend.edge.getLastStepVehicleIDs(highway_id):
+        if vehID not in highway_speeds:
+            highway_speeds[vehID] = backend.vehicle.getSpeed(vehID)
+
+
+def legacy_average_highway_speed(highway_speeds):
+    '''
+    The original average of the entry speeds, which raises ZeroDivisionError if no vehicle entered.
+    '''
+    return sum(list(highway_speeds.values())) / len(list(highway_speeds.values()))
+
+
+def legacy_execute_action(tls_id, intersection, action, state, highway_speeds, highway_ids):
+    '''
+    The original action loop: the phase set again before every simulation step and the vehicles on the
+    highways queried after it, one round trip per call.
+    '''
+    from traffic_signal_env import phase_program
+
+    steps = 0
+    for phase, duration in phase_program(action, state):
+        for step in range(duration):
+            backend.trafficlight.setPhase(tls_id, phase)
+            backend.simulationStep()
+            for highway_id in highway_ids:
+                legacy_update_highway_speeds(highway_speeds, highway_id)
+            intersection.update_staying_times()
+            steps += 1
+    return steps
@@ -0,0 +1,72 @@
+'''
+Measure the per-step cost of recording training metrics: the two prints per decision step and the log.txt
+line per episode the training loop used to write, against MetricsWriter at each console verbosity. Reads
+the run back with load_run to check that every record arrived.
+
+Run from the repository root with: python -m benchmarks.metrics_benchmark
+'''
+import optparse
+import os
+import sys
+import tempfile
+import timeit
+from metrics import EPISODES, QUIET, STEPS, MetricsWriter, load_run
+
+
+def legacy_logging(directory, episodes, steps, stdout):
+    '''
+    Print every step and reward and append a free text line per episode to log.txt.
+    '''
+    for ep in range(episodes):
+        log = open(os.path.join(directory, 'log.txt'), 'a')
+        for step in range(steps):
+            print("step:", step * 10, file=stdout)
+            print('reward: ', -step, file=stdout)
+        log.write('episode: ' + str(ep + 1) + ',  Sum of staying times: ' + str(12345) + ', average highway speed: ' + str(20.5) + ', Execution time: ' + str(1.5) + '\n')
+        log.close()
+
+
+def metrics_logging(directory, episodes, steps, verbosity):
+    '''
+    Record the same steps and episodes with a MetricsWriter.
+    '''
+    metrics = MetricsWriter(directory, verbosity=verbosity)
+    for ep in range(episodes):
+        for step in range(steps):
+            metrics.log_step(ep + 1, step * 10, step % 2, -step, step % 30, step * 7)
+        metrics.log_episode(episode=ep + 1, sum_of_staying_times=12345, average_highway_speed=20.5,
+                            execution_time=1.5)
+    metrics.close()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--episodes', type='int', default=20)
+    parser.add_option('--steps', type='int', default=360, help='decision steps per episode')
+    parser.add_option('--console', action='store_true', default=False,
+                      help='print to the real stdout instead of os.devnull')
+    options, args = parser.parse_args()
+
+    total_steps = options.episodes * options.steps
+    stdout = sys.stdout if options.console else open(os.devnull, 'w')
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start_time = timeit.default_timer()
+        legacy_logging(tmp_dir, options.episodes, options.steps, stdout)
+        results.append(('prints + log.txt', timeit.default_timer() - start_time))
+
+        for name, verbosity in [('metrics quiet', QUIET), ('metrics episodes', EPISODES), ('metrics steps', STEPS)]:
+            run_dir = os.path.join(tmp_dir, name.replace(' ', '_'))
+            real_stdout, sys.stdout = sys.stdout, stdout
+            try:
+                start_time = timeit.default_timer()
+                metrics_logging(run_dir, options.episodes, options.steps, verbosity)
+                results.append((name, timeit.default_timer() - start_time))
+            finally:
+                sys.stdout = real_stdout
+            steps, episodes = load_run(run_dir)
+            assert len(steps['step']) == total_steps and len(episodes['episode']) == options.episodes
+
+    print('%18s %12s %10s' % ('sink', 'us/step', 'speedup'))
+    for name, elapsed in results:
+        print('%18s %12.2f %9.1fx' % (name, elapsed / total_steps * 1e6, results[0][1] / elapsed))
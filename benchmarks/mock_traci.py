@@ -0,0 +1,212 @@
+'''
+A deterministic stand-in for the parts of the TraCI API the project uses, so that the benchmarks can
+run without SUMO. It reads the edges and junctions of the network, keeps a fixed number of vehicles on
+every lane that drive along it at constant seeded speeds, and replaces each vehicle that reaches the end
+of its lane by a new one at the start. Traffic signals only remember the phase they were set to.
+
+Select it with backend.register_backend('mock', 'benchmarks.mock_traci') and backend.select_backend('mock'),
+and set the traffic with configure before backend.start.
+'''
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import traci.constants as tc
+
+_vehicles_per_lane = 4
+_seed = 0
+_simulation = None
+
+
+def configure(vehicles_per_lane=4, seed=0):
+    '''
+    Set the number of vehicles on every lane and the seed of their speeds for the following simulations.
+    '''
+    global _vehicles_per_lane, _seed
+    _vehicles_per_lane = vehicles_per_lane
+    _seed = seed
+
+
+def _net_file(cmd):
+    '''
+    Return the network file given by -n or by the net-file of the configuration given by -c.
+    '''
+    if '-n' in cmd:
+        return cmd[cmd.index('-n') + 1]
+    config_file = cmd[cmd.index('-c') + 1] if '-c' in cmd else os.path.join('config', 'run.sumocfg')
+    net_file = ET.parse(config_file).getroot().find('input/net-file').get('value')
+    return os.path.join(os.path.dirname(config_file), net_file)
+
+
+class _Simulation:
+    def __init__(self, net_file, vehicles_per_lane, seed):
+        net = ET.parse(net_file).getroot()
+        self._junctions = {junction.get('id'): (float(junction.get('x')), float(junction.get('y')))
+                           for junction in net.iter('junction') if junction.get('type') != 'internal'}
+        self._rng = np.random.default_rng(seed)
+        self._step = 0
+        self._count = 0
+        self._phases = {}
+        self._vehicles = {}     # vehID -> (edge, slot)
+        self._edges = {}        # edge -> per slot lane index, lane start, lane direction, lane length, position, speed, ID
+        for edge in net.iter('edge'):
+            if edge.get('function') == 'internal':
+                continue
+            starts, directions, lengths, lanes = [], [], [], []
+            for lane in edge.iter('lane'):
+                points = np.array([point.split(',') for point in lane.get('shape').split()], dtype=np.float64)
+                start, end = points[0], points[-1]
+                length = float(lane.get('length'))
+                for i in range(vehicles_per_lane):
+                    starts.append(start)
+                    directions.append((end - start) / max(np.linalg.norm(end - start), 1e-9))
+                    lengths.append(length)
+                    lanes.append(int(lane.get('index')))
+            slots = len(lanes)
+            lengths = np.array(lengths)
+            self._edges[edge.get('id')] = {
+                'lanes': lanes, 'starts': np.array(starts).reshape(slots, 2), 'directions': np.array(directions).reshape(slots, 2),
+                'lengths': lengths, 'positions': self._rng.random(slots) * lengths,
+                'speeds': self._rng.uniform(0, 15, slots), 'ids': [None] * slots}
+            for slot in range(slots):
+                self._new_vehicle(edge.get('id'), slot)
+
+    def _new_vehicle(self, edge, slot):
+        vehID = '%s.%d' % (edge, self._count)
+        self._count += 1
+        self._edges[edge]['ids'][slot] = vehID
+        self._vehicles[vehID] = (edge, slot)
+
+    def step(self):
+        self._step += 1
+        for edge, lanes in self._edges.items():
+            lanes['positions'] += lanes['speeds']
+            for slot in np.flatnonzero(lanes['positions'] >= lanes['lengths']).tolist():
+                # the vehicle left the edge, a new one enters at the start of the lane
+                del self._vehicles[lanes['ids'][slot]]
+                lanes['positions'][slot] -= lanes['lengths'][slot]
+                self._new_vehicle(edge, slot)
+
+    def vehicle_ids(self, edge):
+        return tuple(self._edges[edge]['ids'])
+
+    def edge_context(self, edge):
+        lanes = self._edges[edge]
+        return {vehID: {tc.VAR_ROAD_ID: edge, tc.VAR_SPEED: speed} for vehID, speed in zip(lanes['ids'], lanes['speeds'].tolist())}
+
+    def vehicle_variables(self, vehID):
+        edge, slot = self._vehicles[vehID]
+        lanes = self._edges[edge]
+        position = lanes['starts'][slot] + lanes['directions'][slot] * lanes['positions'][slot]
+        return {tc.VAR_LANE_INDEX: lanes['lanes'][slot], tc.VAR_POSITION: (float(position[0]), float(position[1])),
+                tc.VAR_SPEED: float(lanes['speeds'][slot])}
+
+    def junction_position(self, junction):
+        return self._junctions[junction]
+
+    def phase(self, tls):
+        return self._phases.get(tls, 0)
+
+    def set_phase(self, tls, phase):
+        self._phases[tls] = phase
+
+    def vehicle_count(self):
+        return len(self._vehicles)
+
+    def time(self):
+        return float(self._step)
+
+
+class _EdgeDomain:
+    def subscribe(self, edgeID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, edgeID):
+        return {tc.LAST_STEP_VEHICLE_ID_LIST: _simulation.vehicle_ids(edgeID)}
+
+    def getLastStepVehicleIDs(self, edgeID):
+        return _simulation.vehicle_ids(edgeID)
+
+    def subscribeContext(self, edgeID, domain, dist, varIDs):
+        pass
+
+    def getContextSubscriptionResults(self, edgeID):
+        # only the vehicles on the edge, whatever the range
+        return _simulation.edge_context(edgeID)
+
+
+class _VehicleDomain:
+    def subscribe(self, vehID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, vehID):
+        return _simulation.vehicle_variables(vehID)
+
+    def getLaneIndex(self, vehID):
+        return _simulation.vehicle_variables(vehID)[tc.VAR_LANE_INDEX]
+
+    def getPosition(self, vehID):
+        return _simulation.vehicle_variables(vehID)[tc.VAR_POSITION]
+
+    def getSpeed(self, vehID):
+        return _simulation.vehicle_variables(vehID)[tc.VAR_SPEED]
+
+
+class _JunctionDomain:
+    def getPosition(self, junctionID):
+        return _simulation.junction_position(junctionID)
+
+
+class _TrafficLightDomain:
+    def subscribe(self, tlsID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, tlsID):
+        return {tc.TL_CURRENT_PHASE: _simulation.phase(tlsID)}
+
+    def getPhase(self, tlsID):
+        return _simulation.phase(tlsID)
+
+    def setPhase(self, tlsID, index):
+        _simulation.set_phase(tlsID, index)
+
+    def setPhaseDuration(self, tlsID, duration):
+        # phases never switch by themselves
+        pass
+
+
+class _SimulationDomain:
+    def getMinExpectedNumber(self):
+        return _simulation.vehicle_count()
+
+    def getTime(self):
+        return _simulation.time()
+
+
+edge = _EdgeDomain()
+vehicle = _VehicleDomain()
+junction = _JunctionDomain()
+trafficlight = _TrafficLightDomain()
+simulation = _SimulationDomain()
+
+
+def start(cmd):
+    '''
+    Start a simulation of the network of the sumo command with the configured traffic.
+    '''
+    global _simulation
+    _simulation = _Simulation(_net_file(cmd), _vehicles_per_lane, _seed)
+
+
+def simulationStep():
+    '''
+    Advance the simulation by one step of one second.
+    '''
+    _simulation.step()
+
+
+def close():
+    '''
+    End the simulation.
+    '''
+    global _simulation
+    _simulation = None
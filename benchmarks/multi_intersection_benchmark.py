@@ -0,0 +1,188 @@
+'''
+Measure the decision latency of MultiIntersectionController against the number of controlled junctions on
+generated grid networks: observing every junction and choosing all actions with one batched forward pass,
+compared with one forward pass per junction. Also reports simulation steps per second of the controlled
+loop. Needs SUMO (netgenerate, sumo) and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.multi_intersection_benchmark
+'''
+import math
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import xml.etree.ElementTree as ET
+import numpy as np
+import backend
+from dqn_agent import DQNAgent
+from intersection import Intersection
+from multi_intersection import MultiIntersectionController
+from traffic_signal_env import NS_GREEN_PHASE, WE_GREEN_PHASE, stack_states
+
+ROAD_LENGTH = 500
+SPEED_LIMIT = 13.89     # netgenerate default edge speed
+
+
+def generate_grid(junctions, tmp_dir):
+    '''
+    Generate a grid of traffic light junctions with four 3-lane approaches each and return the net file.
+    '''
+    rows = max(1, int(math.sqrt(junctions / 2)))
+    cols = junctions // rows
+    if rows * cols != junctions:
+        sys.exit('cannot lay out %d junctions as a grid' % junctions)
+    net_file = os.path.join(tmp_dir, 'grid%d.net.xml' % junctions)
+    subprocess.run([os.path.join(os.environ['SUMO_HOME'], 'bin', 'netgenerate'), '--grid',
+                    '--grid.x-number', str(cols), '--grid.y-number', str(rows),
+                    '--grid.length', str(ROAD_LENGTH), '--grid.attach-length', str(ROAD_LENGTH),
+                    '-L', '3', '--default-junction-type', 'traffic_light', '--no-turnarounds',
+                    '-o', net_file], check=True, stdout=subprocess.DEVNULL)
+    return net_file
+
+
+def read_grid(net_file):
+    '''
+    Return the traffic light junctions as {id: (x, y, {direction: incoming edge})}, the fringe edges
+    entering and leaving the grid and the controlled links of every junction as (link index, edge, dir).
+    '''
+    net = ET.parse(net_file).getroot()
+    nodes = {j.get('id'): (float(j.get('x')), float(j.get('y')), j.get('type')) for j in net.iter('junction')}
+    junctions = {node: (x, y, {}) for node, (x, y, kind) in nodes.items() if kind == 'traffic_light'}
+    entering, leaving = [], []
+    for edge in net.iter('edge'):
+        if edge.get('function') == 'internal':
+            continue
+        source, target = edge.get('from'), edge.get('to')
+        if target in junctions:
+            x, y, roads = junctions[target]
+            dx, dy = nodes[source][0] - x, nodes[source][1] - y
+            if abs(dy) > abs(dx):
+                roads['n' if dy > 0 else 's'] = edge.get('id')
+            else:
+                roads['e' if dx > 0 else 'w'] = edge.get('id')
+        if source not in junctions:
+            entering.append((edge.get('id'), source))
+        if target not in junctions:
+            leaving.append((edge.get('id'), target))
+    links = {}
+    for connection in net.iter('connection'):
+        if connection.get('tl') is not None:
+            links.setdefault(connection.get('tl'), []).append(
+                (int(connection.get('linkIndex')), connection.get('from'), connection.get('dir')))
+    return junctions, entering, leaving, links
+
+
+def write_programs(junctions, links, tmp_dir):
+    '''
+    Write 8 phase programs laid out like the programs of config/network.net.xml: NS green, NS yellow,
+    NS left green, NS left yellow, then the same for WE.
+    '''
+    tls_file = os.path.join(tmp_dir, 'programs.add.xml')
+    with open(tls_file, 'w') as programs:
+        print('<additional>', file=programs)
+        for tls_id, tls_links in links.items():
+            roads = junctions[tls_id][2]
+            phases = []
+            for green_roads in [(roads['n'], roads['s']), (roads['w'], roads['e'])]:
+                for through, left in [('G', 'g'), ('y', 'g'), ('r', 'G'), ('r', 'y')]:
+                    state = ['r'] * len(tls_links)
+                    for index, edge, direction in tls_links:
+                        if edge in green_roads:
+                            state[index] = left if direction == 'l' else through
+                    phases.append(''.join(state))
+            print('    <tlLogic id="%s" type="static" programID="benchmark" offset="0">' % tls_id, file=programs)
+            for state, duration in zip(phases, [33, 3, 6, 3] * 2):
+                print('        <phase duration="%d" state="%s"/>' % (duration, state), file=programs)
+            print('    </tlLogic>', file=programs)
+        print('</additional>', file=programs)
+    return tls_file
+
+
+def write_routes(entering, leaving, steps, seed, tmp_dir):
+    '''
+    Write one flow from every fringe edge into the grid to a random fringe edge out of it.
+    '''
+    rng = np.random.default_rng(seed)
+    routes_file = os.path.join(tmp_dir, 'routes.rou.xml')
+    with open(routes_file, 'w') as routes:
+        print('<routes>', file=routes)
+        for i, (edge, source) in enumerate(entering):
+            targets = [target_edge for target_edge, target in leaving if target != source]
+            print('    <flow id="f%d" from="%s" to="%s" begin="0" end="%d" probability="0.08" departLane="best" departSpeed="10"/>'
+                  % (i, edge, targets[rng.integers(len(targets))], steps), file=routes)
+        print('</routes>', file=routes)
+    return routes_file
+
+
+def benchmark_grid(agent, junctions, options, tmp_dir):
+    '''
+    Return the batched and per-junction decision latencies in seconds and the simulation steps per second.
+    '''
+    net_file = generate_grid(junctions, tmp_dir)
+    grid, entering, leaving, links = read_grid(net_file)
+    tls_file = write_programs(grid, links, tmp_dir)
+    routes_file = write_routes(entering, leaving, options.steps, options.seed, tmp_dir)
+
+    intersections = [Intersection(n_id=roads['n'], e_id=roads['e'], s_id=roads['s'], w_id=roads['w'],
+                                  tls_id=tls_id, junction_id=tls_id,
+                                  ns_green_phase=NS_GREEN_PHASE, we_green_phase=WE_GREEN_PHASE,
+                                  road_length=ROAD_LENGTH, cell_length=40, speed_limit=SPEED_LIMIT)
+                     for tls_id, (x, y, roads) in sorted(grid.items())]
+    controller = MultiIntersectionController(agent, intersections)
+
+    from sumolib import checkBinary
+    backend.select_backend(options.backend)
+    backend.start([checkBinary('sumo'), '-n', net_file, '-r', routes_file, '-a', tls_file,
+                   '--no-step-log', 'true', '--no-warnings', 'true'], label='benchmark')
+    controller.reset()
+    for step in range(options.warmup):
+        controller.step()
+
+    # decisions for every junction at once, each observing the junction and choosing its action
+    agent.choose_actions(stack_states(controller.states()))     # warm up the inference function for this batch size
+    batched = []
+    per_junction = []
+    for i in range(options.decisions):
+        start_time = timeit.default_timer()
+        agent.choose_actions(stack_states([intersection.get_state() for intersection in intersections]))
+        batched.append(timeit.default_timer() - start_time)
+
+        start_time = timeit.default_timer()
+        for intersection in intersections:
+            agent.choose_actions(intersection.get_state())
+        per_junction.append(timeit.default_timer() - start_time)
+
+    start_time = timeit.default_timer()
+    for step in range(options.steps):
+        controller.step()
+    steps_per_second = options.steps / (timeit.default_timer() - start_time)
+    backend.close()
+    return batched, per_junction, steps_per_second
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--junctions', default='2,8,32', help='comma separated junction counts')
+    parser.add_option('--steps', type='int', default=300, help='timed simulation steps of the controlled loop')
+    parser.add_option('--warmup', type='int', default=200, help='simulation steps to fill the grid with traffic')
+    parser.add_option('--decisions', type='int', default=20, help='decisions to time per junction count')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--backend', default='traci')
+    options, args = parser.parse_args()
+
+    agent = DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                     memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+    agent.choose_actions(stack_states([[np.zeros((1, 12, 12, 1)), np.zeros((1, 12, 12, 1)), np.zeros((1, 2, 1))]]))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for junctions in [int(n) for n in options.junctions.split(',')]:
+            batched, per_junction, steps_per_second = benchmark_grid(agent, junctions, options, tmp_dir)
+            results.append((junctions, np.median(batched) * 1e3, np.median(per_junction) * 1e3, steps_per_second))
+
+    print('%10s %20s %12s %24s %10s %12s' % ('junctions', 'batched decision ms', 'per junction',
+                                             'one pass per junction ms', 'speedup', 'steps/sec'))
+    for junctions, batched_ms, per_junction_ms, steps_per_second in results:
+        print('%10d %20.2f %12.3f %24.2f %9.2fx %12.1f' % (junctions, batched_ms, batched_ms / junctions,
+                                                          per_junction_ms, per_junction_ms / batched_ms, steps_per_second))
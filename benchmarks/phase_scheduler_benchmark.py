@@ -0,0 +1,81 @@
+'''
+Run the same SUMO episode twice under a seeded random policy, once with the original action loop (the
+phase set before every step, the highway vehicles queried after it) and once with the PhaseScheduler and
+the subscribed highway statistics. Checks that both give the same states, rewards, sum of staying times
+and mean highway entry speed, and compares the TraCI round trips and wall time. Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.phase_scheduler_benchmark
+'''
+import optparse
+import random
+import timeit
+import numpy as np
+import backend
+from benchmarks.legacy import legacy_average_highway_speed, legacy_execute_action
+from benchmarks.traci_round_trips import RoundTripCounter
+from intersection import TrafficGenerator, set_sumo
+from phase_scheduler import PhaseScheduler
+from traffic_signal_env import NE_HIGHWAY_ID, SE_HIGHWAY_ID, TLS_INT1_ID, create_highway_stats, create_int1, execute_action
+
+
+def run_episode(sumo_cmd, steps, seed, scheduled):
+    '''
+    Run an episode and return its states, rewards, sum of staying times, mean highway entry speed, round
+    trips, simulation steps and wall time.
+    '''
+    rng = random.Random(seed)
+    int1 = create_int1()
+    backend.start(sumo_cmd, label='benchmark')
+    int1.subscribe()
+    int1.reset_staying_time_info()
+    scheduler = PhaseScheduler([TLS_INT1_ID])
+    highway_stats = create_highway_stats()
+    highway_stats.subscribe()
+    highway_speeds = {}
+
+    states = [int1.get_state()]
+    rewards = []
+    step = 0
+    with RoundTripCounter() as round_trips:
+        start_time = timeit.default_timer()
+        while step < steps and backend.simulation.getMinExpectedNumber() > 0:
+            action = rng.randint(0, 1)
+            staying_time_start = int1.cumultative_staying_time()
+            if scheduled:
+                step += execute_action(scheduler, int1, action, states[-1], highway_stats)
+            else:
+                step += legacy_execute_action(TLS_INT1_ID, int1, action, states[-1], highway_speeds,
+                                              [NE_HIGHWAY_ID, SE_HIGHWAY_ID])
+            rewards.append(staying_time_start - int1.cumultative_staying_time())
+            states.append(int1.get_state())
+        elapsed = timeit.default_timer() - start_time
+    backend.close()
+    highway_speed = highway_stats.mean() if scheduled else legacy_average_highway_speed(highway_speeds)
+    return states, rewards, int1.sum_of_staying_times(), highway_speed, round_trips.count, step, elapsed
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    TrafficGenerator(options.steps).generate_routefile(options.seed)
+    sumo_cmd = set_sumo('run.sumocfg', options.steps, nogui=True)
+    results = [('per-step setPhase',) + run_episode(sumo_cmd, options.steps, options.seed, scheduled=False),
+               ('PhaseScheduler',) + run_episode(sumo_cmd, options.steps, options.seed, scheduled=True)]
+
+    (_, legacy_states, legacy_rewards, legacy_sum, legacy_speed, _, _, _), \
+        (_, states, rewards, sum_of_staying_times, highway_speed, _, _, _) = results
+    assert len(states) == len(legacy_states)
+    for decision, (a, b) in enumerate(zip(legacy_states, states)):
+        assert all(np.array_equal(x, y) for x, y in zip(a, b)), 'states differ at decision %d' % decision
+    assert rewards == legacy_rewards
+    assert sum_of_staying_times == legacy_sum
+    assert abs(highway_speed - legacy_speed) < 1e-9 * legacy_speed, (highway_speed, legacy_speed)
+    print('%d decisions: same states, rewards, sum of staying times %d and mean highway entry speed %.6f'
+          % (len(rewards), sum_of_staying_times, highway_speed))
+
+    print('%20s %14s %16s %12s' % ('', 'round trips', 'per sim step', 'episode s'))
+    for name, states, rewards, total, speed, round_trips, steps, elapsed in results:
+        print('%20s %14d %16.2f %12.2f' % (name, round_trips, round_trips / steps, elapsed))
@@ -0,0 +1,96 @@
+'''
+Load generator for policy_server.py. Every client thread is a junction with its own keep-alive
+connection that replays synthetic intersection states, either as fast as the answers come back or at a
+fixed decision rate. Prints the throughput and latency percentiles measured by the clients and the
+metrics of the server, whose mean batch size shows how far the requests were coalesced. Start the server
+first, e.g. python policy_server.py --weights model.weights.h5 --address /tmp/policy.sock
+
+Run from the repository root with: python -m benchmarks.policy_server_benchmark --address /tmp/policy.sock
+'''
+import optparse
+import threading
+import timeit
+import numpy as np
+from policy_server import PolicyClient
+
+
+def synthetic_states(count, rng):
+    '''
+    Return count random [position, speed, light] states, shaped as Intersection.get_state returns them.
+    '''
+    states = []
+    for i in range(count):
+        position = (rng.random((1, 12, 12, 1)) < 0.2).astype(np.float32)
+        speed = (position * rng.random((1, 12, 12, 1))).astype(np.float32)
+        light = np.zeros((1, 2, 1), dtype=np.float32)
+        light[0, rng.integers(2)] = 1
+        states.append([position, speed, light])
+    return states
+
+
+def run_client(address, states, duration, rate, latencies, errors):
+    '''
+    Send the states in turn for duration seconds, rate per second or as fast as possible if rate is 0,
+    appending the latency of every answer to latencies.
+    '''
+    client = PolicyClient(address)
+    start_time = timeit.default_timer()
+    next_time = start_time
+    i = 0
+    try:
+        while timeit.default_timer() < start_time + duration:
+            if rate > 0:
+                next_time += 1 / rate
+                delay = next_time - timeit.default_timer()
+                if delay > 0:
+                    threading.Event().wait(delay)
+            send_time = timeit.default_timer()
+            client.act(states[i % len(states)])
+            latencies.append(timeit.default_timer() - send_time)
+            i += 1
+    except Exception as error:
+        errors.append(error)
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--address', default='127.0.0.1:8765', help='host:port or Unix socket path of the server')
+    parser.add_option('--clients', type='int', default=16, help='concurrent junctions')
+    parser.add_option('--duration', type='float', default=10.0, help='seconds of load')
+    parser.add_option('--rate', type='float', default=0.0,
+                      help='decisions per second of every junction (0 sends the next one as soon as answered)')
+    parser.add_option('--states', type='int', default=256, help='synthetic states replayed by every junction')
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    rng = np.random.default_rng(options.seed)
+    before = PolicyClient(options.address)
+    server_before = before.metrics()
+    latencies = [[] for client in range(options.clients)]
+    errors = []
+    threads = [threading.Thread(target=run_client, args=(options.address, synthetic_states(options.states, rng),
+                                                         options.duration, options.rate, latencies[client], errors))
+               for client in range(options.clients)]
+    start_time = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = timeit.default_timer() - start_time
+    server_after = before.metrics()
+    before.close()
+
+    if errors:
+        print('%d clients failed, first error: %s' % (len(errors), errors[0]))
+    times = np.concatenate([np.asarray(client_latencies) for client_latencies in latencies]) * 1e3
+    requests = server_after['requests'] - server_before['requests']
+    batches = server_after['batches'] - server_before['batches']
+    print('%d junctions, %d requests in %.1f s: %.1f requests/s' % (options.clients, len(times), elapsed,
+                                                                   len(times) / elapsed))
+    print('client latency ms: p50 %.2f, p99 %.2f, max %.2f' % (np.percentile(times, 50), np.percentile(times, 99),
+                                                               times.max()))
+    print('server: %d batches, mean batch size %.1f, latency p50 %.2f ms, p99 %.2f ms, mean forward pass %.2f ms'
+          % (batches, requests / max(batches, 1), server_after['latency_p50_ms'], server_after['latency_p99_ms'],
+             server_after['mean_inference_ms']))
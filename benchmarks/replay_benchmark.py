@@ -0,0 +1,73 @@
+'''
+Compare the per-sample replay update against the batched one.
+
+Run from the repository root with: python -m benchmarks.replay_benchmark
+'''
+import optparse
+import random
+import timeit
+import numpy as np
+from dqn_agent import DQNAgent
+from benchmarks.legacy import legacy_replay_experience
+
+
+def random_state():
+    '''
+    Generate a state with the same shapes and dtypes that Intersection.get_state returns.
+    '''
+    p = np.random.randint(0, 2, size=(1, 12, 12, 1))
+    v = np.random.uniform(size=(1, 12, 12, 1)) * p
+    l = np.array([0, 1]).reshape(1, 2, 1) if np.random.rand() < 0.5 else np.array([1, 0]).reshape(1, 2, 1)
+    return [p, v, l]
+
+
+def make_agent(memory_capacity, batch_size):
+    agent = DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                     memory_capacity=memory_capacity, action_size=2, batch_size=batch_size, update_rate=0.001)
+    for i in range(memory_capacity):
+        agent.add_experience(random_state(), random.randrange(2), np.random.uniform(-100, 100), random_state(), i % 50 == 49)
+    return agent
+
+
+def check_targets(agent):
+    '''
+    Check that the batched targets match the ones computed one experience at a time.
+    '''
+    states, actions, rewards, next_states, dones = agent._replay_memory.gather(np.arange(agent._batch_size))
+    expected = []
+    for i in range(agent._batch_size):
+        target = rewards[i]
+        if not dones[i]:
+            next_state = [x[i:i + 1] for x in next_states]
+            target = rewards[i] + agent._discount_rate * np.amax(agent._target_model.predict(next_state, verbose=0)[0])
+        expected.append(target)
+
+    targets = rewards + agent._discount_rate * np.amax(agent._target_model.predict_on_batch(next_states), axis=1) * ~dones
+
+    return np.max(np.abs(np.array(expected) - targets))
+
+
+def time_updates(replay, agent, updates):
+    replay(agent)   # warm up graph tracing
+    start_time = timeit.default_timer()
+    for i in range(updates):
+        replay(agent)
+    return updates / (timeit.default_timer() - start_time)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--updates', type='int', default=20, help='number of replay updates to time')
+    parser.add_option('--batch-size', type='int', default=32)
+    options, args = parser.parse_args()
+
+    random.seed(0)
+    np.random.seed(0)
+    agent = make_agent(200, options.batch_size)
+
+    print('max target difference:', check_targets(agent))
+    per_sample = time_updates(legacy_replay_experience, agent, options.updates)
+    batched = time_updates(DQNAgent.replay_experience, agent, options.updates)
+    print('per-sample: %.2f updates/s' % per_sample)
+    print('batched:    %.2f updates/s' % batched)
+    print('speedup:    %.1fx' % (batched / per_sample))
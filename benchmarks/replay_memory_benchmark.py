@@ -0,0 +1,62 @@
+'''
+Compare memory per transition and sampling time of the old deque-of-tuples replay memory
+and the preallocated ReplayMemory.
+
+Run from the repository root with: python -m benchmarks.replay_memory_benchmark
+'''
+import optparse
+import random
+import timeit
+import tracemalloc
+from collections import deque
+import numpy as np
+from replay_memory import ReplayMemory
+
+
+def random_state():
+    '''
+    Generate a state with the same shapes and dtypes that Intersection.get_state returns.
+    '''
+    p = np.random.randint(0, 2, size=(1, 12, 12, 1))
+    v = np.random.uniform(size=(1, 12, 12, 1)) * p
+    l = np.array([0, 1]).reshape(1, 2, 1) if np.random.rand() < 0.5 else np.array([1, 0]).reshape(1, 2, 1)
+    return [p, v, l]
+
+
+def bytes_per_transition(make_memory, add, transitions):
+    '''
+    Measure the traced heap growth per stored transition.
+    '''
+    tracemalloc.start()
+    memory = make_memory()
+    for i in range(transitions):
+        add(memory, (random_state(), random.randrange(2), np.random.uniform(-100, 100), random_state(), False))
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used / transitions, memory
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--transitions', type='int', default=5000)
+    parser.add_option('--batch-size', type='int', default=32)
+    parser.add_option('--samples', type='int', default=2000)
+    options, args = parser.parse_args()
+
+    random.seed(0)
+    np.random.seed(0)
+    n = options.transitions
+
+    deque_bytes, old_memory = bytes_per_transition(lambda: deque(maxlen=n), lambda m, e: m.append(e), n)
+    array_bytes, new_memory = bytes_per_transition(lambda: ReplayMemory(n), lambda m, e: m.add(*e), n)
+    print('deque of tuples: %.0f bytes/transition' % deque_bytes)
+    print('ReplayMemory:    %.0f bytes/transition (%.1fx smaller)' % (array_bytes, deque_bytes / array_bytes))
+
+    def sample_deque():
+        minibatch = random.sample(old_memory, options.batch_size)
+        return [np.concatenate([e[0][i] for e in minibatch]) for i in range(3)]
+
+    deque_time = timeit.timeit(sample_deque, number=options.samples) / options.samples
+    array_time = timeit.timeit(lambda: new_memory.sample(options.batch_size), number=options.samples) / options.samples
+    print('deque sample + stack: %.1f us/batch' % (deque_time * 1e6))
+    print('ReplayMemory.sample:  %.1f us/batch' % (array_time * 1e6))
@@ -0,0 +1,96 @@
+'''
+Measure the minibatch sample latency of the disk-backed replay memory (memory-mapped columns plus a RAM hot
+window) at 10k, 1M and 10M transitions, against the RAM memory where it fits. The memory is filled with
+add_batch, then sampled uniformly; major page faults per batch show how many reads reached the disk. The
+10M memory takes about 9 GB of disk.
+
+Run from the repository root with: python -m benchmarks.replay_storage_benchmark
+'''
+import optparse
+import os
+import random
+import resource
+import shutil
+import tempfile
+import timeit
+import numpy as np
+from replay_memory import ReplayMemory
+
+
+def random_states(n):
+    '''
+    Generate a batch of n states with the shapes and dtypes of stack_states.
+    '''
+    p = np.random.randint(0, 2, size=(n, 12, 12, 1)).astype(np.float32)
+    v = (np.random.uniform(size=(n, 12, 12, 1)) * p).astype(np.float32)
+    light = np.random.randint(0, 2, size=n)
+    l = np.stack([1 - light, light], axis=1).astype(np.float32).reshape(n, 2, 1)
+    return [p, v, l]
+
+
+def fill(memory, capacity, chunk):
+    '''
+    Fill the memory to capacity with add_batch and return the time it took.
+    '''
+    states, next_states = random_states(chunk), random_states(chunk)
+    actions = np.random.randint(0, 2, size=chunk)
+    rewards = np.random.uniform(-100, 0, size=chunk).astype(np.float32)
+    dones = np.zeros(chunk, dtype=bool)
+    start_time = timeit.default_timer()
+    for start in range(0, capacity, chunk):
+        n = min(chunk, capacity - start)
+        memory.add_batch([x[:n] for x in states], actions[:n], rewards[:n], [x[:n] for x in next_states],
+                         dones[:n])
+    return timeit.default_timer() - start_time
+
+
+def sample_latencies(memory, batch_size, samples):
+    '''
+    Time samples minibatches and return the latencies in seconds and the major page faults per batch.
+    '''
+    latencies = np.empty(samples)
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_majflt
+    for i in range(samples):
+        start_time = timeit.default_timer()
+        memory.sample(batch_size)
+        latencies[i] = timeit.default_timer() - start_time
+    return latencies, (resource.getrusage(resource.RUSAGE_SELF).ru_majflt - faults) / samples
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--capacities', default='10000,1000000,10000000', help='comma separated capacities')
+    parser.add_option('--hot-window', type='int', default=100000)
+    parser.add_option('--batch-size', type='int', default=32)
+    parser.add_option('--samples', type='int', default=2000)
+    parser.add_option('--chunk', type='int', default=65536, help='transitions per add_batch while filling')
+    parser.add_option('--max-ram-capacity', type='int', default=1000000,
+                      help='largest capacity also measured with the RAM memory')
+    parser.add_option('--directory', default=None, help='directory of the memory files, a temporary one by default')
+    options, args = parser.parse_args()
+
+    random.seed(0)
+    np.random.seed(0)
+    results = []
+    for capacity in [int(n) for n in options.capacities.split(',')]:
+        memories = [('disk', True)] + ([('ram', False)] if capacity <= options.max_ram_capacity else [])
+        for kind, disk in memories:
+            directory = tempfile.mkdtemp(dir=options.directory) if disk else None
+            try:
+                memory = ReplayMemory(capacity, directory=directory, hot_window=options.hot_window)
+                fill_time = fill(memory, capacity, options.chunk)
+                memory.sample(options.batch_size)   # warm up
+                latencies, faults = sample_latencies(memory, options.batch_size, options.samples)
+                ram = memory.hot_nbytes() if disk else memory.nbytes()
+                results.append((capacity, kind, fill_time, memory.nbytes(), ram, latencies, faults))
+                del memory
+            finally:
+                if directory is not None:
+                    shutil.rmtree(directory)
+
+    print('%10s %5s %9s %10s %9s %9s %9s %9s %10s' % ('capacity', 'kind', 'fill s', 'columns', 'RAM', 'p50 us',
+                                                      'p99 us', 'mean us', 'majflt/bt'))
+    for capacity, kind, fill_time, nbytes, ram, latencies, faults in results:
+        print('%10d %5s %9.1f %8.0fMB %7.0fMB %9.0f %9.0f %9.0f %10.1f'
+              % (capacity, kind, fill_time, nbytes / 2 ** 20, ram / 2 ** 20, np.percentile(latencies, 50) * 1e6,
+                 np.percentile(latencies, 99) * 1e6, latencies.mean() * 1e6, faults))
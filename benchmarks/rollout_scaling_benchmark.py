@@ -0,0 +1,31 @@
+'''
+Measure environment steps per second of parallel training against the number of rollout workers.
+Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.rollout_scaling_benchmark
+'''
+import optparse
+import os
+from dqn_agent import DQNAgent
+from rollout_workers import train_parallel
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=600, help='simulation steps per episode')
+    parser.add_option('--workers', default='1,2,4', help='comma separated worker counts')
+    options, args = parser.parse_args()
+
+    agent_params = dict(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                        memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+    results = []
+    for workers in [int(n) for n in options.workers.split(',')]:
+        agent = DQNAgent(**agent_params)
+        # one episode per worker so every run does the same work per worker
+        steps_per_second = train_parallel(agent, agent_params, workers, options.steps, workers)
+        results.append((workers, steps_per_second))
+
+    print('cores: %d' % os.cpu_count())
+    print('%8s %16s %8s' % ('workers', 'env steps/sec', 'scaling'))
+    for workers, steps_per_second in results:
+        print('%8d %16.1f %7.2fx' % (workers, steps_per_second, steps_per_second / results[0][1]))
@@ -0,0 +1,29 @@
+'''
+Compare route file generation time of the original per-second generator, the vectorized generator
+and a cache hit, for a one hour and a 24 hour horizon.
+
+Run from the repository root with: python -m benchmarks.route_generation_benchmark
+'''
+import optparse
+import os
+import tempfile
+import timeit
+from intersection import TrafficGenerator
+from benchmarks.legacy import legacy_generate_routefile
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        routes_file = os.path.join(tmp_dir, 'routes.rou.xml')
+        print('%10s %12s %14s %12s %8s' % ('horizon', 'legacy s', 'vectorized s', 'cached s', 'speedup'))
+        for horizon in [3600, 24 * 3600]:
+            traffic_gen = TrafficGenerator(horizon, cache_dir=os.path.join(tmp_dir, 'cache'), routes_file=routes_file)
+            legacy_time = timeit.timeit(lambda: legacy_generate_routefile(horizon, options.seed, routes_file), number=1)
+            vectorized_time = timeit.timeit(lambda: traffic_gen.generate_routefile(options.seed), number=1)
+            cached_time = timeit.timeit(lambda: traffic_gen.generate_routefile(options.seed), number=1)
+            print('%10d %12.3f %14.3f %12.4f %7.1fx' % (horizon, legacy_time, vectorized_time, cached_time,
+                                                        legacy_time / vectorized_time))
@@ -0,0 +1,62 @@
+'''
+Compare StayingTimeTracker against the original staying time bookkeeping on a synthetic episode
+where vehicles arrive, queue for a while and leave, without SUMO.
+
+Run from the repository root with: python -m benchmarks.staying_time_benchmark
+'''
+import optparse
+import sys
+import timeit
+import numpy as np
+from staying_time_tracker import StayingTimeTracker
+from benchmarks.legacy import LegacyStayingTimes
+
+
+def synthetic_episode(steps, arrival_rate, mean_stay):
+    '''
+    Return the list of vehicle IDs on the roads at every step.
+    '''
+    arrivals = np.random.poisson(arrival_rate, size=steps)
+    on_roads = {}   # vehID -> departure step
+    episode = []
+    count = 0
+    for step in range(steps):
+        for i in range(arrivals[step]):
+            on_roads['veh_%i' % count] = step + 1 + np.random.geometric(1. / mean_stay)
+            count += 1
+        on_roads = {vehID: leave for vehID, leave in on_roads.items() if leave > step}
+        episode.append(list(on_roads))
+    return episode
+
+
+def run(episode, update, read, decision_interval):
+    for step, vehicles in enumerate(episode):
+        update(vehicles)
+        if step % decision_interval == 0:
+            read(vehicles)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600)
+    parser.add_option('--decision-interval', type='int', default=10)
+    options, args = parser.parse_args()
+
+    np.random.seed(0)
+    print('%14s %10s %12s %12s %8s %14s %14s' % ('arrivals/step', 'vehicles', 'legacy ms', 'tracker ms', 'speedup',
+                                                  'legacy entries', 'tracker entries'))
+    for arrival_rate in [0.5, 2, 8]:
+        episode = synthetic_episode(options.steps, arrival_rate, mean_stay=40)
+
+        legacy = LegacyStayingTimes()
+        tracker = StayingTimeTracker()
+        legacy_time = timeit.timeit(lambda: run(episode, legacy.update, legacy.cumultative_staying_time,
+                                                options.decision_interval), number=1)
+        tracker_time = timeit.timeit(lambda: run(episode, tracker.update, lambda vehicles: tracker.cumultative_staying_time(),
+                                                 options.decision_interval), number=1)
+        if legacy.sum_of_staying_times() != tracker.sum_of_staying_times():
+            sys.exit('sums of staying times differ: %d != %d' % (legacy.sum_of_staying_times(), tracker.sum_of_staying_times()))
+
+        print('%14.1f %10d %12.1f %12.1f %7.1fx %14d %14d' % (arrival_rate, np.mean([len(v) for v in episode]),
+                                                             legacy_time * 1e3, tracker_time * 1e3, legacy_time / tracker_time,
+                                                             len(legacy._staying_times), len(tracker._entry_steps) + len(tracker._departed)))
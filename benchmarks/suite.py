@@ -0,0 +1,138 @@
+'''
+Offline benchmark suite for regression tracking. Runs the observation, staying time, route generation
+and agent code paths against the deterministic TraCI stand-in of benchmarks/mock_traci.py, so it needs
+neither SUMO nor a network connection, and reports ops/sec and the peak memory allocated by each
+operation as JSON.
+
+Run from the repository root with: python -m benchmarks.suite [--output results.json]
+'''
+import json
+import optparse
+import os
+import platform
+import resource
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import numpy as np
+import backend
+from benchmarks import mock_traci
+from dqn_agent import DQNAgent
+from intersection import TrafficGenerator
+from traffic_signal_env import create_int1
+
+MOCK_CMD = ['sumo', '-c', os.path.join('config', 'run.sumocfg')]
+
+
+def measure(name, params, operation, setup=None, min_time=0.5, memory_ops=20):
+    '''
+    Time the operation, running setup untimed before every call, until min_time seconds were spent in it.
+    Then trace memory over memory_ops calls and report the most memory allocated during one call.
+    '''
+    # the first call may build caches or trace functions
+    if setup is not None:
+        setup()
+    operation()
+
+    ops = 0
+    elapsed = 0.0
+    while elapsed < min_time:
+        if setup is not None:
+            setup()
+        start_time = timeit.default_timer()
+        operation()
+        elapsed += timeit.default_timer() - start_time
+        ops += 1
+
+    peak = 0
+    tracemalloc.start()
+    for i in range(memory_ops):
+        if setup is not None:
+            setup()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        operation()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    result = dict(name=name, params=params, ops=ops, seconds=elapsed, ops_per_sec=ops / elapsed, peak_memory_bytes=peak)
+    print('%-40s %-28s %14.1f ops/sec %12d B' % (name, json.dumps(params), result['ops_per_sec'], peak), file=sys.stderr)
+    return result
+
+
+def intersection_benchmarks(agent, vehicles_per_lane, options):
+    '''
+    Benchmark the intersection and the agent with the given number of vehicles on every lane.
+    '''
+    params = dict(vehicles_per_lane=vehicles_per_lane)
+    mock_traci.configure(vehicles_per_lane=vehicles_per_lane, seed=options.seed)
+    backend.start(MOCK_CMD)
+    int1 = create_int1()
+    int1.subscribe()
+    int1.reset_staying_time_info()
+
+    def step_and_update():
+        backend.simulationStep()
+        int1.update_staying_times()
+
+    results = [
+        measure('Intersection.get_state', params, int1.get_state, backend.simulationStep, options.min_time, options.memory_ops),
+        measure('Intersection.update_staying_times', params, int1.update_staying_times, backend.simulationStep,
+                options.min_time, options.memory_ops),
+        measure('Intersection.cumultative_staying_time', params, int1.cumultative_staying_time, step_and_update,
+                options.min_time, options.memory_ops),
+    ]
+
+    # states of this density for the agent, with every decision taken by the network
+    states = []
+    for i in range(64):
+        for j in range(10):
+            step_and_update()
+        states.append(int1.get_state())
+    backend.close()
+
+    decisions = iter(range(sys.maxsize))
+    results.append(measure('DQNAgent.choose_action', params,
+                           lambda: agent.choose_action(states[next(decisions) % len(states)]), None, options.min_time, options.memory_ops))
+    for i in range(len(states) - 1):
+        agent.add_experience(states[i], i % 2, -float(i), states[i + 1], False)
+    results.append(measure('DQNAgent.replay_experience', params, agent.replay_experience, None, options.min_time, options.memory_ops))
+    return results
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--densities', default='1,4,12', help='comma separated vehicles per lane')
+    parser.add_option('--min-time', type='float', default=0.5, help='seconds to time every benchmark for')
+    parser.add_option('--memory-ops', type='int', default=20, help='calls to trace the peak memory of')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--output', help='write the JSON results to this file instead of stdout')
+    options, args = parser.parse_args()
+
+    backend.register_backend('mock', 'benchmarks.mock_traci')
+    backend.select_backend('mock')
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        traffic_gen = TrafficGenerator(3600, cache_dir=None, routes_file=os.path.join(tmp_dir, 'routes.rou.xml'))
+        seeds = iter(range(sys.maxsize))
+        results.append(measure('TrafficGenerator.generate_routefile', dict(time_steps=3600),
+                               lambda: traffic_gen.generate_routefile(next(seeds)), None, options.min_time, options.memory_ops))
+
+    for vehicles_per_lane in [int(n) for n in options.densities.split(',')]:
+        # a new agent per density so the replay memory only holds transitions of that density
+        agent = DQNAgent(discount_rate=0.95, exploration_rate=0.0, learning_rate=0.0002,
+                         memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+        results += intersection_benchmarks(agent, vehicles_per_lane, options)
+
+    report = dict(
+        environment=dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                         cpus=os.cpu_count(), backend='mock'),
+        max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        benchmarks=results)
+    if options.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2)
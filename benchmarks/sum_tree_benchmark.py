@@ -0,0 +1,43 @@
+'''
+Show that prioritized sampling and priority updates stay flat as the replay capacity grows,
+compared with sampling from the full probability vector with np.random.choice.
+
+Run from the repository root with: python -m benchmarks.sum_tree_benchmark
+'''
+import optparse
+import timeit
+import numpy as np
+from replay_memory import SumTree
+
+
+def time_per_call(function, repeats):
+    function()
+    return timeit.timeit(function, number=repeats) / repeats * 1e6
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--batch-size', type='int', default=32)
+    parser.add_option('--repeats', type='int', default=200)
+    options, args = parser.parse_args()
+
+    np.random.seed(0)
+    k = options.batch_size
+    print('%10s %16s %16s %20s' % ('capacity', 'tree sample us', 'tree update us', 'np.random.choice us'))
+    for capacity in [1000, 10000, 100000, 1000000]:
+        priorities = np.random.uniform(0.01, 10, size=capacity)
+        tree = SumTree(capacity)
+        tree.update(np.arange(capacity), priorities)
+
+        def sample():
+            values = (np.arange(k) + np.random.uniform(size=k)) * tree.total() / k
+            return tree.find(values)
+
+        def update():
+            tree.update(np.random.randint(0, capacity, size=k), np.random.uniform(0.01, 10, size=k))
+
+        def choice():
+            return np.random.choice(capacity, size=k, p=priorities / priorities.sum())
+
+        print('%10d %16.1f %16.1f %20.1f' % (capacity, time_per_call(sample, options.repeats),
+                                             time_per_call(update, options.repeats), time_per_call(choice, 20)))
@@ -0,0 +1,75 @@
+'''
+Compare the cost of a target network update of TargetNetworkSync (in-place soft and hard updates) with
+the original get_weights/set_weights soft update and check that the soft updates agree. Then train for
+a number of steps in each mode and report the update counts and times from the counter and timing hook.
+
+Run from the repository root with: python -m benchmarks.target_sync_benchmark
+'''
+import optparse
+import timeit
+import numpy as np
+from benchmarks.legacy import legacy_soft_update_target_network
+from dqn_agent import DQNAgent
+
+
+def make_agent(**kwargs):
+    '''
+    Return an agent with the parameters of main.py.
+    '''
+    return DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                    memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001, **kwargs)
+
+
+def time_updates(update, repeats):
+    '''
+    Return the mean wall time of an update after a warm up call.
+    '''
+    update()
+    start_time = timeit.default_timer()
+    for i in range(repeats):
+        update()
+    return (timeit.default_timer() - start_time) / repeats
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--repeats', type='int', default=200)
+    parser.add_option('--train-steps', type='int', default=300)
+    parser.add_option('--hard-update-interval', type='int', default=100)
+    options, args = parser.parse_args()
+
+    # move the online weights away from the target so the updates do real work
+    agent = make_agent()
+    agent._model.set_weights([w + 0.1 for w in agent._model.get_weights()])
+    sync = agent.target_sync()
+    legacy = time_updates(lambda: legacy_soft_update_target_network(agent), options.repeats)
+    soft = time_updates(sync.soft_update, options.repeats)
+    hard = time_updates(sync._hard_update, options.repeats)
+
+    expected_agent = make_agent()
+    expected_agent._model.set_weights(agent._model.get_weights())
+    expected_agent._target_model.set_weights([w - 0.1 for w in agent._model.get_weights()])
+    agent._target_model.set_weights(expected_agent._target_model.get_weights())
+    for i in range(10):
+        legacy_soft_update_target_network(expected_agent)
+        sync.soft_update()
+    difference = max(np.abs(a - b).max() for a, b in zip(agent._target_model.get_weights(), expected_agent._target_model.get_weights()))
+
+    print('%26s %16s %10s' % ('update', 'us per update', 'speedup'))
+    for name, seconds in [('get/set_weights soft', legacy), ('in-place soft', soft), ('in-place hard', hard)]:
+        print('%26s %16.1f %9.2fx' % (name, seconds * 1e6, legacy / seconds))
+    print('max abs difference after 10 soft updates: %.2e' % difference)
+
+    rng = np.random.default_rng(0)
+    print('%8s %14s %10s %18s %16s' % ('mode', 'train steps', 'updates', 'total update ms', 'hook calls'))
+    for mode in ['soft', 'hard']:
+        agent = make_agent(target_sync=mode, hard_update_interval=options.hard_update_interval)
+        hook_calls = []
+        agent.target_sync().set_timing_hook(lambda mode, seconds: hook_calls.append(seconds))
+        for i in range(options.train_steps + agent._batch_size - 1):
+            state = [(rng.random((1, 12, 12, 1)) < 0.2).astype(np.float32), rng.random((1, 12, 12, 1)).astype(np.float32),
+                     np.array([[[0], [1]]], dtype=np.float32)]
+            agent.add_experience(state, i % 2, -1.0, state, False)
+            agent.replay_experience()
+        sync = agent.target_sync()
+        print('%8s %14d %10d %18.1f %16d' % (mode, sync.steps(), sync.updates(), sync.total_time() * 1e3, len(hook_calls)))
@@ -0,0 +1,89 @@
+'''
+Record a SUMO episode with TraceRecorder and replay it with the replay backend: compare the steps per
+second of observing intersection one live and from the trace, check that the replayed states and sums of
+staying times are identical, and report the trace size and the time to scan a whole trace column through
+the memory map. Needs SUMO and SUMO_HOME to record.
+
+Run from the repository root with: python -m benchmarks.trace_replay_benchmark
+'''
+import optparse
+import os
+import tempfile
+import timeit
+import numpy as np
+import backend
+import replay_backend
+from episode_trace import EpisodeTrace, TraceRecorder
+from intersection import TrafficGenerator, set_sumo
+import traffic_signal_env as env
+
+
+def observe_episode(steps, recorder=None):
+    '''
+    Observe intersection one under the fixed-time programs of the running simulation, every 10 steps as the
+    training loop does. Returns the wall time, the states and the sum of staying times.
+    '''
+    int1 = env.create_int1()
+    int1.subscribe()
+    int1.reset_staying_time_info()
+    if recorder is not None:
+        recorder.start()
+    states = []
+    start_time = timeit.default_timer()
+    for step in range(steps):
+        if step % 10 == 0:
+            states.append(int1.get_state())
+        backend.simulationStep()
+        int1.update_staying_times()
+    elapsed = timeit.default_timer() - start_time
+    if recorder is not None:
+        recorder.stop()
+    return elapsed, states, int1.sum_of_staying_times()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--backend', default='traci', help='backend to record with')
+    options, args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        routes_file = os.path.join(tmp_dir, 'routes.rou.xml')
+        trace_dir = os.path.join(tmp_dir, 'trace')
+        TrafficGenerator(options.steps, cache_dir=None, routes_file=routes_file).generate_routefile(options.seed)
+        sumo_cmd = set_sumo('run.sumocfg', options.steps, nogui=True, backend_name=options.backend)
+        sumo_cmd += ['--route-files', routes_file, '--no-warnings', 'true']
+
+        results = []
+        backend.start(sumo_cmd, label='benchmark')
+        results.append(('live ' + options.backend,) + observe_episode(options.steps))
+        backend.close()
+
+        backend.start(sumo_cmd, label='benchmark')
+        recorder = TraceRecorder(trace_dir, edges=[env.INT1_N, env.INT1_E, env.INT1_S, env.INT1_W, env.NE_HIGHWAY_ID,
+                                                   env.SE_HIGHWAY_ID],
+                                 tls_ids=[env.TLS_INT1_ID], junction_ids=[env.INT1_JUNCTION_ID])
+        results.append(('recording ' + options.backend,) + observe_episode(options.steps, recorder))
+        backend.close()
+
+        replay_backend.configure(trace_dir)
+        backend.select_backend('replay')
+        backend.start(sumo_cmd)
+        results.append(('replay',) + observe_episode(options.steps))
+        backend.close()
+
+        trace = EpisodeTrace(trace_dir)
+        start_time = timeit.default_timer()
+        mean_speed = np.mean(trace.column('speed'))
+        scan_time = timeit.default_timer() - start_time
+        print('trace: %d frames, %d vehicle rows, %.1f kB, %.1f bytes per frame, speed column scanned in %.2f ms'
+              % (trace.num_frames(), len(trace.column('vehicle')), trace.nbytes() / 1e3,
+                 trace.nbytes() / trace.num_frames(), scan_time * 1e3))
+
+    reference_states, reference_sum = results[0][2], results[0][3]
+    print('%16s %12s %8s %14s' % ('run', 'steps/sec', 'speedup', 'same results'))
+    for name, elapsed, states, sum_of_staying_times in results:
+        same = sum_of_staying_times == reference_sum and len(states) == len(reference_states) and \
+            all(np.array_equal(a, b) for state, reference in zip(states, reference_states) for a, b in zip(state, reference))
+        print('%16s %12.1f %7.2fx %14s' % (name, options.steps / elapsed, results[0][1] / elapsed, same))
@@ -0,0 +1,86 @@
+'''
+Run a SUMO episode under a fixed-time policy and count the TraCI round trips made to observe the
+intersection, with the original per-vehicle queries and with subscriptions. Also checks that both
+produce identical states and sums of staying times. Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.traci_round_trips
+'''
+import optparse
+import numpy as np
+import traci
+import traci.connection
+from intersection import Intersection, TrafficGenerator, set_sumo
+from traffic_signal_env import (INT1_E, INT1_JUNCTION_ID, INT1_N, INT1_S, INT1_W, INT_SPEED_LIMIT, NS_GREEN_PHASE,
+                  TLS_INT1_ID, WE_GREEN_PHASE)
+from benchmarks.legacy import LegacyStayingTimes, legacy_get_state, legacy_vehicles_in_roads
+
+
+class RoundTripCounter:
+    def __init__(self):
+        self.count = 0
+        self._send_exact = traci.connection.Connection._sendExact
+
+    def __enter__(self):
+        counter = self
+
+        def counting_send_exact(connection):
+            counter.count += 1
+            return counter._send_exact(connection)
+
+        traci.connection.Connection._sendExact = counting_send_exact
+        return self
+
+    def __exit__(self, *exc_info):
+        traci.connection.Connection._sendExact = self._send_exact
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    TrafficGenerator(options.steps).generate_routefile(options.seed)
+    traci.start(set_sumo('run.sumocfg', options.steps, nogui=True))
+    int1 = Intersection(n_id=INT1_N, e_id=INT1_E, s_id=INT1_S, w_id=INT1_W,
+                        tls_id=TLS_INT1_ID, junction_id=INT1_JUNCTION_ID,
+                        ns_green_phase=NS_GREEN_PHASE, we_green_phase=WE_GREEN_PHASE,
+                        road_length=500, cell_length=40, speed_limit=INT_SPEED_LIMIT)
+
+    legacy_trips = RoundTripCounter()
+    subscription_trips = RoundTripCounter()
+    with subscription_trips:
+        int1.subscribe()
+
+    legacy_staying_times = LegacyStayingTimes()
+    decisions = 0
+    mismatches = 0
+    step = 0
+    while step < options.steps:
+        with legacy_trips:
+            legacy_state = legacy_get_state(int1)
+        with subscription_trips:
+            state = int1.get_state()
+        with legacy_trips:
+            legacy_staying_times.cumultative_staying_time(legacy_vehicles_in_roads(int1))
+        int1.cumultative_staying_time()
+        mismatches += any(not np.array_equal(a.astype(np.float32), b) for a, b in zip(legacy_state, state))
+        decisions += 1
+
+        phase = NS_GREEN_PHASE if decisions % 2 else WE_GREEN_PHASE
+        for i in range(10):
+            traci.trafficlight.setPhase(TLS_INT1_ID, phase)
+            traci.simulationStep()
+            step += 1
+            with legacy_trips:
+                legacy_staying_times.update(legacy_vehicles_in_roads(int1))
+            with subscription_trips:
+                int1.update_staying_times()
+    traci.close()
+
+    print('decisions: %d, state mismatches: %d' % (decisions, mismatches))
+    print('sum of staying times: %d (per-vehicle queries), %d (subscriptions)' % (
+        legacy_staying_times.sum_of_staying_times(), int1.sum_of_staying_times()))
+    print('round trips with per-vehicle queries: %d' % legacy_trips.count)
+    print('round trips with subscriptions:       %d' % subscription_trips.count)
+    print('reduction: %.1fx' % (legacy_trips.count / max(subscription_trips.count, 1)))
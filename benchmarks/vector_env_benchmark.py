@@ -0,0 +1,46 @@
+'''
+Measure environment steps per second of VectorEnv against the number of environments, choosing the
+actions of all environments with one forward pass. Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.vector_env_benchmark
+'''
+import optparse
+import os
+import timeit
+from dqn_agent import DQNAgent
+from traffic_signal_env import VectorEnv
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--steps', type='int', default=3600, help='simulation steps per episode')
+    parser.add_option('--decisions', type='int', default=50, help='decisions to time per environment')
+    parser.add_option('--envs', default='1,2,4', help='comma separated environment counts')
+    parser.add_option('--backend', default='traci')
+    options, args = parser.parse_args()
+
+    agent = DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002,
+                     memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
+    results = []
+    for num_envs in [int(n) for n in options.envs.split(',')]:
+        envs = VectorEnv(num_envs, options.steps, backend_name=options.backend)
+        states = envs.reset()
+        agent.choose_actions(states)    # warm up the inference function for this batch size
+
+        env_steps = 0
+        inference_time = 0
+        start_time = timeit.default_timer()
+        for i in range(options.decisions):
+            inference_start = timeit.default_timer()
+            actions = agent.choose_actions(states)
+            inference_time += timeit.default_timer() - inference_start
+            states, rewards, dones, infos = envs.step(actions)
+            env_steps += sum(info['steps'] for info in infos)
+        elapsed = timeit.default_timer() - start_time
+        envs.close()
+        results.append((num_envs, env_steps / elapsed, inference_time / options.decisions * 1e3))
+
+    print('cores: %d' % os.cpu_count())
+    print('%6s %16s %8s %22s' % ('envs', 'env steps/sec', 'scaling', 'batched inference ms'))
+    for num_envs, steps_per_second, inference_ms in results:
+        print('%6d %16.1f %7.2fx %22.2f' % (num_envs, steps_per_second, steps_per_second / results[0][1], inference_ms))
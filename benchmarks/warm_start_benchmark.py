@@ -0,0 +1,114 @@
+'''
+Compare the per-episode startup cost of restarting SUMO and simulating the warm-up of every episode, as
+the training loop did, with a SimulationSession that keeps the sumo process and loads the next episode,
+first simulating and saving the warm-up of every route seed and then loading the saved states. Also checks
+that an episode started from a saved state observes the same intersection states as one warmed up by
+simulation. Needs SUMO and SUMO_HOME.
+
+Run from the repository root with: python -m benchmarks.warm_start_benchmark
+'''
+import optparse
+import os
+import shutil
+import tempfile
+import timeit
+import numpy as np
+import backend
+from intersection import TrafficGenerator, set_sumo
+from traffic_signal_env import create_int1
+from warm_start import SimulationSession
+
+
+def observe(steps):
+    '''
+    Observe intersection one every 10 steps of the running simulation and return the states.
+    '''
+    int1 = create_int1()
+    int1.subscribe()
+    states = []
+    for step in range(steps):
+        if step % 10 == 0:
+            states.append(int1.get_state())
+        backend.simulationStep()
+    return states
+
+
+def run_restarts(sumo_cmd, traffic_gen, routes_file, seeds, warm_up_steps, observe_steps):
+    '''
+    Start a sumo process per episode and simulate its warm-up. Returns the startup seconds per episode.
+    '''
+    startup_times = []
+    for seed in seeds:
+        traffic_gen.generate_routefile(seed)
+        start_time = timeit.default_timer()
+        backend.start(sumo_cmd + ['--route-files', routes_file], label='benchmark')
+        for step in range(warm_up_steps):
+            backend.simulationStep()
+        startup_times.append(timeit.default_timer() - start_time)
+        observe(observe_steps)
+        backend.close()
+    return startup_times
+
+
+def run_session(session, traffic_gen, routes_file, seeds, observe_steps):
+    '''
+    Start every episode with the session. Returns the startup seconds per episode, the warm-up steps
+    simulated and the observed states.
+    '''
+    startup_times = []
+    warm_up_steps = 0
+    states = []
+    for seed in seeds:
+        traffic_gen.generate_routefile(seed)
+        start_time = timeit.default_timer()
+        warm_up_steps += session.start(routes_file)
+        # a traci load is answered before sumo has loaded, the next call waits for it
+        backend.simulation.getTime()
+        startup_times.append(timeit.default_timer() - start_time)
+        states.append(observe(observe_steps))
+    return startup_times, warm_up_steps, states
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--backend', choices=['traci', 'libsumo'], default='traci')
+    parser.add_option('--episodes', type='int', default=10)
+    parser.add_option('--warm-up-steps', type='int', default=300)
+    parser.add_option('--observe-steps', type='int', default=200,
+                      help='steps of every episode observed after the warm-up, to compare the states')
+    options, args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        routes_file = os.path.join(work_dir, 'routes.rou.xml')
+        traffic_gen = TrafficGenerator(3600 + options.warm_up_steps, cache_dir=None, routes_file=routes_file)
+        sumo_cmd = set_sumo('run.sumocfg', 3600, nogui=True, backend_name=options.backend)
+        seeds = list(range(options.episodes))
+
+        restart_times = run_restarts(sumo_cmd, traffic_gen, routes_file, seeds, options.warm_up_steps,
+                                     options.observe_steps)
+        session = SimulationSession(sumo_cmd + ['--route-files', routes_file], label='benchmark',
+                                    warm_up_steps=options.warm_up_steps, cache_dir=os.path.join(work_dir, 'states'))
+        # the first pass simulates and saves the warm-up of every seed, the second loads the saved states
+        simulated_times, simulated_steps, simulated_states = run_session(session, traffic_gen, routes_file, seeds,
+                                                                         options.observe_steps)
+        cached_times, cached_steps, cached_states = run_session(session, traffic_gen, routes_file, seeds,
+                                                                options.observe_steps)
+        counts = session.counts()
+        session.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+    for seed, simulated, cached in zip(seeds, simulated_states, cached_states):
+        for step, (a, b) in enumerate(zip(simulated, cached)):
+            for x, y in zip(a, b):
+                assert np.allclose(x, y, atol=1e-5), 'seed %d: states differ after %d steps' % (seed, step * 10)
+    print('%d episodes, warm-up of %d steps, %d sumo starts and %d loads in the session, states match'
+          % (options.episodes, options.warm_up_steps, counts['starts'], counts['loads']))
+
+    print('%32s %12s %12s %22s' % ('', 'mean ms', 'median ms', 'warm-up steps/episode'))
+    for name, times, steps in [('restart + simulated warm-up', restart_times, options.warm_up_steps * len(seeds)),
+                               ('load + simulated warm-up', simulated_times, simulated_steps),
+                               ('load + saved state', cached_times, cached_steps)]:
+        # the first episode of a session starts the sumo process
+        print('%32s %12.1f %12.1f %22.0f' % (name, np.mean(times) * 1e3, np.median(times) * 1e3, steps / len(seeds)))
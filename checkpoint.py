@@ -0,0 +1,186 @@
+'''
+Checkpoints of the full training state: the weights of both models, the optimizer variables, the replay
+memory, the exploration rate, the target network step count, the Python and NumPy random states, the
+number of finished episodes and any extra values of the caller. The state is copied in the training
+thread and written by a background thread, so saving costs the simulation one copy of the arrays.
+
+A checkpoint is a directory ckpt-<episode> with meta.json, weights.npz and one .npy file per replay memory
+column in replay/, which restore reads memory-mapped. Of a disk-backed replay memory the training thread
+only copies the rows added since the previous checkpoint, and the writer thread writes its column files.
+A checkpoint is written under a temporary name and renamed once complete, so a crash never leaves a partial checkpoint behind, and only the last keep are kept.
+
+The checkpoints of a training run are kept apart from those of other runs in a subdirectory named after
+the run, and meta.json records the run, so neither the rotation nor a restore ever mixes two runs up.
+
+    checkpoints = CheckpointManager('checkpoints', keep=3, run_id=run_dir)
+    checkpoints.save(agent, episode)
+    meta = checkpoints.restore(agent)    # the latest checkpoint of the run
+    run_dir = latest_run('checkpoints')  # the run that saved the last checkpoint, e.g. to resume it
+'''
+import glob
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import numpy as np
+from replay_memory import DeferredColumnCopy
+
+# bump when the layout of the checkpoint files changes
+CHECKPOINT_FORMAT_VERSION = 3
+
+_WEIGHT_GROUPS = ['model_weights', 'target_model_weights', 'optimizer']
+
+
+def _run_directory(directory, run_id):
+    '''
+    Return the directory the checkpoints of a run are kept in.
+    '''
+    return os.path.join(directory, os.path.basename(os.path.normpath(run_id)))
+
+
+def latest_run(directory):
+    '''
+    Return the run of the most recently saved checkpoint in directory, or None if there is none.
+    '''
+    meta_files = glob.glob(os.path.join(directory, '*', 'ckpt-*', 'meta.json'))
+    if not meta_files:
+        return None
+    with open(max(meta_files, key=os.path.getmtime)) as meta_file:
+        return json.load(meta_file).get('run_id')
+
+
+class CheckpointManager:
+    def __init__(self, directory, keep=3, run_id=None):
+        # with a run_id the checkpoints are those of that run, in its own subdirectory
+        self._run_id = run_id
+        self._directory = directory if run_id is None else _run_directory(directory, run_id)
+        self._keep = keep
+        # at most one checkpoint waits for the writer, bounding the memory held by copies
+        self._pending = queue.Queue(maxsize=1)
+        self._error = None
+        os.makedirs(self._directory, exist_ok=True)
+        for tmp_dir in glob.glob(os.path.join(self._directory, '.tmp-ckpt-*')):
+            # left behind by a crash while writing
+            shutil.rmtree(tmp_dir)
+        self._writer = threading.Thread(target=self._write_checkpoints, daemon=True)
+        self._writer.start()
+
+    def checkpoints(self):
+        '''
+        Return the paths of the complete checkpoints, oldest first.
+        '''
+        return sorted(path for path in glob.glob(os.path.join(self._directory, 'ckpt-*'))
+                      if os.path.exists(os.path.join(path, 'meta.json')))
+
+    def latest(self):
+        '''
+        Return the path of the latest complete checkpoint, or None if there is none.
+        '''
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, agent, episode, **extra):
+        '''
+        Copy the training state of the agent after episode episodes and the random states, and write them in
+        the background. extra holds JSON serializable values returned by restore. Waits if the previous
+        checkpoint is still being written.
+        '''
+        if self._error is not None:
+            raise self._error
+        tmp_dir = os.path.join(self._directory, '.tmp-ckpt-%06d' % episode)
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        python_state = random.getstate()
+        numpy_state = np.random.get_state()
+        meta = dict(version=CHECKPOINT_FORMAT_VERSION, run_id=self._run_id, episode=episode, extra=extra,
+                    python_random_state=[python_state[0], list(python_state[1]), python_state[2]],
+                    numpy_random_state=[numpy_state[0], numpy_state[2], numpy_state[3], numpy_state[4]])
+        state = agent.get_training_state(defer_replay=True)
+        self._pending.put((meta, numpy_state[1].copy(), state))
+
+    def _write_checkpoints(self):
+        # runs in the writer thread
+        while True:
+            meta, numpy_keys, state = self._pending.get()
+            try:
+                if self._error is None:
+                    self._write(meta, numpy_keys, state)
+            except Exception as error:
+                # raised by the next save or by wait; the thread keeps draining the queue so save never blocks
+                self._error = error
+            finally:
+                self._pending.task_done()
+
+    def _write(self, meta, numpy_keys, state):
+        '''
+        Write a checkpoint under a temporary name, rename it into place and remove the oldest checkpoints.
+        '''
+        name = 'ckpt-%06d' % meta['episode']
+        tmp_dir = os.path.join(self._directory, '.tmp-' + name)
+        weights = {'%s_%d' % (group, i): value for group in _WEIGHT_GROUPS for i, value in enumerate(state[group])}
+        np.savez(os.path.join(tmp_dir, 'weights.npz'), numpy_random_keys=numpy_keys, **weights)
+        os.makedirs(os.path.join(tmp_dir, 'replay'), exist_ok=True)
+        for column, value in state['replay_memory'].items():
+            path = os.path.join(tmp_dir, 'replay', column + '.npy')
+            if isinstance(value, DeferredColumnCopy):
+                value.save(path)
+            else:
+                np.save(path, value)
+        meta = dict(meta, exploration_rate=state['exploration_rate'], target_sync_steps=state['target_sync_steps'],
+                    weight_counts={group: len(state[group]) for group in _WEIGHT_GROUPS},
+                    replay_columns=list(state['replay_memory']))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+            meta_file.flush()
+            os.fsync(meta_file.fileno())
+
+        path = os.path.join(self._directory, name)
+        if os.path.exists(path):
+            # the same episode saved again, e.g. after a resume
+            shutil.rmtree(path)
+        os.rename(tmp_dir, path)
+        for old in self.checkpoints()[:-self._keep]:
+            shutil.rmtree(old)
+
+    def wait(self):
+        '''
+        Wait until the saved checkpoints are written. Raises the error of a failed write.
+        '''
+        self._pending.join()
+        if self._error is not None:
+            raise self._error
+
+    def restore(self, agent, path=None):
+        '''
+        Restore the training state of the agent and the random states from a checkpoint of the run, the latest
+        one by default. Returns its meta data: 'episode' is the number of finished episodes and 'extra' the extra
+        values passed to save.
+        '''
+        path = path or self.latest()
+        if path is None:
+            raise FileNotFoundError('no checkpoint in %s' % self._directory)
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        if meta['version'] != CHECKPOINT_FORMAT_VERSION:
+            raise ValueError('checkpoint format version %d, expected %d' % (meta['version'], CHECKPOINT_FORMAT_VERSION))
+        if meta['run_id'] != self._run_id:
+            raise ValueError('checkpoint %s is of run %s, not %s' % (path, meta['run_id'], self._run_id))
+
+        with np.load(os.path.join(path, 'weights.npz')) as weights:
+            state = {group: [weights['%s_%d' % (group, i)] for i in range(meta['weight_counts'][group])]
+                     for group in _WEIGHT_GROUPS}
+            numpy_keys = weights['numpy_random_keys']
+        state['replay_memory'] = {column: np.load(os.path.join(path, 'replay', column + '.npy'), mmap_mode='r')
+                                  for column in meta['replay_columns']}
+        state['exploration_rate'] = meta['exploration_rate']
+        state['target_sync_steps'] = meta['target_sync_steps']
+        agent.set_training_state(state)
+
+        version, internal_state, gauss = meta['python_random_state']
+        random.setstate((version, tuple(internal_state), gauss))
+        algorithm, position, has_gauss, cached_gaussian = meta['numpy_random_state']
+        np.random.set_state((algorithm, numpy_keys, position, has_gauss, cached_gaussian))
+        return meta
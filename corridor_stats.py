@@ -0,0 +1,195 @@
+'''
+Streaming statistics of the speeds at which vehicles enter KPI edges, such as the highways. Entries are
+detected from the vehicles on an edge in consecutive steps, so the state of an edge is the vehicles on it
+now, and the speeds go into a running mean and variance and a fixed-bin histogram for percentiles. The
+memory used does not grow with the length of the simulation.
+
+    highways = CorridorStats([NE_HIGHWAY_ID, SE_HIGHWAY_ID])
+    highways.subscribe()    # after every backend.start
+    highways.update()       # after every simulation step
+    highways.mean(), highways.edge_stats(NE_HIGHWAY_ID).percentile(90)
+'''
+import math
+import numpy as np
+import traci.constants as tc
+import backend
+
+# the speeds come from a context subscription of the edge, which also reports the vehicles this close to it
+# on other edges, so the vehicles are filtered by their edge
+CONTEXT_RANGE = 1.0
+
+
+class StreamingStats:
+    def __init__(self, max_value=50.0, bin_width=0.1):
+        # values from 0 to max_value in bins of bin_width, larger values are counted in the last bin
+        self._bin_width = bin_width
+        self._histogram = np.zeros(int(math.ceil(max_value / bin_width)), dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget all values.
+        '''
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0     # sum of squared differences from the mean, Welford's algorithm
+        self._min = math.inf
+        self._max = -math.inf
+        self._histogram[:] = 0
+
+    def add(self, value):
+        '''
+        Add a value in O(1).
+        '''
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        self._histogram[min(max(int(value / self._bin_width), 0), len(self._histogram) - 1)] += 1
+
+    def merge(self, other):
+        '''
+        Return the statistics of the values of both, which must have the same bins.
+        '''
+        merged = StreamingStats(len(self._histogram) * self._bin_width, self._bin_width)
+        merged._count = self._count + other._count
+        if merged._count:
+            delta = other._mean - self._mean
+            merged._mean = self._mean + delta * other._count / merged._count
+            merged._m2 = self._m2 + other._m2 + delta ** 2 * self._count * other._count / merged._count
+        merged._min = min(self._min, other._min)
+        merged._max = max(self._max, other._max)
+        merged._histogram[:] = self._histogram + other._histogram
+        return merged
+
+    def count(self):
+        '''
+        Return the number of values.
+        '''
+        return self._count
+
+    def mean(self):
+        '''
+        Return the mean, NaN without values.
+        '''
+        return self._mean if self._count else math.nan
+
+    def variance(self):
+        '''
+        Return the sample variance, NaN with fewer than two values.
+        '''
+        return self._m2 / (self._count - 1) if self._count > 1 else math.nan
+
+    def percentile(self, q):
+        '''
+        Return the q-th percentile, interpolated within its histogram bin and clamped to the smallest and
+        largest value, so it is within a bin width of the exact one. NaN without values.
+        '''
+        if not self._count:
+            return math.nan
+        cumulative = np.cumsum(self._histogram)
+        rank = q / 100 * self._count
+        i = min(int(np.searchsorted(cumulative, rank)), len(cumulative) - 1)
+        below = cumulative[i - 1] if i > 0 else 0
+        fraction = (rank - below) / self._histogram[i] if self._histogram[i] else 0.0
+        return float(min(max((i + fraction) * self._bin_width, self._min), self._max))
+
+    def summary(self):
+        '''
+        Return the count, mean, standard deviation, minimum, median, 90th percentile and maximum.
+        '''
+        return dict(count=self._count, mean=self.mean(), std=math.sqrt(self.variance()),
+                    min=self._min if self._count else math.nan, p50=self.percentile(50), p90=self.percentile(90),
+                    max=self._max if self._count else math.nan)
+
+
+class EdgeEntryStats:
+    def __init__(self, edge_id, stats=None):
+        self._edge_id = edge_id
+        self._stats = stats if stats is not None else StreamingStats()
+        self._vehicles = set()
+
+    def reset(self):
+        '''
+        Forget the vehicles on the edge and the statistics in preparation of a new episode.
+        '''
+        self._vehicles = set()
+        self._stats.reset()
+
+    def subscribe(self):
+        '''
+        Subscribe to the edges and speeds of the vehicles around the edge. Must be called once after each
+        backend.start.
+        '''
+        backend.edge.subscribeContext(self._edge_id, tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RANGE,
+                                      [tc.VAR_ROAD_ID, tc.VAR_SPEED])
+
+    def update(self):
+        '''
+        Record the speeds of the vehicles that entered the edge with the last simulation step, from the
+        subscription results the step returned.
+        '''
+        results = backend.edge.getContextSubscriptionResults(self._edge_id) or {}
+        vehicles = [vehID for vehID, variables in results.items() if variables[tc.VAR_ROAD_ID] == self._edge_id]
+        entered = [vehID for vehID in vehicles if vehID not in self._vehicles]
+        for vehID in entered:
+            self._stats.add(results[vehID][tc.VAR_SPEED])
+        if entered or len(vehicles) != len(self._vehicles):
+            # only the vehicles on the edge are kept, bounded by its length
+            self._vehicles = set(vehicles)
+
+    def stats(self):
+        '''
+        Return the statistics of the entry speeds.
+        '''
+        return self._stats
+
+
+class CorridorStats:
+    def __init__(self, edges):
+        self._edges = {edge: EdgeEntryStats(edge) for edge in edges}
+
+    def reset(self):
+        '''
+        Reset every edge in preparation of a new episode.
+        '''
+        for edge in self._edges.values():
+            edge.reset()
+
+    def subscribe(self):
+        '''
+        Subscribe to every edge. Must be called once after each backend.start.
+        '''
+        for edge in self._edges.values():
+            edge.subscribe()
+
+    def update(self):
+        '''
+        Record the entries of every edge after a simulation step.
+        '''
+        for edge in self._edges.values():
+            edge.update()
+
+    def edge_stats(self, edge):
+        '''
+        Return the statistics of the entry speeds of one edge.
+        '''
+        return self._edges[edge].stats()
+
+    def combined(self):
+        '''
+        Return the statistics of the entry speeds of all edges together.
+        '''
+        stats = [edge.stats() for edge in self._edges.values()]
+        combined = stats[0]
+        for edge_stats in stats[1:]:
+            combined = combined.merge(edge_stats)
+        return combined
+
+    def mean(self):
+        '''
+        Return the mean entry speed of all edges together, NaN if no vehicle entered any.
+        '''
+        return self.combined().mean()
@@ -2,25 +2,50 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'    # INFO and WARNING messages are not printed
 import numpy as np
 import random
-from collections import deque
+import tensorflow as tf
 from tensorflow import keras
 from keras.models import Model, clone_model
 from keras.layers import Input, Conv2D, Flatten, Dense, concatenate
 from keras.optimizers import RMSprop
+from numpy_forward import q_network_forward
+from replay_memory import ReplayMemory, PrioritizedReplayMemory
+from target_sync import TargetNetworkSync
 
+# [position, speed, light] inputs of the Q-network for any batch size
+STATE_SIGNATURE = [tf.TensorSpec((None, 12, 12, 1), tf.float32), tf.TensorSpec((None, 12, 12, 1), tf.float32),
+                   tf.TensorSpec((None, 2, 1), tf.float32)]
+
+# 'predict': Keras predict/predict_on_batch, 'compiled': a tf.function with STATE_SIGNATURE reading the model
+# variables, 'numpy': q_network_forward on snapshots of the weights taken after they last changed
+INFERENCE_PATHS = ('predict', 'compiled', 'numpy')
 
 class DQNAgent:
-    def __init__(self, discount_rate, exploration_rate, learning_rate, memory_capacity, action_size, batch_size, update_rate):
+    def __init__(self, discount_rate, exploration_rate, learning_rate, memory_capacity, action_size, batch_size, update_rate, prioritized_replay=False, inference='compiled',
+                 target_sync='soft', hard_update_interval=1000, replay_directory=None, replay_hot_window=100000):
         self._discount_rate = discount_rate
         self._exploration_rate = exploration_rate
         self._learning_rate = learning_rate
-        self._replay_memory = deque(maxlen=memory_capacity)
+        self._prioritized_replay = prioritized_replay
+        # a replay_directory keeps the replay memory in memory-mapped files there
+        if prioritized_replay:
+            self._replay_memory = PrioritizedReplayMemory(memory_capacity, directory=replay_directory,
+                                                          hot_window=replay_hot_window)
+        else:
+            self._replay_memory = ReplayMemory(memory_capacity, directory=replay_directory, hot_window=replay_hot_window)
         self._action_size = action_size
         self._batch_size = batch_size
         self._update_rate = update_rate
         self._model = self._build_model()
         self._target_model = clone_model(self._model)
         self._target_model.set_weights(self._model.get_weights())
+        self._target_sync = TargetNetworkSync(self._model, self._target_model, mode=target_sync,
+                                              update_rate=update_rate, hard_update_interval=hard_update_interval)
+        if inference not in INFERENCE_PATHS:
+            raise ValueError("unknown inference path '%s', expected one of %s" % (inference, INFERENCE_PATHS))
+        self._inference = inference
+        self._numpy_weights = [None, None]  # online and target weight snapshots of the numpy path
+        self._model_forward = self._compile_forward(self._model)
+        self._target_model_forward = self._compile_forward(self._target_model)
     
     def _build_model(self):
         '''
@@ -55,12 +80,44 @@ class DQNAgent:
         model.compile(optimizer=RMSprop(learning_rate=self._learning_rate), loss='mse')
 
         return model
+
+    @staticmethod
+    def _compile_forward(model):
+        '''
+        Compile the forward pass of a model for a fixed input signature. Calling it skips the data adapter
+        and callbacks that predict sets up on every call and is not retraced for new batch sizes. It reads
+        the model variables, so it stays in sync with training and weight updates.
+        '''
+        @tf.function(input_signature=STATE_SIGNATURE)
+        def forward(position, speed, light):
+            return model([position, speed, light], training=False)
+        return forward
+
+    def q_values(self, states, target=False):
+        '''
+        Return the action values of a batch of states from the online model or the target model.
+        '''
+        model = self._target_model if target else self._model
+        if self._inference == 'numpy':
+            if self._numpy_weights[target] is None:
+                self._numpy_weights[target] = model.get_weights()
+            return q_network_forward(self._numpy_weights[target], states)
+        if self._inference == 'compiled':
+            forward = self._target_model_forward if target else self._model_forward
+            return forward(*[np.asarray(x, dtype=np.float32) for x in states]).numpy()
+        return model.predict_on_batch(states)
     
     def add_experience(self, state, action, reward, next_state, done):
         '''
         Add an experience to the replay memory.
         '''
-        self._replay_memory.append((state, action, reward, next_state, done))
+        self._replay_memory.add(state, action, reward, next_state, done)
+
+    def mark_last_experience_terminal(self):
+        '''
+        Mark the last experience in the replay memory as the end of an episode.
+        '''
+        self._replay_memory.mark_last_terminal()
     
     def choose_action(self, state):
         '''
@@ -68,10 +125,24 @@ class DQNAgent:
         '''
         if np.random.rand() <= self._exploration_rate:
             return random.randrange(self._action_size)
-        action_values = self._model.predict(state, verbose=0)
+        if self._inference == 'predict':
+            action_values = self._model.predict(state, verbose=0)
+        else:
+            action_values = self.q_values(state)
         
         return np.argmax(action_values[0])
 
+    def choose_actions(self, states):
+        '''
+        Choose an action for each state of a batch with a single forward pass.
+        '''
+        action_values = self.q_values(states)
+        actions = np.argmax(action_values, axis=1)
+        explore = np.random.rand(len(actions)) <= self._exploration_rate
+        actions[explore] = np.random.randint(self._action_size, size=explore.sum())
+
+        return actions
+
     def replay_experience(self):
         '''
         Samples a mini-batch of experiences from the replay memory and use them to train the Q-network.
@@ -79,35 +150,99 @@ class DQNAgent:
         if len(self._replay_memory) < self._batch_size:
             return
         
-        minibatch = random.sample(self._replay_memory, self._batch_size)
-        for state, action, reward, next_state, done in minibatch:
-            target = reward
-            if not done:
-                target = reward + self._discount_rate * np.amax(self._target_model.predict(next_state, verbose=0)[0])
-            target_f = self._model.predict(state, verbose=0)
-            target_f[0][action] = target
-            self._model.fit(state, target_f, epochs=1, verbose=0)
-        self.soft_update_target_network()
+        weights = None
+        if self._prioritized_replay:
+            minibatch, indices, weights = self._replay_memory.sample_prioritized(self._batch_size)
+        else:
+            minibatch = self._replay_memory.sample(self._batch_size)
+        states, actions, rewards, next_states, dones = minibatch
+
+        # one forward pass of each network for the whole mini-batch
+        next_action_values = self.q_values(next_states, target=True)
+        targets = rewards + self._discount_rate * np.amax(next_action_values, axis=1) * ~dones
+        target_f = self.q_values(states)
+        if self._prioritized_replay:
+            td_errors = targets - target_f[np.arange(self._batch_size), actions]
+            self._replay_memory.update_priorities(indices, td_errors)
+        target_f[np.arange(self._batch_size), actions] = targets
+
+        # one gradient step on the (importance-sampling weighted) mean loss over the mini-batch
+        self._model.train_on_batch(states, target_f, sample_weight=weights)
+        self._numpy_weights[False] = None
+
+        # exactly one target network step per training step
+        if self._target_sync.step():
+            self._numpy_weights[True] = None
 
     def soft_update_target_network(self):
         '''
         Performs a soft update on the weights of the target model.
         '''
-        model_weights = self._model.get_weights()
-        target_model_weights = self._target_model.get_weights()
-        self._target_model.set_weights([self._update_rate * w + (1 - self._update_rate) * tw for w, tw in zip(model_weights, target_model_weights)])
+        self._target_sync.soft_update()
+        self._numpy_weights[True] = None
+
+    def target_sync(self):
+        '''
+        Return the target network synchronisation, which counts and times the target updates.
+        '''
+        return self._target_sync
+
+    def get_training_state(self, defer_replay=False):
+        '''
+        Return copies of everything training depends on: the weights of both models, the optimizer
+        variables, the replay memory, the exploration rate and the target network step count. The columns
+        of a disk-backed replay memory are copied when saved if defer_replay, see ReplayMemory.snapshot.
+        '''
+        return dict(model_weights=self._model.get_weights(), target_model_weights=self._target_model.get_weights(),
+                    optimizer=[variable.numpy() for variable in self._model.optimizer.variables],
+                    replay_memory=self._replay_memory.snapshot(defer_replay), exploration_rate=self._exploration_rate,
+                    target_sync_steps=self._target_sync.steps())
+
+    def set_training_state(self, state):
+        '''
+        Restore a state returned by get_training_state of an agent with the same parameters.
+        '''
+        self._model.set_weights(state['model_weights'])
+        self._target_model.set_weights(state['target_model_weights'])
+        optimizer = self._model.optimizer
+        if not optimizer.built and len(state['optimizer']) > len(optimizer.variables):
+            # the slot variables are created by the first training step
+            optimizer.build(self._model.trainable_variables)
+        if len(state['optimizer']) != len(optimizer.variables):
+            raise ValueError('%d optimizer variables, expected %d' % (len(state['optimizer']), len(optimizer.variables)))
+        for variable, value in zip(optimizer.variables, state['optimizer']):
+            variable.assign(value)
+        self._replay_memory.restore(state['replay_memory'])
+        self._exploration_rate = state['exploration_rate']
+        self._target_sync.set_steps(state['target_sync_steps'])
+        self._numpy_weights = [None, None]
+
+    def get_model_weights(self):
+        '''
+        Get the current weights of the model.
+        '''
+        return self._model.get_weights()
+
+    def set_model_weights(self, weights):
+        '''
+        Set the weights of the model, e.g. to ones broadcast by a learner.
+        '''
+        self._model.set_weights(weights)
+        self._numpy_weights[False] = None
 
     def load_model_weights(self, model_file_name):
         '''
         Load the weights for the model.
         '''
         self._model.load_weights(model_file_name)
+        self._numpy_weights[False] = None
     
     def load_target_model_weights(self, target_model_file_name):
         '''
         Load the weights for the target model.
         '''
         self._target_model.load_weights(target_model_file_name)
+        self._numpy_weights[True] = None
 
     def save_model_weigths(self, model_file_name):
         '''
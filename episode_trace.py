@@ -0,0 +1,232 @@
+'''
+Record the vehicle observations, traffic signal phases and expected vehicle counts of a simulation into a
+columnar binary trace, and read traces back memory-mapped. replay_backend.py serves a trace through the
+TraCI API, so an episode can be replayed open loop without SUMO.
+
+A trace is a directory with meta.json and one raw column file per array. Frame 0 is the simulation when
+recording starts and frame i the simulation after step i. Vehicle rows are appended frame by frame, grouped
+by edge in the order of the trace edges; edge_offsets holds the first row of every edge of every frame.
+'''
+import json
+import optparse
+import os
+import numpy as np
+import traci.constants as tc
+import backend
+from intersection import VEHICLE_VARIABLES
+
+# bump when the layout of the trace files changes
+TRACE_FORMAT_VERSION = 1
+
+# one row per vehicle on a recorded edge per frame
+VEHICLE_COLUMNS = {'vehicle': np.uint32, 'lane': np.uint8, 'x': np.float64, 'y': np.float64, 'speed': np.float64}
+
+# one row per frame, of edges + 1, traffic lights or 1 entries
+FRAME_COLUMNS = {'edge_offsets': np.int64, 'phases': np.int16, 'expected': np.int32}
+
+
+class TraceRecorder:
+    def __init__(self, directory, edges, tls_ids, junction_ids, chunk_frames=256):
+        self._directory = directory
+        self._edges = list(edges)
+        self._tls_ids = list(tls_ids)
+        self._junction_ids = list(junction_ids)
+        self._chunk_frames = chunk_frames
+        self._files = {}
+        self._subscribed_vehicles = set()
+        self._vehicle_ids = []
+        self._vehicle_indices = {}
+        self._junctions = {}
+        self._frames = 0
+        self._rows = 0
+        self._buffers = {name: [] for name in list(VEHICLE_COLUMNS) + list(FRAME_COLUMNS)}
+        self._buffered_frames = 0
+
+    def start(self):
+        '''
+        Start recording the running simulation: record frame 0 now and a frame after every simulation step.
+        '''
+        os.makedirs(self._directory, exist_ok=True)
+        for name in list(VEHICLE_COLUMNS) + list(FRAME_COLUMNS):
+            self._files[name] = open(os.path.join(self._directory, name + '.bin'), 'wb')
+        self._junctions = {junction: list(backend.junction.getPosition(junction)) for junction in self._junction_ids}
+        for edge in self._edges:
+            backend.edge.subscribe(edge, [tc.LAST_STEP_VEHICLE_ID_LIST])
+        for tls in self._tls_ids:
+            backend.trafficlight.subscribe(tls, [tc.TL_CURRENT_PHASE])
+        self.record_frame()
+        backend.add_step_listener(self.record_frame)
+
+    def record_frame(self):
+        '''
+        Record the vehicles on the trace edges, the traffic signal phases and the expected vehicle count.
+        '''
+        vehicles, lanes, xs, ys, speeds = self._buffers['vehicle'], self._buffers['lane'], self._buffers['x'], \
+            self._buffers['y'], self._buffers['speed']
+        offsets = [self._rows + len(vehicles)]
+        for edge in self._edges:
+            for vehID in backend.edge.getSubscriptionResults(edge)[tc.LAST_STEP_VEHICLE_ID_LIST]:
+                if vehID not in self._subscribed_vehicles:
+                    backend.vehicle.subscribe(vehID, VEHICLE_VARIABLES)
+                    self._subscribed_vehicles.add(vehID)
+                if vehID not in self._vehicle_indices:
+                    self._vehicle_indices[vehID] = len(self._vehicle_ids)
+                    self._vehicle_ids.append(vehID)
+                variables = backend.vehicle.getSubscriptionResults(vehID)
+                vehicles.append(self._vehicle_indices[vehID])
+                lanes.append(variables[tc.VAR_LANE_INDEX])
+                xs.append(variables[tc.VAR_POSITION][0])
+                ys.append(variables[tc.VAR_POSITION][1])
+                speeds.append(variables[tc.VAR_SPEED])
+            offsets.append(self._rows + len(vehicles))
+        self._buffers['edge_offsets'].append(offsets)
+        self._buffers['phases'].append([backend.trafficlight.getSubscriptionResults(tls)[tc.TL_CURRENT_PHASE]
+                                        for tls in self._tls_ids])
+        self._buffers['expected'].append(backend.simulation.getMinExpectedNumber())
+
+        self._buffered_frames += 1
+        if self._buffered_frames >= self._chunk_frames:
+            self._flush()
+
+    def _flush(self):
+        '''
+        Append the buffered frames to the column files.
+        '''
+        for name, dtype in list(VEHICLE_COLUMNS.items()) + list(FRAME_COLUMNS.items()):
+            self._files[name].write(np.array(self._buffers[name], dtype=dtype).tobytes())
+        self._rows += len(self._buffers['vehicle'])
+        self._frames += self._buffered_frames
+        self._buffers = {name: [] for name in self._buffers}
+        self._buffered_frames = 0
+
+    def stop(self):
+        '''
+        Stop recording and write the trace index. Must be called before the simulation is closed.
+        '''
+        backend.remove_step_listener(self.record_frame)
+        self._flush()
+        for column_file in self._files.values():
+            column_file.close()
+        meta = dict(version=TRACE_FORMAT_VERSION, frames=self._frames, rows=self._rows, edges=self._edges,
+                    tls_ids=self._tls_ids, junctions=self._junctions, vehicles=self._vehicle_ids)
+        with open(os.path.join(self._directory, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+
+class EpisodeTrace:
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        if meta['version'] != TRACE_FORMAT_VERSION:
+            raise ValueError('trace format version %d, expected %d' % (meta['version'], TRACE_FORMAT_VERSION))
+        self._frames = meta['frames']
+        self._edges = meta['edges']
+        self._edge_indices = {edge: i for i, edge in enumerate(self._edges)}
+        self._tls_indices = {tls: i for i, tls in enumerate(meta['tls_ids'])}
+        self._junctions = {junction: tuple(position) for junction, position in meta['junctions'].items()}
+        self._vehicle_ids = meta['vehicles']
+
+        shapes = {'edge_offsets': (self._frames, len(self._edges) + 1), 'phases': (self._frames, len(self._tls_indices)),
+                  'expected': (self._frames,)}
+        shapes.update({name: (meta['rows'],) for name in VEHICLE_COLUMNS})
+        self._columns = {}
+        for name, dtype in list(VEHICLE_COLUMNS.items()) + list(FRAME_COLUMNS.items()):
+            if np.prod(shapes[name]) == 0:
+                # an empty file cannot be memory-mapped
+                self._columns[name] = np.zeros(shapes[name], dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(os.path.join(directory, name + '.bin'), dtype=dtype, mode='r',
+                                                shape=shapes[name])
+
+    def num_frames(self):
+        '''
+        Return the number of recorded frames.
+        '''
+        return self._frames
+
+    def column(self, name):
+        '''
+        Return a memory-mapped column of VEHICLE_COLUMNS or FRAME_COLUMNS.
+        '''
+        return self._columns[name]
+
+    def edge_rows(self, frame, edge):
+        '''
+        Return the rows of the vehicles on an edge in a frame as a slice.
+        '''
+        i = self._edge_indices[edge]
+        offsets = self._columns['edge_offsets'][frame]
+        return slice(int(offsets[i]), int(offsets[i + 1]))
+
+    def frame_rows(self, frame):
+        '''
+        Return the rows of all vehicles of a frame as a slice.
+        '''
+        offsets = self._columns['edge_offsets'][frame]
+        return slice(int(offsets[0]), int(offsets[-1]))
+
+    def vehicle_id(self, index):
+        '''
+        Return the vehicle ID of a value of the vehicle column.
+        '''
+        return self._vehicle_ids[index]
+
+    def phase(self, frame, tls):
+        '''
+        Return the phase of a traffic signal in a frame.
+        '''
+        return int(self._columns['phases'][frame, self._tls_indices[tls]])
+
+    def expected(self, frame):
+        '''
+        Return the number of vehicles expected in the simulation in a frame.
+        '''
+        return int(self._columns['expected'][frame])
+
+    def junction_position(self, junction):
+        '''
+        Return the position of a recorded junction.
+        '''
+        return self._junctions[junction]
+
+    def nbytes(self):
+        '''
+        Return the size of the column files.
+        '''
+        return sum(column.nbytes for column in self._columns.values())
+
+
+def get_options():
+    '''
+    Parse the command line options.
+    '''
+    opt_parser = optparse.OptionParser(usage='%prog [options] trace_directory')
+    opt_parser.add_option('--seed', type='int', default=0, help='seed of the generated routes')
+    opt_parser.add_option('--steps', type='int', default=3600, help='simulation steps to record')
+    opt_parser.add_option('--backend', choices=['traci', 'libsumo'], default='traci')
+    options, args = opt_parser.parse_args()
+    if len(args) != 1:
+        opt_parser.error('expected the trace directory')
+    return options, args[0]
+
+
+if __name__ == '__main__':
+    # record an episode of both intersections and the highways under the fixed-time signal programs
+    from intersection import TrafficGenerator, set_sumo
+    import traffic_signal_env as env
+
+    options, directory = get_options()
+    TrafficGenerator(options.steps).generate_routefile(options.seed)
+    backend.start(set_sumo('run.sumocfg', options.steps, nogui=True, backend_name=options.backend))
+    recorder = TraceRecorder(directory,
+                             edges=[env.INT1_N, env.INT1_E, env.INT1_S, env.INT1_W, env.INT2_N, env.INT2_E, env.INT2_S,
+                                    env.INT2_W, env.NE_HIGHWAY_ID, env.SE_HIGHWAY_ID],
+                             tls_ids=[env.TLS_INT1_ID, env.TLS_INT2_ID],
+                             junction_ids=[env.INT1_JUNCTION_ID, env.INT2_JUNCTION_ID])
+    recorder.start()
+    step = 0
+    while backend.simulation.getMinExpectedNumber() > 0 and step < options.steps:
+        backend.simulationStep()
+        step += 1
+    recorder.stop()
+    backend.close()
@@ -0,0 +1,284 @@
+'''
+Evaluate the greedy policy of saved model weights and the baselines of baselines.py on many route seeds,
+one episode per policy and seed, in parallel across a pool of processes that each run a SUMO instance.
+The sum of staying times and average highway speed of every episode are cached in the cache directory,
+keyed by the policy, the weights for the agent, the seed and the episode settings, so a rerun only
+evaluates the seeds and policies that are new. Prints the mean of every policy with a bootstrap
+confidence interval, and the difference to a reference policy on the same seeds.
+
+    python evaluation.py --policies dqn,fixed-time,actuated --seeds 1000-1029 --workers 4
+
+The seeds default to ones the training episodes (seeds 0 to 19) never see.
+'''
+import hashlib
+import json
+import math
+import multiprocessing
+import multiprocessing.util
+import optparse
+import os
+import numpy as np
+from baselines import BASELINES
+from intersection import ROUTE_GENERATOR_VERSION
+
+# bump when the evaluation episodes change for the same policy, seed and settings
+EVALUATION_VERSION = 1
+
+RESULT_KEYS = ['sum_of_staying_times', 'average_highway_speed']
+
+# the agent parameters of main.py that shape the network
+AGENT_PARAMS = dict(discount_rate=0.95, exploration_rate=0.0, learning_rate=0.0002, memory_capacity=1, action_size=2,
+                    batch_size=32, update_rate=0.001, inference='numpy')
+
+_worker_settings = None
+_worker_env = None
+_worker_policies = {}
+
+
+def parse_seeds(text):
+    '''
+    Parse comma separated seeds and inclusive ranges, e.g. '1000-1009,2000'.
+    '''
+    seeds = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            seeds += range(int(first), int(last) + 1)
+        elif part:
+            seeds.append(int(part))
+    return seeds
+
+
+def file_hash(path):
+    '''
+    Return the SHA-1 of the contents of a file.
+    '''
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class EvaluationCache:
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        '''
+        Return the file of an episode key.
+        '''
+        return os.path.join(self._directory, hashlib.sha1(json.dumps(key).encode('utf8')).hexdigest() + '.json')
+
+    def get(self, key):
+        '''
+        Return the cached result of an episode key, or None.
+        '''
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as result_file:
+            return json.load(result_file)['result']
+
+    def put(self, key, result):
+        '''
+        Cache the result of an episode key.
+        '''
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as result_file:
+            json.dump(dict(key=key, result=result), result_file)
+        os.replace(tmp_path, path)
+
+
+def episode_key(policy, seed, settings, weights_hash=None):
+    '''
+    Return everything the result of an evaluation episode depends on.
+    '''
+    return [EVALUATION_VERSION, ROUTE_GENERATOR_VERSION, policy, weights_hash if policy == 'dqn' else None, seed,
+            settings['time_steps'], settings['warm_up_steps']]
+
+
+def _init_worker(settings):
+    # runs once in every pool process
+    global _worker_settings
+    _worker_settings = settings
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    '''
+    Close the simulation of this worker when the pool is closed.
+    '''
+    if _worker_env is not None:
+        _worker_env.close()
+
+
+def _worker_policy(policy):
+    '''
+    Return the policy of the given name in this worker, creating it the first time.
+    '''
+    if policy not in _worker_policies:
+        if policy == 'dqn':
+            # one core per worker, like the rollout workers
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(1)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+            from dqn_agent import DQNAgent
+            agent = DQNAgent(**AGENT_PARAMS)
+            agent.load_model_weights(_worker_settings['weights'])
+            _worker_policies[policy] = agent
+        else:
+            _worker_policies[policy] = BASELINES[policy]()
+    return _worker_policies[policy]
+
+
+def _evaluate(task):
+    '''
+    Run the episode of a (policy, seed) task in this worker and return (task, result).
+    '''
+    global _worker_env
+    from traffic_signal_env import TrafficSignalEnv
+
+    policy_name, seed = task
+    if _worker_env is None:
+        # the sumo process is kept for all the episodes of the worker
+        _worker_env = TrafficSignalEnv(_worker_settings['time_steps'], label='eval%d' % os.getpid(),
+                                       backend_name=_worker_settings['backend'],
+                                       warm_up_steps=_worker_settings['warm_up_steps'])
+    policy = _worker_policy(policy_name)
+    if hasattr(policy, 'reset'):
+        policy.reset()
+
+    state = _worker_env.reset(seed)
+    decisions = 0
+    done = False
+    while not done:
+        state, reward, done, info = _worker_env.step(policy.choose_action(state))
+        decisions += 1
+    return task, dict(sum_of_staying_times=int(info['sum_of_staying_times']),
+                      average_highway_speed=float(info['average_highway_speed']), decisions=decisions,
+                      steps=_worker_env.current_step())
+
+
+def evaluate(policies, seeds, settings, cache, workers, progress=None):
+    '''
+    Return {policy: {seed: result}} for every policy and seed, evaluating the ones that are not cached in
+    a pool of workers. progress is called with every (policy, seed) and result that was evaluated.
+    '''
+    weights_hash = file_hash(settings['weights']) if 'dqn' in policies else None
+    results = {policy: {} for policy in policies}
+    tasks = []
+    for policy in policies:
+        for seed in seeds:
+            result = cache.get(episode_key(policy, seed, settings, weights_hash))
+            if result is None:
+                tasks.append((policy, seed))
+            else:
+                results[policy][seed] = result
+    if tasks:
+        # spawn rather than fork, TensorFlow is not fork safe once it has been initialised
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(min(workers, len(tasks)), initializer=_init_worker, initargs=(settings,)) as pool:
+            for (policy, seed), result in pool.imap_unordered(_evaluate, tasks):
+                cache.put(episode_key(policy, seed, settings, weights_hash), result)
+                results[policy][seed] = result
+                if progress is not None:
+                    progress((policy, seed), result)
+            # let the workers exit on their own, closing their simulations
+            pool.close()
+            pool.join()
+    return results
+
+
+def bootstrap_interval(values, confidence=0.95, resamples=10000, seed=0):
+    '''
+    Return the mean of values and the bootstrap percentile confidence interval of the mean. NaN values
+    are left out.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return math.nan, math.nan, math.nan
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(resamples, len(values)))].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    return float(values.mean()), float(np.percentile(means, tail)), float(np.percentile(means, 100 - tail))
+
+
+def summarize(results, reference=None, confidence=0.95):
+    '''
+    Return the mean and confidence interval of every result key of every policy and, if the reference
+    policy was evaluated, of the paired difference of every other policy to it on their common seeds.
+    '''
+    summary = {}
+    for policy, seed_results in results.items():
+        summary[policy] = dict(seeds=len(seed_results))
+        for key in RESULT_KEYS:
+            summary[policy][key] = bootstrap_interval([result[key] for result in seed_results.values()], confidence)
+        if reference in results and policy != reference:
+            seeds = sorted(seed_results.keys() & results[reference].keys())
+            summary[policy]['difference'] = {
+                key: bootstrap_interval([seed_results[seed][key] - results[reference][seed][key] for seed in seeds],
+                                        confidence) for key in RESULT_KEYS}
+    return summary
+
+
+def get_options():
+    '''
+    Parse the command line options.
+    '''
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option('--policies', default='dqn,fixed-time,actuated',
+                          help='comma separated policies: dqn (the greedy policy of --weights) and %s' % ', '.join(BASELINES))
+    opt_parser.add_option('--seeds', default='1000-1029', help='comma separated route seeds and inclusive ranges')
+    opt_parser.add_option('--weights', default='model.weights.h5', help='model weights of the dqn policy')
+    opt_parser.add_option('--workers', type='int', default=os.cpu_count(),
+                          help='number of processes running SUMO episodes in parallel')
+    opt_parser.add_option('--time-steps', type='int', default=3600, help='simulation steps of every episode')
+    opt_parser.add_option('--warm-up-steps', type='int', default=0,
+                          help='start every episode from the simulation state after this many fixed-time steps')
+    opt_parser.add_option('--backend', choices=['traci', 'libsumo'], default='traci', help='simulation backend')
+    opt_parser.add_option('--cache-dir', default='evaluations', help='directory the result of every episode is cached in')
+    opt_parser.add_option('--reference', default='fixed-time', help='policy the others are compared to')
+    opt_parser.add_option('--confidence', type='float', default=0.95, help='confidence level of the intervals')
+    opt_parser.add_option('--output', default=None, help='also write the results and summary to this JSON file')
+    options, args = opt_parser.parse_args()
+    options.policies = [policy for policy in options.policies.split(',') if policy]
+    for policy in options.policies:
+        if policy != 'dqn' and policy not in BASELINES:
+            opt_parser.error("unknown policy '%s'" % policy)
+    if 'dqn' in options.policies and not os.path.exists(options.weights):
+        opt_parser.error('no model weights %s for the dqn policy' % options.weights)
+    return options
+
+
+if __name__ == '__main__':
+    options = get_options()
+    seeds = parse_seeds(options.seeds)
+    settings = dict(weights=options.weights, time_steps=options.time_steps, warm_up_steps=options.warm_up_steps,
+                    backend=options.backend)
+
+    def progress(task, result):
+        print('%s seed %d: sum of staying times %d, average highway speed %.3f'
+              % (task + (result['sum_of_staying_times'], result['average_highway_speed'])))
+
+    results = evaluate(options.policies, seeds, settings, EvaluationCache(options.cache_dir), options.workers, progress)
+    summary = summarize(results, options.reference, options.confidence)
+
+    print('%12s %6s %36s %28s' % ('policy', 'seeds', 'sum of staying times', 'average highway speed'))
+    for policy in options.policies:
+        staying = summary[policy]['sum_of_staying_times']
+        speed = summary[policy]['average_highway_speed']
+        print('%12s %6d %12.0f [%9.0f, %9.0f] %8.3f [%7.3f, %7.3f]'
+              % ((policy, summary[policy]['seeds']) + staying + speed))
+    for policy in options.policies:
+        if 'difference' in summary[policy]:
+            staying = summary[policy]['difference']['sum_of_staying_times']
+            speed = summary[policy]['difference']['average_highway_speed']
+            print('%12s - %s: %+.0f [%+.0f, %+.0f] staying times, %+.3f [%+.3f, %+.3f] highway speed'
+                  % ((policy, options.reference) + staying + speed))
+
+    if options.output is not None:
+        with open(options.output, 'w') as output_file:
+            json.dump(dict(results={policy: {str(seed): result for seed, result in seed_results.items()}
+                                    for policy, seed_results in results.items()},
+                           summary=summary), output_file, indent=2)
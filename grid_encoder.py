@@ -0,0 +1,49 @@
+import numpy as np
+
+# roads of an intersection in the order of their rows in the grid
+WEST, NORTH, EAST, SOUTH = 0, 1, 2, 3
+
+
+class GridEncoder:
+    def __init__(self, junction_x, junction_y, road_length, cell_length, speed_limit, lanes_per_road=3, grid_size=12):
+        self._cell_length = cell_length
+        self._speed_limit = speed_limit
+        self._grid_size = grid_size
+
+        # per road: first row in the grid, coordinate axis along the road, direction and offset so that
+        # column = (sign * coordinate + offset) // cell_length counts cells from the far end of the road
+        self._row_offsets = np.arange(4) * lanes_per_road
+        self._axes = np.array([0, 1, 0, 1])
+        self._signs = np.array([1., -1., 1., -1.])
+        self._offsets = np.array([road_length - junction_x, road_length + junction_y, -junction_x, junction_y])
+
+        self._position = np.zeros((grid_size, grid_size), dtype=np.float32)
+        self._speed = np.zeros((grid_size, grid_size), dtype=np.float32)
+
+    def encode(self, roads, lanes, positions, speeds, out=None):
+        '''
+        Encode the vehicles on the roads of an intersection into the position and speed grids.
+        roads, lanes and speeds have one entry per vehicle and positions has shape (vehicles, 2).
+        Writes into out=(position, speed) if given, otherwise into buffers owned by the encoder
+        that are overwritten by the next call.
+        '''
+        position, speed = out if out is not None else (self._position, self._speed)
+        position.fill(0)
+        speed.fill(0)
+        if len(roads) == 0:
+            return position, speed
+
+        roads = np.asarray(roads)
+        positions = np.asarray(positions, dtype=np.float64)
+        rows = self._row_offsets[roads] + lanes
+        coordinates = self._signs[roads] * positions[np.arange(len(roads)), self._axes[roads]] + self._offsets[roads]
+        cols = np.clip(np.floor_divide(coordinates, self._cell_length).astype(np.int64), 0, self._grid_size - 1)
+
+        # when several vehicles share a cell the speed of the last one is kept
+        cells = rows * self._grid_size + cols
+        unique_cells, last_reversed = np.unique(cells[::-1], return_index=True)
+        last = len(cells) - 1 - last_reversed
+        position.reshape(-1)[unique_cells] = 1
+        speed.reshape(-1)[unique_cells] = np.asarray(speeds, dtype=np.float64)[last] / self._speed_limit
+
+        return position, speed
@@ -0,0 +1,224 @@
+'''
+Per-episode instrumentation of the training loop: timers around its phases, counters, histograms of the
+TraCI calls made through the backend module and of the Keras calls of an agent, and optionally cProfile
+or a sampling profiler for chosen episodes. Everything is off until enable is called; while it is off
+phase() returns a shared no-op context manager and nothing is wrapped, so the hooks cost close to nothing.
+
+    instrumentation.enable(report_file='instrumentation.jsonl', profile_episodes=[3])
+    instrumentation.instrument_agent(agent)
+    instrumentation.begin_episode(ep)
+    with instrumentation.phase('get_state'):
+        state = intersection.get_state()
+    report = instrumentation.end_episode()
+'''
+import cProfile
+import collections
+import io
+import json
+import pstats
+import sys
+import threading
+import timeit
+import backend
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+_enabled = False
+_report_file = None
+_profile_episodes = set()
+_profile_mode = 'cprofile'
+_sample_interval = 0.001
+_episode = None
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ('_times', '_start')
+
+    def __init__(self, times):
+        self._times = times
+
+    def __enter__(self):
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._times[0] += 1
+        self._times[1] += timeit.default_timer() - self._start
+        return False
+
+
+class _Sampler:
+    def __init__(self, thread_id, interval):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        # count the function on top of the sampled thread's stack
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self._samples['%s:%d(%s)' % (code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+    def stop(self, top):
+        self._stop.set()
+        self._thread.join()
+        total = sum(self._samples.values())
+        return dict(samples=total, interval=self._interval,
+                    top=[dict(function=function, samples=count, fraction=count / total)
+                         for function, count in self._samples.most_common(top)])
+
+
+class _Episode:
+    def __init__(self, episode):
+        self.episode = episode
+        self.phases = collections.defaultdict(lambda: [0, 0.0])    # name -> [calls, seconds]
+        self.counters = collections.Counter()
+        self.traci_calls = collections.Counter()
+        self.keras_calls = collections.Counter()
+        self.profiler = None
+        self.start_time = timeit.default_timer()
+
+
+def enable(report_file=None, profile_episodes=(), profile_mode='cprofile', sample_interval=0.001):
+    '''
+    Turn the instrumentation on. Episode reports are appended to report_file as JSON lines if given.
+    The episodes in profile_episodes are profiled with cProfile or with a sampling profiler that looks at
+    the training thread every sample_interval seconds.
+    '''
+    global _enabled, _report_file, _profile_episodes, _profile_mode, _sample_interval
+    if profile_mode not in PROFILE_MODES:
+        raise ValueError("unknown profile mode '%s', expected one of %s" % (profile_mode, PROFILE_MODES))
+    _enabled = True
+    _report_file = report_file
+    _profile_episodes = set(profile_episodes)
+    _profile_mode = profile_mode
+    _sample_interval = sample_interval
+
+
+def enabled():
+    '''
+    Return whether the instrumentation is on.
+    '''
+    return _enabled
+
+
+def phase(name):
+    '''
+    Return a context manager that times a phase of the current episode.
+    '''
+    if _episode is None:
+        return _NULL_PHASE
+    return _Phase(_episode.phases[name])
+
+
+def add_phase_time(name, seconds):
+    '''
+    Add a phase timed elsewhere, e.g. by a timing hook, to the current episode.
+    '''
+    if _episode is not None:
+        times = _episode.phases[name]
+        times[0] += 1
+        times[1] += seconds
+
+
+def count(name, n=1):
+    '''
+    Add n to a counter of the current episode.
+    '''
+    if _episode is not None:
+        _episode.counters[name] += n
+
+
+def _count_call(histogram, name, function):
+    '''
+    Wrap a function so that its calls are counted in a histogram of the current episode.
+    '''
+    def counted(*args, **kwargs):
+        if _episode is not None:
+            getattr(_episode, histogram)[name] += 1
+        return function(*args, **kwargs)
+    return counted
+
+
+def instrument_agent(agent):
+    '''
+    Count the Keras calls of an agent's online and target models, including the compiled forward passes,
+    and time its target network updates as the target_update phase.
+    '''
+    if not _enabled:
+        return
+    for network, model in [('model', agent._model), ('target_model', agent._target_model)]:
+        for method in ['predict', 'predict_on_batch', 'train_on_batch', 'get_weights', 'set_weights']:
+            setattr(model, method, _count_call('keras_calls', '%s.%s' % (network, method), getattr(model, method)))
+    agent._model_forward = _count_call('keras_calls', 'model.compiled_forward', agent._model_forward)
+    agent._target_model_forward = _count_call('keras_calls', 'target_model.compiled_forward', agent._target_model_forward)
+    agent.target_sync().set_timing_hook(lambda mode, seconds: add_phase_time('target_update', seconds))
+
+
+def begin_episode(episode):
+    '''
+    Start recording the report of an episode, profiling it if it was chosen.
+    '''
+    global _episode
+    if not _enabled:
+        return
+    _episode = _Episode(episode)
+    backend.set_call_counter(_episode.traci_calls)
+    if episode in _profile_episodes:
+        if _profile_mode == 'cprofile':
+            _episode.profiler = cProfile.Profile()
+            _episode.profiler.enable()
+        else:
+            _episode.profiler = _Sampler(threading.get_ident(), _sample_interval)
+            _episode.profiler.start()
+
+
+def end_episode(top=20):
+    '''
+    Finish the report of the current episode, append it to the report file and return it. The report of
+    a profiled episode holds its top functions by cumulative time or by samples.
+    '''
+    global _episode
+    if _episode is None:
+        return None
+    episode, _episode = _episode, None
+    backend.set_call_counter(None)
+    wall_time = timeit.default_timer() - episode.start_time
+
+    profile = None
+    if isinstance(episode.profiler, cProfile.Profile):
+        episode.profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(episode.profiler, stream=output).sort_stats('cumulative').print_stats(top)
+        profile = dict(mode='cprofile', stats=output.getvalue())
+    elif episode.profiler is not None:
+        profile = dict(mode='sample', **episode.profiler.stop(top))
+
+    report = dict(
+        episode=episode.episode, wall_time=wall_time,
+        phases={name: dict(calls=calls, seconds=seconds, mean_us=seconds / calls * 1e6)
+                for name, (calls, seconds) in sorted(episode.phases.items())},
+        counters=dict(episode.counters), traci_calls=dict(episode.traci_calls.most_common()),
+        keras_calls=dict(episode.keras_calls.most_common()), profile=profile)
+    if _report_file is not None:
+        with open(_report_file, 'a') as report_file:
+            report_file.write(json.dumps(report) + '\n')
+    return report
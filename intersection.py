@@ -1,11 +1,19 @@
+import hashlib
+import json
 import optparse
 import os
+import shutil
 import sys
 import numpy as np
-import traci
+import traci.constants as tc
+import backend
+from grid_encoder import GridEncoder
+from staying_time_tracker import StayingTimeTracker
 
 # need to include something for highway
 
+VEHICLE_VARIABLES = [tc.VAR_LANE_INDEX, tc.VAR_POSITION, tc.VAR_SPEED]
+
 class Intersection:
     def __init__(self, n_id, e_id, s_id, w_id, tls_id, junction_id, ns_green_phase, we_green_phase, road_length, cell_length, speed_limit):
         self._n_id = n_id
@@ -19,359 +27,242 @@ class Intersection:
         self._road_length = road_length
         self._cell_length = cell_length
         self._speed_limit = speed_limit
-        self._staying_times = {}
-        self._sum_of_staying_times = 0
+        self._staying_time_tracker = StayingTimeTracker()
+        self._roads = [self._n_id, self._e_id, self._s_id, self._w_id]
+        self._encoder = None
+        self._subscribed_vehicles = set()
+
+    def subscribe(self):
+        '''
+        Subscribe to the vehicles on the roads of the intersection and to its traffic signal phase.
+        Must be called once after each backend.start, before the intersection is used.
+        '''
+        if self._encoder is None:
+            # the network does not change between episodes so the junction position is only queried once
+            junction_x, junction_y = backend.junction.getPosition(self._junction_id)
+            self._encoder = GridEncoder(junction_x, junction_y, self._road_length, self._cell_length, self._speed_limit)
+
+        for road in self._roads:
+            backend.edge.subscribe(road, [tc.LAST_STEP_VEHICLE_ID_LIST])
+        backend.trafficlight.subscribe(self._tls_id, [tc.TL_CURRENT_PHASE])
+        self._subscribed_vehicles = set()
+
+    def _vehicles_on_road(self, road):
+        '''
+        Get the IDs of the vehicles on a road from the subscription results of the last step.
+        '''
+        return backend.edge.getSubscriptionResults(road)[tc.LAST_STEP_VEHICLE_ID_LIST]
+
+    def _vehicle_variables(self, vehID):
+        '''
+        Get the lane index, position and speed of a vehicle, subscribing to it the first time it is seen.
+        '''
+        if vehID not in self._subscribed_vehicles:
+            backend.vehicle.subscribe(vehID, VEHICLE_VARIABLES)
+            self._subscribed_vehicles.add(vehID)
+        return backend.vehicle.getSubscriptionResults(vehID)
     
     def get_state(self):
         '''
         Retrieve the state of the sumo intersection, which includes position and speed of vehicles and
         the traffic signal state.
         '''
-        position_matrix = [[0 for j in range(12)] for i in range(12)]
-        speed_matrix = [[0 for j in range(12)] for i in range(12)]
-
-        junction_x, junction_y = traci.junction.getPosition(self._junction_id)
-
-        # populate position and speed matrix for west road of intersection
-        offset = self._road_length - junction_x
-        for vehID in traci.edge.getLastStepVehicleIDs(self._w_id):
-            row = traci.vehicle.getLaneIndex(vehID)
-            col = int((traci.vehicle.getPosition(vehID)[0] + offset) // self._cell_length)
-            col = min(col, 11)  # account for case that col is 12
+        roads = []
+        lanes = []
+        positions = []
+        speeds = []
+        for road_index, road in enumerate([self._w_id, self._n_id, self._e_id, self._s_id]):
+            for vehID in self._vehicles_on_road(road):
+                variables = self._vehicle_variables(vehID)
+                roads.append(road_index)
+                lanes.append(variables[tc.VAR_LANE_INDEX])
+                positions.append(variables[tc.VAR_POSITION])
+                speeds.append(variables[tc.VAR_SPEED])
+
+        # reshape for CNN layer compatibility
+        p = np.empty((1, 12, 12, 1), dtype=np.float32)
+        v = np.empty((1, 12, 12, 1), dtype=np.float32)
+        self._encoder.encode(roads, lanes, positions, speeds, out=(p, v))
 
-            position_matrix[row][col] = 1
-            speed_matrix[row][col] = traci.vehicle.getSpeed(vehID) / self._speed_limit
-        
-        # populate position and speed matrix for north road of intersection
-        offset = self._road_length + junction_y
-        for vehID in traci.edge.getLastStepVehicleIDs(self._n_id):
-            row = traci.vehicle.getLaneIndex(vehID) + 3
-            col = int((offset - traci.vehicle.getPosition(vehID)[1]) // self._cell_length)
-            col = min(col, 11)  # account for case that col is 12
-
-            position_matrix[row][col] = 1
-            speed_matrix[row][col] = traci.vehicle.getSpeed(vehID) / self._speed_limit
-
-        # populate position and speed matrix for east road of intersection
-        offset = junction_x
-        for vehID in traci.edge.getLastStepVehicleIDs(self._e_id):
-            row = traci.vehicle.getLaneIndex(vehID) + 6
-            col = int((traci.vehicle.getPosition(vehID)[0] - offset) // self._cell_length)
-            col = min(col, 11)  # account for case that col is 12
-            
-            position_matrix[row][col] = 1
-            speed_matrix[row][col] = traci.vehicle.getSpeed(vehID) / self._speed_limit
-
-        # populate position and speed matrix for south road of intersection
-        offset = junction_y
-        for vehID in traci.edge.getLastStepVehicleIDs(self._s_id):
-            row = traci.vehicle.getLaneIndex(vehID) + 9
-            col = int((offset - traci.vehicle.getPosition(vehID)[1]) // self._cell_length)
-            col = min(col, 11)  # account for case that col is 12
-
-            position_matrix[row][col] = 1
-            speed_matrix[row][col] = traci.vehicle.getSpeed(vehID) / self._speed_limit
-        
         # generate the light matrix which will contain the traffic signal state
-        light_matrix = []
-        if traci.trafficlight.getPhase(self._tls_id) == self._ns_green_phase:
-            light_matrix = [0, 1]
+        if backend.trafficlight.getSubscriptionResults(self._tls_id)[tc.TL_CURRENT_PHASE] == self._ns_green_phase:
+            l = np.array([0, 1], dtype=np.float32).reshape(1, 2, 1)
         else:
-            light_matrix = [1, 0]
-        
-        p = np.array(position_matrix)
-        p = p.reshape(1, 12, 12, 1)    # reshape for CNN layer compatibility
-
-        v = np.array(speed_matrix)
-        v = v.reshape(1, 12, 12, 1)    # reshape for CNN layer compatibility
-        
-        l = np.array(light_matrix)
-        l = l.reshape(1, 2, 1) # reshape for CNN layer compatability
+            l = np.array([1, 0], dtype=np.float32).reshape(1, 2, 1)
 
         return [p, v, l]
     
+    def tls_id(self):
+        '''
+        Return the ID of the traffic signal of the intersection.
+        '''
+        return self._tls_id
+
     def cumultative_staying_time(self):
         '''
         Get the cumultative staying time of all vehicles in the intersection.
         '''
-        # set staying time of vehicles who have left the intersection to 0
-        roads = [self._n_id, self._e_id, self._s_id, self._w_id]
-        vehicles_in_roads = []
-        for road in roads:
-            vehicles_in_roads += traci.edge.getLastStepVehicleIDs(road)
-        for vehID in self._staying_times:
-            if vehID not in vehicles_in_roads:
-                self._staying_times[vehID] = 0
-
-        cumultative_staying_time = sum(self._staying_times.values())
-        self._sum_of_staying_times += cumultative_staying_time
-        return cumultative_staying_time
+        return self._staying_time_tracker.cumultative_staying_time()
 
     def update_staying_times(self):
         '''
         Update the staying time of all vehicles in the intersection.
         '''
-        roads = [self._n_id, self._e_id, self._s_id, self._w_id]
-        for road in roads:
-            for vehID in traci.edge.getLastStepVehicleIDs(road):
-                if vehID not in self._staying_times:
-                    self._staying_times[vehID] = 1
-                else:
-                    self._staying_times[vehID] += 1
-    
+        vehicles_in_roads = []
+        for road in self._roads:
+            vehicles_in_roads += self._vehicles_on_road(road)
+        self._staying_time_tracker.update(vehicles_in_roads)
 
     def sum_of_staying_times(self):
         '''
         Return the sum of staying time across the episode.
         '''
-        return self._sum_of_staying_times
+        return self._staying_time_tracker.sum_of_staying_times()
         
     def reset_staying_time_info(self):
         '''
         Reset the sum and dictionary for staying times in preparation of a new episode.
         '''
-        self._sum_of_staying_times = 0
-        self._staying_times = {}
+        self._staying_time_tracker.reset()
+
+ROUTES = [
+    # routes leading to north highway
+    ('W1_HN', 'we1 we2 we3 we4 hwn'), ('N1_HN', 'int1ns1 we2 we3 we4 hwn'), ('S1_HN', 'int1sn1 we2 we3 we4 hwn'),
+    ('N2_HN', 'int2ns1 we3 we4 hwn'), ('S2_HN', 'int2sn1 we3 we4 hwn'),
+    # routes leading to the south highway
+    ('W1_HS', 'we1 we2 we3 se1 hws'), ('N1_HS', 'int1ns1 we2 we3 se1 hws'), ('S1_HS', 'int1sn1 we2 we3 se1 hws'),
+    ('N2_HS', 'int2ns1 we3 se1 hws'), ('S2_HS', 'int2sn1 we3 se1 hws'),
+    # routes leading to north road of intersection two
+    ('W1_N2', 'we1 we2 int2sn2'), ('N1_N2', 'int1ns1 we2 int2sn2'), ('S1_N2', 'int1sn1 we2 int2sn2'),
+    ('S2_N2', 'int2sn1 int2sn2'), ('HN_N2', '-hwn ew1 ew2 int2sn2'), ('HS_N2', '-hws nw1 ew2 int2sn2'),
+    # routes leading to south road of intersection two
+    ('W1_S2', 'we1 we2 int2ns2'), ('N1_S2', 'int1ns1 we2 int2ns2'), ('S1_S2', 'int1sn1 we2 int2ns2'),
+    ('N2_S2', 'int2ns1 int2ns2'), ('HN_S2', '-hwn ew1 ew2 int2ns2'), ('HS_S2', '-hws nw1 ew2 int2ns2'),
+    # routes leading to north road of intersection one
+    ('W1_N1', 'we1 int1sn2'), ('S1_N1', 'int1sn1 int1sn2'), ('N2_N1', 'int2ns1 ew3 int1sn2'),
+    ('S2_N1', 'int2sn1 ew3 int1sn2'), ('HN_N1', '-hwn ew1 ew2 ew3 int1sn2'), ('HS_N1', '-hws nw1 ew2 ew3 int1sn2'),
+    # routes leading to south road of intersection one
+    ('W1_S1', 'we1 int1ns2'), ('N1_S1', 'int1ns1 int1ns2'), ('N2_S1', 'int2ns1 ew3 int1ns2'),
+    ('S2_S1', 'int2sn1 ew3 int1ns2'), ('HN_S1', '-hwn ew1 ew2 ew3 int1ns2'), ('HS_S1', '-hws nw1 ew2 ew3 int1ns2'),
+    # routes leading to west road of intersection one
+    ('N1_W1', 'int1ns1 ew4'), ('S1_W1', 'int1sn1 ew4'), ('N2_W1', 'int2ns1 ew3 ew4'),
+    ('S2_W1', 'int2sn1 ew3 ew4'), ('HN_W1', '-hwn ew1 ew2 ew3 ew4'), ('HS_W1', '-hws nw1 ew2 ew3 ew4'),
+]
+
+# demand per second for different destinations
+DEFAULT_DEMAND = {'W1': 1. / 10, 'N1': 1. / 14, 'S1': 1. / 14, 'N2': 1. / 17, 'S2': 1. / 17, 'HN': 1. / 30, 'HS': 1. / 25}
+
+# For each destination, a vehicle first picks a kind of route with a uniform draw compared against the
+# thresholds (left turn, right turn, no turn) and then one of the (vehicle id prefix, route) choices of
+# that kind uniformly at random. Some vehicle id prefixes do not match their route, as they always have.
+ROUTE_CHOICES = [
+    ('W1', [0.25], [[('S1_W1', 'N1_W1'), ('S2_W1', 'N2_W1'), ('HS_W1', 'N2_W1')],
+                    [('N1_W1', 'N1_W1'), ('N2_W1', 'N2_W1'), ('HN_W1', 'N2_W1')]]),
+    ('N1', [0.25, 0.55], [[('W1_N1', 'W1_N1'), ('S2_N1', 'S2_N1'), ('HS_N1', 'HS_N1')],
+                          [('N2_N1', 'N2_N1'), ('HN_N1', 'HN_N1')],
+                          [('S1_N1', 'S1_N1')]]),
+    ('S1', [0.25, 0.55], [[('N2_S1', 'N2_S1'), ('S2_S1', 'S2_S1'), ('HS_S1', 'HS_S1'), ('HN_S1', 'HN_S1')],
+                          [('W1_S1', 'W1_S1')],
+                          [('N1_S1', 'N1_S1')]]),
+    ('N2', [0.25, 0.55], [[('W1_N2', 'W1_N2'), ('N1_N2', 'N1_N2'), ('S1_N2', 'S1_N2'), ('HS_N2', 'HS_N2')],
+                          [('HN_N2', 'HN_N2')],
+                          [('S2_N2', 'S2_N2')]]),
+    ('S2', [0.25, 0.55], [[('N1_S2', 'N1_S2'), ('HN_S2', 'HN_S2'), ('HS_S2', 'HS_S2')],
+                          [('W1_S2', 'W1_S2'), ('S1_S2', 'S1_S2')],
+                          [('N2_S2', 'N2_S2')]]),
+    ('HN', [0.25, 0.55], [[('N1_HN', 'N1_HN'), ('N2_HN', 'N2_HN')],
+                          [('S1_HN', 'S1_HN'), ('S2_HN', 'S2_HN')],
+                          [('W1_HN', 'W1_HN')]]),
+    ('HS', [0.25, 0.55], [[('N1_HS', 'N1_HS'), ('N2_HS', 'N2_HS')],
+                          [('S1_HS', 'S1_HS'), ('S2_HS', 'S2_HS')],
+                          [('W1_HS', 'W1_HS')]]),
+]
+
+# bump when the generated routes change for the same seed, horizon and demand
+ROUTE_GENERATOR_VERSION = 2
 
 class TrafficGenerator:
-    def __init__(self, time_steps):
+    def __init__(self, time_steps, demand=None, cache_dir=os.path.join('config', 'route_cache'),
+                 routes_file=os.path.join('config', 'routes.rou.xml')):
         self._timp_steps = time_steps
-        self._num_cars = 0
+        self._demand = dict(DEFAULT_DEMAND if demand is None else demand)
+        self._cache_dir = cache_dir
+        self._routes_file = routes_file
 
     def generate_routefile(self, seed):
         '''
-        Generate the route file.
+        Generate the route file, reusing the cached one if the same seed, horizon and demand were
+        generated before.
         '''
-
         np.random.seed(seed)    # make tests reproducible
 
-        # demand per second for different destinations
-        pW1 = 1. / 10
-        pN1 = 1. / 14
-        pS1 = 1. / 14
-        pN2 = 1. / 17
-        pS2 = 1. / 17
-        pHN = 1. / 30
-        pHS = 1. / 25
-
-        with open('config/routes.rou.xml', 'w') as routes:
-            print('''<routes>\n\t<vType id="average_car" vClass="passenger" accel="3" decel="4.5" minGap="2.5" maxSpeed="45" />
-            ''', file=routes)
-
-            # routes leading to north highway
-            print('    <route id="W1_HN" edges="we1 we2 we3 we4 hwn" />', file=routes)
-            print('    <route id="N1_HN" edges="int1ns1 we2 we3 we4 hwn" />', file=routes)
-            print('    <route id="S1_HN" edges="int1sn1 we2 we3 we4 hwn" />', file=routes)
-            print('    <route id="N2_HN" edges="int2ns1 we3 we4 hwn" />', file=routes)
-            print('    <route id="S2_HN" edges="int2sn1 we3 we4 hwn" />', file=routes)
-
-            # routes leading to the south highway
-            print('    <route id="W1_HS" edges="we1 we2 we3 se1 hws" />', file=routes)
-            print('    <route id="N1_HS" edges="int1ns1 we2 we3 se1 hws" />', file=routes)
-            print('    <route id="S1_HS" edges="int1sn1 we2 we3 se1 hws" />', file=routes)
-            print('    <route id="N2_HS" edges="int2ns1 we3 se1 hws" />', file=routes)
-            print('    <route id="S2_HS" edges="int2sn1 we3 se1 hws" />', file=routes)
-
-            # routes leading to north road of intersection two
-            print('    <route id="W1_N2" edges="we1 we2 int2sn2" />', file=routes)
-            print('    <route id="N1_N2" edges="int1ns1 we2 int2sn2" />', file=routes)
-            print('    <route id="S1_N2" edges="int1sn1 we2 int2sn2" />', file=routes)
-            print('    <route id="S2_N2" edges="int2sn1 int2sn2" />', file=routes)
-            print('    <route id="HN_N2" edges="-hwn ew1 ew2 int2sn2" />', file=routes)
-            print('    <route id="HS_N2" edges="-hws nw1 ew2 int2sn2" />', file=routes)
-
-            # routes leading to south road of intersection two
-            print('    <route id="W1_S2" edges="we1 we2 int2ns2" />', file=routes)
-            print('    <route id="N1_S2" edges="int1ns1 we2 int2ns2" />', file=routes)
-            print('    <route id="S1_S2" edges="int1sn1 we2 int2ns2" />', file=routes)
-            print('    <route id="N2_S2" edges="int2ns1 int2ns2" />', file=routes)
-            print('    <route id="HN_S2" edges="-hwn ew1 ew2 int2ns2" />', file=routes)
-            print('    <route id="HS_S2" edges="-hws nw1 ew2 int2ns2" />', file=routes)
-
-            # routes leading to north road of intersection one
-            print('    <route id="W1_N1" edges="we1 int1sn2" />', file=routes)
-            print('    <route id="S1_N1" edges="int1sn1 int1sn2" />', file=routes)
-            print('    <route id="N2_N1" edges="int2ns1 ew3 int1sn2" />', file=routes)
-            print('    <route id="S2_N1" edges="int2sn1 ew3 int1sn2" />', file=routes)
-            print('    <route id="HN_N1" edges="-hwn ew1 ew2 ew3 int1sn2" />', file=routes)
-            print('    <route id="HS_N1" edges="-hws nw1 ew2 ew3 int1sn2" />', file=routes)
-
-            # routes leading to south road of intersection one
-            print('    <route id="W1_S1" edges="we1 int1ns2" />', file=routes)
-            print('    <route id="N1_S1" edges="int1ns1 int1ns2" />', file=routes)
-            print('    <route id="N2_S1" edges="int2ns1 ew3 int1ns2" />', file=routes)
-            print('    <route id="S2_S1" edges="int2sn1 ew3 int1ns2" />', file=routes)
-            print('    <route id="HN_S1" edges="-hwn ew1 ew2 ew3 int1ns2" />', file=routes)
-            print('    <route id="HS_S1" edges="-hws nw1 ew2 ew3 int1ns2" />', file=routes)
-
-            # routes leading to west road of intersection one
-            print('    <route id="N1_W1" edges="int1ns1 ew4" />', file=routes)
-            print('    <route id="S1_W1" edges="int1sn1 ew4" />', file=routes)
-            print('    <route id="N2_W1" edges="int2ns1 ew3 ew4" />', file=routes)
-            print('    <route id="S2_W1" edges="int2sn1 ew3 ew4" />', file=routes)
-            print('    <route id="HN_W1" edges="-hwn ew1 ew2 ew3 ew4" />', file=routes)
-            print('    <route id="HS_W1" edges="-hws nw1 ew2 ew3 ew4" />', file=routes)
-        
-            for i in range(self._timp_steps):
-                # destination is west road of intersection one
-                if np.random.uniform() < pW1:
-                    rl = np.random.uniform()
-                    if rl < 0.25:  # take a route with a left turn 
-                        route_choice = np.random.randint(1, 4)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="S1_W1_%i" type="average_car" route="N1_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S2_W1_%i" type="average_car" route="N2_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="HS_W1_%i" type="average_car" route="N2_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        self._num_cars += 1
-                    else: # take one of the reamining routes
-                        route_choice = np.random.randint(1, 4)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N1_W1_%i" type="average_car" route="N1_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="N2_W1_%i" type="average_car" route="N2_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="HN_W1_%i" type="average_car" route="N2_W1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is north road of intersection one
-                if np.random.uniform() < pN1:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn 
-                        route_choice = np.random.randint(1, 4)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="W1_N1_%i" type="average_car" route="W1_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S2_N1_%i" type="average_car" route="S2_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="HS_N1_%i" type="average_car" route="HS_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn 
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N2_N1_%i" type="average_car" route="N2_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="HN_N1_%i" type="average_car" route="HN_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the remaining route with no turns
-                        print('    <vehicle id="S1_N1_%i" type="average_car" route="S1_N1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is south road of intersection one
-                if np.random.uniform() < pS1:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn 
-                        route_choice = np.random.randint(1, 5)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N2_S1_%i" type="average_car" route="N2_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S2_S1_%i" type="average_car" route="S2_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="HS_S1_%i" type="average_car" route="HS_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        elif route_choice == 4:
-                            print('    <vehicle id="HN_S1_%i" type="average_car" route="HN_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn 
-                        print('    <vehicle id="W1_S1_%i" type="average_car" route="W1_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the remaining route with no turns
-                        print('    <vehicle id="N1_S1_%i" type="average_car" route="N1_S1" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is north road of intersection two
-                if np.random.uniform() < pN2:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn 
-                        route_choice = np.random.randint(1, 5)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="W1_N2_%i" type="average_car" route="W1_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="N1_N2_%i" type="average_car" route="N1_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="S1_N2_%i" type="average_car" route="S1_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        elif route_choice == 4:
-                            print('    <vehicle id="HS_N2_%i" type="average_car" route="HS_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn 
-                        print('    <vehicle id="HN_N2_%i" type="average_car" route="HN_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the remaining route with no turns
-                        print('    <vehicle id="S2_N2_%i" type="average_car" route="S2_N2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is south road of intersection two
-                if np.random.uniform() < pS2:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn 
-                        route_choice = np.random.randint(1, 4)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N1_S2_%i" type="average_car" route="N1_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="HN_S2_%i" type="average_car" route="HN_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 3:
-                            print('    <vehicle id="HS_S2_%i" type="average_car" route="HS_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)                        
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="W1_S2_%i" type="average_car" route="W1_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S1_S2_%i" type="average_car" route="S1_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the remaining route with no turns
-                        print('    <vehicle id="N2_S2_%i" type="average_car" route="N2_S2" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is the north highway
-                if np.random.uniform() < pHN:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn not including turn to enter highway
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N1_HN_%i" type="average_car" route="N1_HN" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="N2_HN_%i" type="average_car" route="N2_HN" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="S1_HN_%i" type="average_car" route="S1_HN" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S2_HN_%i" type="average_car" route="S2_HN" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the route with only turn being turn into highway
-                        print('    <vehicle id="W1_HN_%i" type="average_car" route="W1_HN" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-
-                # destination is the south highway
-                if np.random.uniform() < pHS:
-                    rls = np.random.uniform()
-                    if rls < 0.25:  # take a route with a left turn
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="N1_HS_%i" type="average_car" route="N1_HS" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="N2_HS_%i" type="average_car" route="N2_HS" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    elif rls < 0.55: # take one of the remaining routes with a right turn
-                        route_choice = np.random.randint(1, 3)   # choose a random source
-                        if route_choice == 1:
-                            print('    <vehicle id="S1_HS_%i" type="average_car" route="S1_HS" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        elif route_choice == 2:
-                            print('    <vehicle id="S2_HS_%i" type="average_car" route="S2_HS" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-                    else: # take the route with only turn being turn into highway
-                        print('    <vehicle id="W1_HS_%i" type="average_car" route="W1_HS" depart="%i" departLane="random" />' % (self._num_cars, i), file=routes)
-                        self._num_cars += 1
-  
-            print('</routes>', file=routes)
-        
-        self._num_cars = 0
+        cache_file = None
+        if self._cache_dir is not None:
+            cache_file = os.path.join(self._cache_dir, self._cache_key(seed) + '.rou.xml')
+            if os.path.exists(cache_file):
+                shutil.copyfile(cache_file, self._routes_file)
+                return
+
+        routes = self.routes_xml(seed)
+        with open(self._routes_file, 'w') as routes_file:
+            routes_file.write(routes)
+
+        if cache_file is not None:
+            # write to a temporary file first so that concurrent generators never see a partial file
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+            with open(tmp_file, 'w') as routes_file:
+                routes_file.write(routes)
+            os.replace(tmp_file, cache_file)
+
+    def routes_xml(self, seed):
+        '''
+        Draw the vehicles of the whole horizon at once and return the route file contents.
+        '''
+        rng = np.random.default_rng(seed)
+
+        departs = []
+        destination_orders = []
+        choices = []
+        choice_names = []
+        for order, (destination, thresholds, kinds) in enumerate(ROUTE_CHOICES):
+            # choices of this destination flattened, with the first index and number of choices of each kind
+            first_choice = np.cumsum([0] + [len(kind) for kind in kinds[:-1]])
+            choice_count = np.array([len(kind) for kind in kinds])
+
+            depart = np.flatnonzero(rng.random(self._timp_steps) < self._demand[destination])
+            kind = np.searchsorted(thresholds, rng.random(len(depart)), side='right')
+            choice = first_choice[kind] + (rng.random(len(depart)) * choice_count[kind]).astype(np.int64)
+
+            departs.append(depart)
+            destination_orders.append(np.full(len(depart), order))
+            choices.append(choice + len(choice_names))
+            choice_names += [choice for kind in kinds for choice in kind]
+
+        # vehicles are sorted by departure time, then by destination as the original per-second loop did
+        departs = np.concatenate(departs)
+        choices = np.concatenate(choices)
+        order = np.lexsort((np.concatenate(destination_orders), departs))
+
+        lines = ['<routes>\n\t<vType id="average_car" vClass="passenger" accel="3" decel="4.5" minGap="2.5" maxSpeed="45" />\n            ']
+        lines += ['    <route id="%s" edges="%s" />' % route for route in ROUTES]
+        lines += ['    <vehicle id="%s_%i" type="average_car" route="%s" depart="%i" departLane="random" />'
+                  % (choice_names[choice][0], vehicle, choice_names[choice][1], depart)
+                  for vehicle, (choice, depart) in enumerate(zip(choices[order].tolist(), departs[order].tolist()))]
+        lines.append('</routes>\n')
+        return '\n'.join(lines)
+
+    def _cache_key(self, seed):
+        '''
+        Hash everything the generated routes depend on.
+        '''
+        key = json.dumps([ROUTE_GENERATOR_VERSION, seed, self._timp_steps, sorted(self._demand.items())])
+        return hashlib.sha1(key.encode('utf8')).hexdigest()
 
-def set_sumo(sumocfg_file_name, time_steps, nogui):
+def set_sumo(sumocfg_file_name, time_steps, nogui, backend_name='traci'):
     '''
-    Configure the SUMO command for traci to call when starting.
+    Configure the SUMO command for the simulation backend to call when starting, and select the backend
+    ('traci' runs sumo as a separate process, 'libsumo' runs it inside this process).
     '''
     if 'SUMO_HOME' in os.environ:
         tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -381,6 +272,10 @@ def set_sumo(sumocfg_file_name, time_steps, nogui):
     
     from sumolib import checkBinary
 
+    if not nogui and backend_name != 'traci':
+        sys.exit("sumo-gui can only be used with the traci backend")
+    backend.select_backend(backend_name)
+
     if nogui:
         sumoBinary = checkBinary('sumo')
     else:
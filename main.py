@@ -1,164 +1,243 @@
-from intersection import Intersection, TrafficGenerator, set_sumo
+from intersection import TrafficGenerator, set_sumo
 from dqn_agent import DQNAgent
+from multi_intersection import MultiIntersectionController
+from traffic_signal_env import TrafficSignalEnv, create_highway_stats, create_int1, create_int2, queue_length
+from metrics import MetricsWriter, truncate_run
+from checkpoint import CheckpointManager, latest_run
+from warm_start import SimulationSession
+import backend
+import instrumentation
+import optparse
+import os
 import random
-import traci
+import time
 import timeit
 
-NE_HIGHWAY_ID = 'hwn'
-SE_HIGHWAY_ID = 'hws'
-TLS_INT1_ID = 'int1'
-TLS_INT2_ID = 'int2'
-INT1_JUNCTION_ID = 'int1'
-INT2_JUNCTION_ID = 'int2'
-NS_GREEN_PHASE = 0
-WE_GREEN_PHASE = 4
-INT1_W = 'we1'
-INT1_E = 'ew3'
-INT1_N = 'int1ns1'
-INT1_S = 'int1sn1'
-INT2_W = 'we2'
-INT2_E = 'ew2'
-INT2_N = 'int2ns1'
-INT2_S = 'int2sn1'
-INT_SPEED_LIMIT = 15.64
-
-def update_highway_speeds(highway_speeds: dict, highway_id: str) -> None:
-    '''Check if a vehicle has just entered the highway. If they did, add the
-    speed with the vehID as the key to the dictionary.'''
-    for vehID in traci.edge.getLastStepVehicleIDs(highway_id):
-            if vehID not in highway_speeds:
-                highway_speeds[vehID] = traci.vehicle.getSpeed(vehID)
-
-def average_highway_speed(highway_speeds: dict):
+def get_options():
     '''
-    Calculate the average highway speed.
+    Parse the command line options.
     '''
-    return sum(list(highway_speeds.values())) / len(list(highway_speeds.values()))
-
-if __name__ == '__main__':
-    random.seed(0) # set the seed for reproducible test results
-
-    time_steps = 3600
-    episodes = 20
-
-    sumo_cmd = set_sumo('run.sumocfg', time_steps, nogui=True)
-
-    traffic_gen = TrafficGenerator(time_steps)
-
-    int1 = Intersection(n_id=INT1_N, e_id=INT1_E, s_id=INT1_S, w_id=INT1_W, 
-                        tls_id=TLS_INT1_ID, junction_id=INT1_JUNCTION_ID, 
-                        ns_green_phase=NS_GREEN_PHASE, we_green_phase=WE_GREEN_PHASE, 
-                        road_length=500, cell_length=40, speed_limit=15.64)
-
-    agent1 = DQNAgent(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002, 
-                    memory_capacity=200, action_size=2, batch_size=32, update_rate=0.001)
-
-    try:
-        agent1.load_model_weights('model.weights.h5')
-        agent1.save_target_model_weights('target_model.weights.h5')
-    except:
-        pass
-
-    for ep in range(episodes):
-        log = open('log.txt', 'a')
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option('--routes-only', action='store_true', default=False,
+                          help='only generate the route file of every episode and report the generation time')
+    opt_parser.add_option('--workers', type='int', default=0,
+                          help='number of parallel SUMO rollout workers feeding the learner (0 trains inline)')
+    opt_parser.add_option('--backend', choices=['traci', 'libsumo'], default='traci',
+                          help='simulation backend: traci (sumo process over a socket) or libsumo (in-process)')
+    opt_parser.add_option('--control-int2', action='store_true', default=False,
+                          help='control intersection two as well, choosing the actions of both with one batched inference')
+    opt_parser.add_option('--target-sync', choices=['soft', 'hard'], default='soft',
+                          help='target network update: soft (Polyak averaging every training step) or hard (copy every --hard-update-interval steps)')
+    opt_parser.add_option('--hard-update-interval', type='int', default=1000,
+                          help='training steps between hard target network updates')
+    opt_parser.add_option('--instrument', action='store_true', default=False,
+                          help='time the phases of the training loop and count TraCI and Keras calls per episode')
+    opt_parser.add_option('--instrument-report', default='instrumentation.jsonl',
+                          help='file the per-episode instrumentation reports are appended to as JSON lines')
+    opt_parser.add_option('--profile-episodes', default='',
+                          help='comma separated episodes (from 1) to profile, implies --instrument')
+    opt_parser.add_option('--profile-mode', choices=['cprofile', 'sample'], default='cprofile',
+                          help='profile with cProfile or by sampling the training thread')
+    opt_parser.add_option('--run-dir', default=os.path.join('runs', time.strftime('%Y%m%d-%H%M%S')),
+                          help='directory the per-step and per-episode metrics are written to, read with metrics.load_run')
+    opt_parser.add_option('--verbosity', type='int', default=1,
+                          help='console output: 0 nothing, 1 a line per episode, 2 a line per decision step as well')
+    opt_parser.add_option('--memory-capacity', type='int', default=200,
+                          help='number of transitions the replay memory holds')
+    opt_parser.add_option('--replay-dir', default=None,
+                          help='keep the replay memory in memory-mapped files in this directory instead of in RAM')
+    opt_parser.add_option('--replay-hot-window', type='int', default=100000,
+                          help='most recent transitions of a --replay-dir memory that are also kept in RAM')
+    opt_parser.add_option('--checkpoint-dir', default='checkpoints',
+                          help='directory the training checkpoints are written to and resumed from, one subdirectory per run')
+    opt_parser.add_option('--checkpoint-interval', type='int', default=1,
+                          help='episodes between checkpoints of the full training state (0 never checkpoints); '
+                               'with --workers they count finished episodes in any seed order and cannot be resumed')
+    opt_parser.add_option('--keep-checkpoints', type='int', default=3,
+                          help='number of most recent checkpoints kept')
+    opt_parser.add_option('--resume', action='store_true', default=False,
+                          help='continue the run that saved the latest checkpoint from it, writing to its run directory')
+    opt_parser.add_option('--warm-up-steps', type='int', default=0,
+                          help='start every episode from the simulation state after this many fixed-time steps, saved once per route seed')
+    opt_parser.add_option('--state-cache-dir', default=os.path.join('config', 'state_cache'),
+                          help='directory the warmed-up simulation states are saved to')
+    options, args = opt_parser.parse_args()
+    if options.control_int2 and options.workers > 0:
+        opt_parser.error('--control-int2 trains inline and cannot be combined with --workers')
+    if options.resume and options.workers > 0:
+        opt_parser.error('--resume trains inline and cannot be combined with --workers')
+    return options
+
+def train_multi_intersection(agent, episodes, time_steps, traffic_gen, backend_name, metrics, first_episode=0,
+                             end_episode=None, warm_up_steps=0, state_cache_dir=os.path.join('config', 'state_cache')):
+    '''
+    Train the agent on both intersections, which share the agent and run their phase programs independently.
+    end_episode is called with the number of finished episodes and the record of each one logged to the
+    metrics after it. The routes of traffic_gen must cover the warm-up steps as well.
+    '''
+    sumo_cmd = set_sumo('run.sumocfg', time_steps, nogui=True, backend_name=backend_name)
+    session = SimulationSession(sumo_cmd, warm_up_steps=warm_up_steps, cache_dir=state_cache_dir)
+    controller = MultiIntersectionController(agent, [create_int1(), create_int2()])
+    highway_stats = create_highway_stats()
+    for ep in range(first_episode, episodes):
+        instrumentation.begin_episode(ep + 1)
         traffic_gen.generate_routefile(ep)
-        traci.start(sumo_cmd)
-        step = 0
-        highway_speeds = {} # key is vehID and value is the speed they entered the highway
+        with instrumentation.phase('start_episode'):
+            session.start()
+        controller.reset()
+        highway_stats.reset()
+        highway_stats.subscribe()
+
+        # the last transition of every intersection is held back until it is known whether it ends the episode
+        pending = [None] * controller.num_intersections()
 
         start_time = timeit.default_timer()
-        while traci.simulation.getMinExpectedNumber() > 0 and step < time_steps:
-            print("step:", step) # TODO
+        step = 0
+        while backend.simulation.getMinExpectedNumber() > 0 and step < time_steps:
+            with instrumentation.phase('controller_step'):
+                transitions = controller.step()
+            step += 1
+            with instrumentation.phase('update_highway_speeds'):
+                highway_stats.update()
 
-            # observe the intersection state
-            int1_state = int1.get_state()
+            # update weights
+            for i, state, action, reward, next_state in transitions:
+                metrics.log_step(ep + 1, step, action, reward, queue_length(next_state),
+                                 controller.last_staying_time(i), intersection=i)
+                if pending[i] is not None:
+                    agent.add_experience(*pending[i], False)
+                    with instrumentation.phase('replay_experience'):
+                        agent.replay_experience()
+                pending[i] = (state, action, reward, next_state)
+
+        # the episode ends the last action of every intersection
+        for transition in pending:
+            if transition is not None:
+                agent.add_experience(*transition, True)
+                with instrumentation.phase('replay_experience'):
+                    agent.replay_experience()
+        instrumentation.end_episode()
+
+        execution_time = timeit.default_timer() - start_time
+        record = dict(sum_of_staying_times=sum(controller.sum_of_staying_times()),
+                      average_highway_speed=highway_stats.mean(), execution_time=execution_time)
+        metrics.log_episode(episode=ep + 1, **record)
+        if end_episode is not None:
+            end_episode(ep + 1, record)
+    session.close()
+
+def train_single_intersection(agent, env, episodes, metrics, first_episode=0, end_episode=None):
+    '''
+    Train the agent on the intersection of a TrafficSignalEnv, the episodes with seeds first_episode to
+    episodes - 1. end_episode is called with the number of finished episodes and the record of each one
+    logged to the metrics after it.
+    '''
+    for ep in range(first_episode, episodes):
+        instrumentation.begin_episode(ep + 1)
 
-            # get current cumultative waiting time
-            staying_time_start = int1.cumultative_staying_time()
+        # observe the intersection state
+        int1_state = env.reset(ep)
 
+        start_time = timeit.default_timer()
+        done = False
+        while not done:
             # choose action
-            int1_action = agent1.choose_action(int1_state)
-
-            # execute action
-            if (int1_action != int1_state[2][0][0][0]):
-                # chosen action is the same so keep traffic signal light unchanged
-                phase = 0
-                if int1_action == 1:
-                    phase = NS_GREEN_PHASE
-                else:
-                    phase = WE_GREEN_PHASE
-
-                for i in range(10):
-                    traci.trafficlight.setPhase(TLS_INT1_ID, phase)
-                    step += 1
-                    traci.simulationStep()
-                    update_highway_speeds(highway_speeds, NE_HIGHWAY_ID)
-                    update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)
-                    int1.update_staying_times()
-            else:
-                # chosen action is not the same
-                # transition phase
-                if int1_action == 1:
-                    phase = WE_GREEN_PHASE
-                else:
-                    phase = NS_GREEN_PHASE
-                
-                for i in range(6): # turn on yellow light for either NS traffic or WE traffic
-                    traci.trafficlight.setPhase(TLS_INT1_ID, phase + 1)
-                    step += 1
-                    traci.simulationStep()
-                    update_highway_speeds(highway_speeds, NE_HIGHWAY_ID)
-                    update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)
-                    int1.update_staying_times()
-                for i in range(10): # turn on green light for left turn
-                    traci.trafficlight.setPhase(TLS_INT1_ID, phase + 2)
-                    step += 1
-                    traci.simulationStep()
-                    update_highway_speeds(highway_speeds, NE_HIGHWAY_ID)
-                    update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)
-                    int1.update_staying_times()
-                for i in range(6): # turn on yellow light for left turn
-                    traci.trafficlight.setPhase(TLS_INT1_ID, phase + 3)
-                    step += 1
-                    traci.simulationStep()
-                    update_highway_speeds(highway_speeds, NE_HIGHWAY_ID)
-                    update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)
-                    int1.update_staying_times()
-                
-                # turn on green light for phase transitioning to
-                for i in range(10):
-                    traci.trafficlight.setPhase(TLS_INT1_ID, (phase + 4) % 8)
-                    step += 1
-                    traci.simulationStep()
-                    update_highway_speeds(highway_speeds, NE_HIGHWAY_ID)
-                    update_highway_speeds(highway_speeds, SE_HIGHWAY_ID)
-                    int1.update_staying_times()
-                
-            # observe reward
-            reward = staying_time_start - int1.cumultative_staying_time()
-            print('reward: ', reward) # TODO
-
-            # get next state
-            next_state = int1.get_state()
+            with instrumentation.phase('choose_action'):
+                int1_action = agent.choose_action(int1_state)
+
+            # execute action, observe reward and get next state
+            next_state, reward, done, info = env.step(int1_action)
+            metrics.log_step(ep + 1, env.current_step(), int1_action, reward, info['queue'], info['staying_time'])
 
             # update weights
-            agent1.add_experience(int1_state, int1_action, reward, next_state, False)
-            agent1.replay_experience()
-            agent1.soft_update_target_network()
-        
-        mem = agent1._replay_memory[-1]
-        del agent1._replay_memory[-1]
-        agent1._replay_memory.append((mem[0], mem[1], reward, mem[3], True))
+            agent.add_experience(int1_state, int1_action, reward, next_state, False)
+            with instrumentation.phase('replay_experience'):
+                agent.replay_experience()
+            int1_state = next_state
+
+        agent.mark_last_experience_terminal()
+        instrumentation.end_episode()
 
         end_time = timeit.default_timer()
         execution_time = end_time - start_time
 
-        log.write('episode: ' + str(ep + 1) + ',  Sum of staying times: ' + str(int1.sum_of_staying_times()) + ', average highway speed: ' + str(average_highway_speed(highway_speeds)) + ', Execution time: ' + str(execution_time) + '\n')
-        log.close()
+        record = dict(sum_of_staying_times=info['sum_of_staying_times'],
+                      average_highway_speed=info['average_highway_speed'], execution_time=execution_time)
+        metrics.log_episode(episode=ep + 1, **record)
+        if end_episode is not None:
+            end_episode(ep + 1, record)
 
-        int1.reset_staying_time_info()
+if __name__ == '__main__':
+    options = get_options()
+    random.seed(0) # set the seed for reproducible test results
+
+    time_steps = 3600
+    episodes = 20
+
+    # episodes start after the warm-up, so the routes cover both
+    traffic_gen = TrafficGenerator(time_steps + options.warm_up_steps)
+
+    if options.routes_only:
+        # fill the route cache without running SUMO
+        for ep in range(episodes):
+            start_time = timeit.default_timer()
+            traffic_gen.generate_routefile(ep)
+            print('episode:', ep + 1, 'generation time:', timeit.default_timer() - start_time)
+        raise SystemExit
+
+    agent_params = dict(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002, 
+                        memory_capacity=options.memory_capacity, action_size=2, batch_size=32, update_rate=0.001,
+                        target_sync=options.target_sync, hard_update_interval=options.hard_update_interval)
+    # the rollout workers get agent_params and keep no replay memory of their own on disk
+    agent1 = DQNAgent(**agent_params, replay_directory=options.replay_dir, replay_hot_window=options.replay_hot_window)
+
+    if options.instrument or options.profile_episodes:
+        profile_episodes = [int(ep) for ep in options.profile_episodes.split(',') if ep]
+        instrumentation.enable(options.instrument_report, profile_episodes, options.profile_mode)
+        instrumentation.instrument_agent(agent1)
+
+    first_episode = 0
+    run_dir = options.run_dir
+    if options.resume:
+        run_dir = latest_run(options.checkpoint_dir)
+        if run_dir is None:
+            raise SystemExit('no checkpoint to resume in %s' % options.checkpoint_dir)
+    checkpoints = CheckpointManager(options.checkpoint_dir, keep=options.keep_checkpoints, run_id=run_dir)
+    if options.resume:
+        # the weights, replay memory, optimizer, exploration and random states as they were after the episode
+        checkpoint = checkpoints.restore(agent1)
+        first_episode = checkpoint['episode']
+        truncate_run(run_dir, checkpoint['extra']['metrics_chunks'])
+        print('resuming after episode', first_episode, 'from', checkpoints.latest())
+    elif os.path.exists('model.weights.h5'):
+        agent1.load_model_weights('model.weights.h5')
+        agent1.save_target_model_weights('target_model.weights.h5')
 
-        traci.close(wait=False)
+    metrics = MetricsWriter(run_dir, verbosity=options.verbosity)
+
+    def end_episode(episode, record):
+        '''
+        Checkpoint the training state every --checkpoint-interval episodes.
+        '''
+        if options.checkpoint_interval > 0 and episode % options.checkpoint_interval == 0:
+            checkpoints.save(agent1, episode, metrics_chunks=metrics.chunk_counts())
+
+    if options.workers > 0:
+        from rollout_workers import train_parallel
+        train_parallel(agent1, agent_params, episodes, time_steps, options.workers, metrics=metrics,
+                       backend_name=options.backend, warm_up_steps=options.warm_up_steps,
+                       state_cache_dir=options.state_cache_dir, end_episode=end_episode)
+    elif options.control_int2:
+        train_multi_intersection(agent1, episodes, time_steps, traffic_gen, options.backend, metrics,
+                                 first_episode=first_episode, end_episode=end_episode,
+                                 warm_up_steps=options.warm_up_steps, state_cache_dir=options.state_cache_dir)
+    else:
+        env = TrafficSignalEnv(time_steps, backend_name=options.backend, warm_up_steps=options.warm_up_steps,
+                               state_cache_dir=options.state_cache_dir)
+        train_single_intersection(agent1, env, episodes, metrics, first_episode=first_episode, end_episode=end_episode)
+        env.close()
+    metrics.close()
+    checkpoints.wait()
     
     agent1.save_model_weigths('model.weights.h5')
     agent1.save_target_model_weights('target_model.weights.h5')
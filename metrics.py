@@ -0,0 +1,170 @@
+'''
+Buffered metrics of training runs. MetricsWriter collects per-step and per-episode records into columns and
+hands full chunks to a background thread that appends them to the run directory as numbered NPZ files, so
+the training loop never waits on the disk. load_run reads a run back as NumPy columns.
+
+    metrics = MetricsWriter(run_dir, verbosity=1)
+    metrics.log_step(episode, step, action, reward, queue, staying_time)
+    metrics.log_episode(episode=1, sum_of_staying_times=..., execution_time=...)
+    metrics.close()
+    steps, episodes = load_run(run_dir)
+'''
+import glob
+import optparse
+import os
+import queue
+import threading
+import numpy as np
+
+# columns of the per-step records
+STEP_COLUMNS = {'episode': np.int32, 'step': np.int32, 'intersection': np.int16, 'action': np.int8, 'reward': np.float64,
+                'queue': np.int32, 'staying_time': np.int64}
+
+# console verbosity: nothing, one line per episode, and one line per step as well
+QUIET, EPISODES, STEPS = 0, 1, 2
+
+
+class MetricsWriter:
+    def __init__(self, run_dir, chunk_size=4096, verbosity=EPISODES):
+        os.makedirs(run_dir, exist_ok=True)
+        self._run_dir = run_dir
+        self._chunk_size = chunk_size
+        self._verbosity = verbosity
+        self._steps = {name: [] for name in STEP_COLUMNS}
+        self._chunk_indices = {'steps': self._next_chunk_index('steps'), 'episodes': self._next_chunk_index('episodes')}
+        self._chunks = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer.start()
+
+    def _next_chunk_index(self, kind):
+        '''
+        Return the index of the next chunk of a kind, so a resumed run appends after the existing chunks.
+        '''
+        return len(glob.glob(os.path.join(self._run_dir, kind + '-*.npz')))
+
+    def verbosity(self):
+        '''
+        Return the console verbosity, QUIET, EPISODES or STEPS.
+        '''
+        return self._verbosity
+
+    def log_step(self, episode, step, action, reward, queue, staying_time, intersection=0):
+        '''
+        Record an action of an intersection with the simulation step it finished at, its reward, and the
+        queue length and cumulative staying time then.
+        '''
+        steps = self._steps
+        steps['episode'].append(episode)
+        steps['step'].append(step)
+        steps['intersection'].append(intersection)
+        steps['action'].append(action)
+        steps['reward'].append(reward)
+        steps['queue'].append(queue)
+        steps['staying_time'].append(staying_time)
+        if self._verbosity >= STEPS:
+            print('episode: %d, step: %d, intersection: %d, action: %d, reward: %s, queue: %d'
+                  % (episode, step, intersection, action, reward, queue))
+        if len(steps['step']) >= self._chunk_size:
+            self._flush_steps()
+
+    def log_episode(self, **record):
+        '''
+        Record the results of an episode, given as keyword arguments of numbers. It is written right away.
+        '''
+        if self._verbosity >= EPISODES:
+            print(', '.join('%s: %s' % item for item in record.items()))
+        self._flush_steps()
+        self._put('episodes', {name: np.asarray([value]) for name, value in record.items()})
+
+    def _flush_steps(self):
+        '''
+        Hand the buffered steps to the writer thread.
+        '''
+        if not self._steps['step']:
+            return
+        self._put('steps', {name: np.asarray(values, dtype=STEP_COLUMNS[name]) for name, values in self._steps.items()})
+        self._steps = {name: [] for name in STEP_COLUMNS}
+
+    def _put(self, kind, columns):
+        self._chunks.put((kind, self._chunk_indices[kind], columns))
+        self._chunk_indices[kind] += 1
+
+    def _write_chunks(self):
+        # runs in the writer thread until close puts None
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                continue
+            kind, index, columns = chunk
+            path = os.path.join(self._run_dir, '%s-%06d.npz' % (kind, index))
+            try:
+                # a reader never sees a partial chunk
+                with open(path + '.tmp', 'wb') as chunk_file:
+                    np.savez(chunk_file, **columns)
+                os.replace(path + '.tmp', path)
+            except OSError as error:
+                # raised by close, the training loop is not interrupted
+                self._error = error
+
+    def chunk_counts(self):
+        '''
+        Return the number of chunks of each kind handed to the writer, to truncate the run back to with
+        truncate_run when training resumes from a checkpoint.
+        '''
+        self._flush_steps()
+        return dict(self._chunk_indices)
+
+    def close(self):
+        '''
+        Write the buffered steps and wait until every chunk is on disk. Raises the error of a failed write.
+        '''
+        self._flush_steps()
+        self._chunks.put(None)
+        self._writer.join()
+        if self._error is not None:
+            raise self._error
+
+
+def load_run(run_dir):
+    '''
+    Load the steps and episodes of a run as dictionaries of NumPy columns.
+    '''
+    return _load_chunks(run_dir, 'steps'), _load_chunks(run_dir, 'episodes')
+
+
+def truncate_run(run_dir, chunk_counts):
+    '''
+    Remove the chunks written after chunk_counts was taken, i.e. the records of episodes that are run again.
+    '''
+    for kind, count in chunk_counts.items():
+        for path in sorted(glob.glob(os.path.join(run_dir, kind + '-*.npz')))[count:]:
+            os.remove(path)
+
+
+def _load_chunks(run_dir, kind):
+    '''
+    Concatenate the columns of the chunks of a kind in the order they were written.
+    '''
+    columns = {}
+    for path in sorted(glob.glob(os.path.join(run_dir, kind + '-*.npz'))):
+        with np.load(path) as chunk:
+            for name in chunk.files:
+                columns.setdefault(name, []).append(chunk[name])
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+
+if __name__ == '__main__':
+    # print the episodes of a run
+    opt_parser = optparse.OptionParser(usage='%prog run_dir')
+    options, args = opt_parser.parse_args()
+    if len(args) != 1:
+        opt_parser.error('expected the run directory')
+    steps, episodes = load_run(args[0])
+    names = list(episodes)
+    print(' '.join('%22s' % name for name in names))
+    for i in range(len(episodes[names[0]]) if names else 0):
+        print(' '.join('%22s' % episodes[name][i] for name in names))
+    print('%d decision steps' % len(steps.get('step', [])))
@@ -0,0 +1,84 @@
+from phase_scheduler import PhaseScheduler
+from traffic_signal_env import phase_program, stack_states
+
+
+class MultiIntersectionController:
+    def __init__(self, agent, intersections):
+        self._agent = agent
+        self._intersections = list(intersections)
+        self._states = [None] * len(self._intersections)
+        self._actions = [None] * len(self._intersections)
+        self._staying_time_starts = [0] * len(self._intersections)
+        self._staying_time_ends = [0] * len(self._intersections)
+        self._scheduler = PhaseScheduler([intersection.tls_id() for intersection in self._intersections])
+
+    def num_intersections(self):
+        '''
+        Return the number of controlled intersections.
+        '''
+        return len(self._intersections)
+
+    def reset(self):
+        '''
+        Subscribe to the intersections of a newly started simulation and observe their first states.
+        '''
+        for i, intersection in enumerate(self._intersections):
+            intersection.subscribe()
+            intersection.reset_staying_time_info()
+            self._states[i] = intersection.get_state()
+        self._scheduler.reset()
+
+    def states(self):
+        '''
+        Return the current state of every intersection.
+        '''
+        return list(self._states)
+
+    def decide(self):
+        '''
+        Choose the next action of every intersection whose phase program has finished with a single
+        batched forward pass of the agent. Returns the indices of the intersections that decided.
+        '''
+        waiting = [i for i in range(len(self._intersections)) if self._scheduler.finished(i)]
+        if not waiting:
+            return waiting
+        actions = self._agent.choose_actions(stack_states([self._states[i] for i in waiting]))
+        for i, action in zip(waiting, actions):
+            self._actions[i] = action
+            self._staying_time_starts[i] = self._intersections[i].cumultative_staying_time()
+            self._scheduler.start(i, phase_program(action, self._states[i]))
+        return waiting
+
+    def step(self):
+        '''
+        Advance the simulation by one step, running the phase program of every intersection independently.
+        Returns the (index, state, action, reward, next_state) transitions of the intersections whose
+        action finished with this step.
+        '''
+        self.decide()
+        self._scheduler.step()
+
+        transitions = []
+        for i, intersection in enumerate(self._intersections):
+            intersection.update_staying_times()
+            if self._scheduler.finished(i):
+                # observe reward and next state
+                self._staying_time_ends[i] = intersection.cumultative_staying_time()
+                reward = self._staying_time_starts[i] - self._staying_time_ends[i]
+                next_state = intersection.get_state()
+                transitions.append((i, self._states[i], self._actions[i], reward, next_state))
+                self._states[i] = next_state
+        return transitions
+
+    def last_staying_time(self, i):
+        '''
+        Return the cumultative staying time of the vehicles at intersection i read when its last action
+        finished. Reading it again would add it to the sum of staying times a second time.
+        '''
+        return self._staying_time_ends[i]
+
+    def sum_of_staying_times(self):
+        '''
+        Return the sum of staying times of every intersection across the episode.
+        '''
+        return [intersection.sum_of_staying_times() for intersection in self._intersections]
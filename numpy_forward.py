@@ -0,0 +1,38 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def conv2d_relu(inputs, kernel, bias, stride):
+    '''
+    Valid 2D convolution followed by relu of (batch, height, width, channels) inputs with a Keras
+    (kernel height, kernel width, channels, filters) kernel.
+    '''
+    kernel_height, kernel_width, channels, filters = kernel.shape
+    # (batch, out height, out width, channels, kernel height, kernel width) views of the receptive fields
+    windows = sliding_window_view(inputs, (kernel_height, kernel_width), axis=(1, 2))[:, ::stride, ::stride]
+    batch_size, out_height, out_width = windows.shape[:3]
+    columns = windows.transpose(0, 1, 2, 4, 5, 3).reshape(batch_size * out_height * out_width, -1)
+    outputs = np.maximum(columns @ kernel.reshape(-1, filters) + bias, 0)
+    return outputs.reshape(batch_size, out_height, out_width, filters)
+
+
+def q_network_forward(weights, states):
+    '''
+    Forward pass of the Q-network of DQNAgent._build_model in NumPy. weights is the list returned by
+    get_weights: the first and second convolutions of the position and speed towers in the order the
+    layers are created, then the three dense layers.
+    '''
+    (position_kernel_1, position_bias_1, speed_kernel_1, speed_bias_1, position_kernel_2, position_bias_2,
+     speed_kernel_2, speed_bias_2, kernel_3, bias_3, kernel_4, bias_4, output_kernel, output_bias) = weights
+    position, speed, light = [np.asarray(x, dtype=np.float32) for x in states]
+    batch_size = len(position)
+
+    position_L1 = conv2d_relu(position, position_kernel_1, position_bias_1, stride=2)
+    position_L3 = conv2d_relu(position_L1, position_kernel_2, position_bias_2, stride=1).reshape(batch_size, -1)
+    speed_L1 = conv2d_relu(speed, speed_kernel_1, speed_bias_1, stride=2)
+    speed_L3 = conv2d_relu(speed_L1, speed_kernel_2, speed_bias_2, stride=1).reshape(batch_size, -1)
+
+    input_L3 = np.concatenate([position_L3, speed_L3, light.reshape(batch_size, -1)], axis=1)
+    L3 = np.maximum(input_L3 @ kernel_3 + bias_3, 0)
+    L4 = np.maximum(L3 @ kernel_4 + bias_4, 0)
+    return L4 @ output_kernel + output_bias
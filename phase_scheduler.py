@@ -0,0 +1,62 @@
+'''
+Run the phase programs of traffic signals. A program is a list of (phase, duration) pairs, e.g. yellow for
+6 steps then green for 10. The scheduler sets a phase once, when it begins, and holds it for its duration
+with setPhaseDuration, so the static program of the network cannot switch it early, instead of setting
+the same phase before every simulation step. Between phase changes a step is one simulationStep, whose
+answer carries the subscription results the step needs.
+
+    scheduler = PhaseScheduler([TLS_INT1_ID, TLS_INT2_ID])
+    scheduler.start(0, [(1, 6), (2, 10), (3, 6), (4, 10)])
+    while not scheduler.finished(0):
+        scheduler.step()
+'''
+from collections import deque
+import backend
+
+
+def program_duration(program):
+    '''
+    Return the number of simulation steps a phase program runs for.
+    '''
+    return sum(duration for phase, duration in program)
+
+
+class PhaseScheduler:
+    def __init__(self, tls_ids):
+        self._tls_ids = list(tls_ids)
+        self.reset()
+
+    def reset(self):
+        '''
+        Drop the programs of all traffic signals, e.g. for a new simulation.
+        '''
+        self._programs = [deque() for tls_id in self._tls_ids]
+        self._remaining = [0] * len(self._tls_ids)
+
+    def start(self, i, program):
+        '''
+        Replace the program of traffic signal i by program, whose first phase begins with the next step.
+        '''
+        self._programs[i] = deque(program)
+        self._remaining[i] = 0
+
+    def finished(self, i):
+        '''
+        Return whether the program of traffic signal i has run all its steps.
+        '''
+        return self._remaining[i] == 0 and not self._programs[i]
+
+    def step(self):
+        '''
+        Set the phases that begin with this step and advance the simulation by one step.
+        '''
+        for i, tls_id in enumerate(self._tls_ids):
+            if self._remaining[i] == 0 and self._programs[i]:
+                phase, duration = self._programs[i].popleft()
+                backend.trafficlight.setPhase(tls_id, phase)
+                backend.trafficlight.setPhaseDuration(tls_id, duration)
+                self._remaining[i] = duration
+        backend.simulationStep()
+        for i, remaining in enumerate(self._remaining):
+            if remaining:
+                self._remaining[i] = remaining - 1
@@ -0,0 +1,399 @@
+'''
+Serve the greedy policy of trained model weights to live signal controllers. The weights are loaded once,
+and an HTTP endpoint on a TCP port or a Unix socket answers the state of an intersection with its action
+and action values. Concurrent requests from many junctions are coalesced into micro-batches: the batch
+is run once its first request has waited for the latency budget or it is full, whichever comes first,
+so a single forward pass answers all of them. The server keeps the throughput and latency percentiles of
+the recent requests.
+
+    python policy_server.py --weights model.weights.h5 --address 127.0.0.1:8765
+    python policy_server.py --weights model.weights.h5 --address /tmp/policy.sock --max-delay-ms 2
+
+    POST /act      {"position": 12x12, "speed": 12x12, "light": [ns, we]}
+                   -> {"action": 1, "q_values": [-3.2, -1.7]}
+    GET /metrics   requests, batches, mean batch size, requests per second and latency percentiles
+
+benchmarks/policy_server_benchmark.py is a load generator for a running server.
+'''
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http.client
+import json
+import optparse
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import timeit
+import numpy as np
+
+# the agent parameters of main.py that shape the network, greedy and without replay
+AGENT_PARAMS = dict(discount_rate=0.95, exploration_rate=0.0, learning_rate=0.0002, memory_capacity=1, action_size=2,
+                    batch_size=32, update_rate=0.001)
+
+GRID_SHAPE = (12, 12)
+
+
+def parse_address(address):
+    '''
+    Return (host, port) of a 'host:port' address, or the path of a Unix socket.
+    '''
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and '/' not in address:
+        return host, int(port)
+    return address
+
+
+def encode_state(state):
+    '''
+    Return the JSON request of a [position, speed, light] state as returned by Intersection.get_state.
+    '''
+    position, speed, light = state
+    return dict(position=np.asarray(position).reshape(GRID_SHAPE).tolist(),
+                speed=np.asarray(speed).reshape(GRID_SHAPE).tolist(),
+                light=np.asarray(light).reshape(2).tolist())
+
+
+def decode_state(request):
+    '''
+    Return the [position, speed, light] state of a JSON request. Raises ValueError for a malformed one.
+    '''
+    try:
+        position = np.asarray(request['position'], dtype=np.float32)
+        speed = np.asarray(request['speed'], dtype=np.float32)
+        light = np.asarray(request['light'], dtype=np.float32)
+    except (KeyError, TypeError) as error:
+        raise ValueError('a state needs position, speed and light: %s' % error)
+    if position.shape != GRID_SHAPE or speed.shape != GRID_SHAPE or light.shape != (2,):
+        raise ValueError('expected 12x12 position and speed grids and 2 light values, got %s, %s and %s'
+                         % (position.shape, speed.shape, light.shape))
+    return [position.reshape(1, 12, 12, 1), speed.reshape(1, 12, 12, 1), light.reshape(1, 2, 1)]
+
+
+class ServingStats:
+    def __init__(self, window_seconds=10.0):
+        # throughput and latency percentiles are of the requests answered in the last window_seconds
+        self._window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._start_time = timeit.default_timer()
+        self._recent = deque()
+        self._requests = 0
+        self._batches = 0
+        self._inference_time = 0.0
+
+    def record_batch(self, latencies, inference_time):
+        '''
+        Record a batch answered now, with the latency of each of its requests in seconds.
+        '''
+        now = timeit.default_timer()
+        with self._lock:
+            self._requests += len(latencies)
+            self._batches += 1
+            self._inference_time += inference_time
+            self._recent.extend((now, latency) for latency in latencies)
+            while self._recent[0][0] < now - self._window_seconds:
+                self._recent.popleft()
+
+    def snapshot(self):
+        '''
+        Return the counters since the start and the throughput and latencies of the recent requests.
+        '''
+        now = timeit.default_timer()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - self._window_seconds:
+                self._recent.popleft()
+            latencies = np.array([latency for time, latency in self._recent])
+            snapshot = dict(requests=self._requests, batches=self._batches,
+                            mean_batch_size=self._requests / max(self._batches, 1),
+                            mean_inference_ms=self._inference_time / max(self._batches, 1) * 1e3)
+        window = min(self._window_seconds, now - self._start_time)
+        snapshot['requests_per_second'] = len(latencies) / window if window > 0 else 0.0
+        for name, percentile in [('latency_p50_ms', 50), ('latency_p99_ms', 99)]:
+            snapshot[name] = float(np.percentile(latencies, percentile)) * 1e3 if len(latencies) else None
+        return snapshot
+
+
+class MicroBatcher:
+    def __init__(self, q_values, max_batch_size=32, max_delay=0.002, stats=None):
+        # q_values maps a batch of states to their action values and is only called from the batching
+        # thread, so it needs not be thread safe
+        self._q_values = q_values
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._stats = stats if stats is not None else ServingStats()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        '''
+        Return the ServingStats of the answered requests.
+        '''
+        return self._stats
+
+    def submit(self, state):
+        '''
+        Queue a single state and return a Future of its action values.
+        '''
+        future = Future()
+        self._queue.put((timeit.default_timer(), state, future))
+        return future
+
+    def _next_batch(self):
+        '''
+        Wait for a request and return it with the ones that arrive until it has waited for the latency
+        budget or the batch is full, or None when the batcher is closed.
+        '''
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[0] + self._max_delay
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - timeit.default_timer()
+            try:
+                # past the deadline the requests already queued still join the batch
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        # the batching thread: one forward pass per batch
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            states = [np.concatenate([state[i] for arrival, state, future in batch]) for i in range(3)]
+            start_time = timeit.default_timer()
+            try:
+                q_values = self._q_values(states)
+            except Exception as error:
+                for arrival, state, future in batch:
+                    future.set_exception(error)
+                continue
+            end_time = timeit.default_timer()
+            for (arrival, state, future), values in zip(batch, q_values):
+                future.set_result(values)
+            self._stats.record_batch([end_time - arrival for arrival, state, future in batch], end_time - start_time)
+
+    def close(self):
+        '''
+        Answer the queued requests and stop the batching thread.
+        '''
+        self._queue.put(None)
+        self._thread.join()
+
+
+class PolicyRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive connections, a junction sends all its decisions over one
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # the headers and the body are written separately, Nagle's algorithm would hold the body back on
+        # TCP until the client acknowledges the headers
+        self.disable_nagle_algorithm = self.server.address_family != socket.AF_UNIX
+        super().setup()
+
+    def _reply(self, status, body):
+        '''
+        Send a JSON response.
+        '''
+        data = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != '/act':
+            self._reply(404, dict(error='unknown path %s' % self.path))
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            state = decode_state(json.loads(body))
+        except ValueError as error:
+            self._reply(400, dict(error=str(error)))
+            return
+        try:
+            q_values = self.server.batcher.submit(state).result()
+        except Exception as error:
+            self._reply(500, dict(error='%s: %s' % (type(error).__name__, error)))
+            return
+        self._reply(200, dict(action=int(np.argmax(q_values)), q_values=q_values.tolist()))
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self._reply(404, dict(error='unknown path %s' % self.path))
+            return
+        self._reply(200, self.server.batcher.stats().snapshot())
+
+    def log_message(self, format, *args):
+        # no line per request
+        pass
+
+
+# connections from many junctions at once must not overflow the listen backlog
+REQUEST_QUEUE_SIZE = 128
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+    def server_bind(self):
+        # a socket file left by a server that did not shut down cleanly would make bind fail
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+    def get_request(self):
+        # the handler expects a (host, port) client address
+        request, client_address = super().get_request()
+        return request, ('unix', 0)
+
+
+def make_server(address, batcher):
+    '''
+    Return an HTTP server of the policy on a 'host:port' address or a Unix socket path.
+    '''
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        server = _HTTPServer(address, PolicyRequestHandler)
+    else:
+        server = _UnixHTTPServer(address, PolicyRequestHandler)
+    server.batcher = batcher
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # a blocking connect waits for a full backlog, one with a timeout fails at once
+        self.sock.connect(self._path)
+        self.sock.settimeout(self.timeout)
+
+
+class PolicyClient:
+    def __init__(self, address, timeout=10.0):
+        # one keep-alive connection, not thread safe: use one client per thread
+        address = parse_address(address)
+        if isinstance(address, tuple):
+            self._connection = http.client.HTTPConnection(*address, timeout=timeout)
+        else:
+            self._connection = _UnixHTTPConnection(address, timeout)
+
+    def _request(self, method, path, body=None):
+        '''
+        Send a request and return its decoded JSON response. Raises RuntimeError for an error response.
+        '''
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self._connection.request(method, path, body=body, headers=headers)
+        response = self._connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError('%s %s: %d %s' % (method, path, response.status, result.get('error')))
+        return result
+
+    def act(self, state):
+        '''
+        Return the action and action values of a [position, speed, light] state.
+        '''
+        result = self._request('POST', '/act', json.dumps(encode_state(state)))
+        return result['action'], result['q_values']
+
+    def metrics(self):
+        '''
+        Return the metrics of the server.
+        '''
+        return self._request('GET', '/metrics')
+
+    def close(self):
+        '''
+        Close the connection.
+        '''
+        self._connection.close()
+
+
+def report_metrics(stats, interval, stop):
+    '''
+    Print the metrics every interval seconds until stop is set.
+    '''
+    while not stop.wait(interval):
+        snapshot = stats.snapshot()
+        if snapshot['latency_p50_ms'] is not None:
+            print('%d requests in %d batches, %.1f requests/s, mean batch %.1f, latency p50 %.2f ms p99 %.2f ms'
+                  % (snapshot['requests'], snapshot['batches'], snapshot['requests_per_second'],
+                     snapshot['mean_batch_size'], snapshot['latency_p50_ms'], snapshot['latency_p99_ms']), flush=True)
+
+
+def get_options():
+    '''
+    Parse the command line options.
+    '''
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option('--weights', default='model.weights.h5', help='model weights of the served policy')
+    opt_parser.add_option('--address', default='127.0.0.1:8765', help='host:port or Unix socket path to listen on')
+    opt_parser.add_option('--inference', choices=['compiled', 'numpy'], default='numpy',
+                          help='forward pass of the batches, see DQNAgent')
+    opt_parser.add_option('--max-batch-size', type='int', default=32, help='most states answered by one forward pass')
+    opt_parser.add_option('--max-delay-ms', type='float', default=2.0,
+                          help='latency budget: longest a request waits for others to join its batch')
+    opt_parser.add_option('--threads', type='int', default=1,
+                          help='TensorFlow and math library threads of a forward pass')
+    opt_parser.add_option('--report-interval', type='float', default=10.0,
+                          help='seconds between printed metrics (0 never prints)')
+    options, args = opt_parser.parse_args()
+    if not os.path.exists(options.weights):
+        opt_parser.error('no model weights %s' % options.weights)
+    return options
+
+
+if __name__ == '__main__':
+    options = get_options()
+    for variable in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ.setdefault(variable, str(options.threads))
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(options.threads)
+    tf.config.threading.set_inter_op_parallelism_threads(options.threads)
+    from dqn_agent import DQNAgent
+
+    agent = DQNAgent(inference=options.inference, **AGENT_PARAMS)
+    agent.load_model_weights(options.weights)
+    # the first forward pass traces or snapshots the weights, not a request
+    agent.q_values(decode_state(dict(position=np.zeros(GRID_SHAPE), speed=np.zeros(GRID_SHAPE), light=[1, 0])))
+    batcher = MicroBatcher(agent.q_values, options.max_batch_size, options.max_delay_ms / 1e3)
+    server = make_server(options.address, batcher)
+    stop = threading.Event()
+    if options.report_interval > 0:
+        threading.Thread(target=report_metrics, args=(batcher.stats(), options.report_interval, stop),
+                         daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print('serving %s on %s' % (options.weights, options.address), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        batcher.close()
+        if not isinstance(parse_address(options.address), tuple):
+            os.remove(options.address)
@@ -0,0 +1,158 @@
+'''
+A simulation backend that replays an episode recorded by episode_trace.TraceRecorder through the parts of
+the TraCI API the project uses. The replay is open loop: the recorded vehicles and phases are served
+whatever phases are set, so it suits evaluating encoders and policies on fixed traffic and benchmarking,
+not closed-loop training. Select it with backend.select_backend('replay') after choosing the trace with
+configure; stepping past the last frame keeps serving it with no vehicles expected.
+'''
+import traci.constants as tc
+from episode_trace import EpisodeTrace
+
+_trace_dir = None
+_trace = None
+_frame = 0
+_frame_vehicles = None
+
+
+def configure(trace_dir):
+    '''
+    Set the trace directory served by the following simulations.
+    '''
+    global _trace_dir
+    _trace_dir = trace_dir
+
+
+def _last_frame():
+    '''
+    Return the frame served, the last one once the replay stepped past it.
+    '''
+    return min(_frame, _trace.num_frames() - 1)
+
+
+def _vehicle_ids(edgeID):
+    '''
+    Return the IDs of the vehicles on an edge in the served frame.
+    '''
+    rows = _trace.edge_rows(_last_frame(), edgeID)
+    return tuple(_trace.vehicle_id(vehicle) for vehicle in _trace.column('vehicle')[rows].tolist())
+
+
+def _vehicle_variables(vehID):
+    '''
+    Return the lane index, position and speed of a vehicle in the served frame as subscription results.
+    '''
+    global _frame_vehicles
+    if _frame_vehicles is None:
+        # index the vehicles of the current frame the first time one of them is looked up
+        rows = _trace.frame_rows(_last_frame())
+        _frame_vehicles = {_trace.vehicle_id(vehicle): row
+                           for row, vehicle in zip(range(rows.start, rows.stop), _trace.column('vehicle')[rows].tolist())}
+    row = _frame_vehicles[vehID]
+    return {tc.VAR_LANE_INDEX: int(_trace.column('lane')[row]),
+            tc.VAR_POSITION: (float(_trace.column('x')[row]), float(_trace.column('y')[row])),
+            tc.VAR_SPEED: float(_trace.column('speed')[row])}
+
+
+class _EdgeDomain:
+    def subscribe(self, edgeID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, edgeID):
+        return {tc.LAST_STEP_VEHICLE_ID_LIST: _vehicle_ids(edgeID)}
+
+    def getLastStepVehicleIDs(self, edgeID):
+        return _vehicle_ids(edgeID)
+
+    def subscribeContext(self, edgeID, domain, dist, varIDs):
+        pass
+
+    def getContextSubscriptionResults(self, edgeID):
+        # only the vehicles on the edge, whatever the range
+        return {vehID: {tc.VAR_ROAD_ID: edgeID, tc.VAR_SPEED: _vehicle_variables(vehID)[tc.VAR_SPEED]}
+                for vehID in _vehicle_ids(edgeID)}
+
+
+class _VehicleDomain:
+    def subscribe(self, vehID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, vehID):
+        return _vehicle_variables(vehID)
+
+    def getLaneIndex(self, vehID):
+        return _vehicle_variables(vehID)[tc.VAR_LANE_INDEX]
+
+    def getPosition(self, vehID):
+        return _vehicle_variables(vehID)[tc.VAR_POSITION]
+
+    def getSpeed(self, vehID):
+        return _vehicle_variables(vehID)[tc.VAR_SPEED]
+
+
+class _JunctionDomain:
+    def getPosition(self, junctionID):
+        return _trace.junction_position(junctionID)
+
+
+class _TrafficLightDomain:
+    def subscribe(self, tlsID, varIDs):
+        pass
+
+    def getSubscriptionResults(self, tlsID):
+        return {tc.TL_CURRENT_PHASE: _trace.phase(_last_frame(), tlsID)}
+
+    def getPhase(self, tlsID):
+        return _trace.phase(_last_frame(), tlsID)
+
+    def setPhase(self, tlsID, index):
+        # open loop, the recorded phases are served
+        pass
+
+    def setPhaseDuration(self, tlsID, duration):
+        pass
+
+
+class _SimulationDomain:
+    def getMinExpectedNumber(self):
+        if _frame >= _trace.num_frames():
+            return 0
+        return _trace.expected(_frame)
+
+    def getTime(self):
+        return float(_frame)
+
+
+edge = _EdgeDomain()
+vehicle = _VehicleDomain()
+junction = _JunctionDomain()
+trafficlight = _TrafficLightDomain()
+simulation = _SimulationDomain()
+
+
+def start(cmd):
+    '''
+    Start serving the configured trace from frame 0. The sumo command is ignored.
+    '''
+    global _trace, _frame, _frame_vehicles
+    if _trace_dir is None:
+        raise RuntimeError('no trace configured, call replay_backend.configure first')
+    _trace = EpisodeTrace(_trace_dir)
+    _frame = 0
+    _frame_vehicles = None
+
+
+def simulationStep():
+    '''
+    Advance to the next recorded frame.
+    '''
+    global _frame, _frame_vehicles
+    _frame += 1
+    _frame_vehicles = None
+
+
+def close():
+    '''
+    Stop serving the trace.
+    '''
+    global _trace
+    _trace = None
@@ -0,0 +1,361 @@
+import mmap
+import os
+import random
+import shutil
+import numpy as np
+
+# the columns of a memory, one row per transition
+COLUMNS = ['positions', 'speeds', 'lights', 'next_positions', 'next_speeds', 'next_lights', 'actions', 'rewards', 'dones']
+
+
+class ReplayMemory:
+    def __init__(self, capacity, grid_size=12, speed_dtype=np.float16, directory=None, hot_window=0):
+        self._capacity = capacity
+        self._size = 0
+        self._next_index = 0
+        self._added = 0
+        self._directory = directory
+        self._hot_window = min(hot_window, capacity) if directory is not None else 0
+
+        grid = (grid_size, grid_size)
+        dtypes = dict(positions=(np.uint8, grid), speeds=(speed_dtype, grid), lights=(np.uint8, ()),
+                      next_positions=(np.uint8, grid), next_speeds=(speed_dtype, grid), next_lights=(np.uint8, ()),
+                      actions=(np.uint8, ()), rewards=(np.float32, ()), dones=(bool, ()))
+        # preallocated columns, one row per transition, in RAM or, given a directory, in memory-mapped .npy
+        # files there so the capacity is bounded by disk rather than heap; a disk-backed memory also keeps
+        # its hot_window most recent transitions in RAM, where sampling them reads no page of the files
+        self._columns = {}
+        self._hot = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            dtype, shape = dtypes[name]
+            if directory is None:
+                self._columns[name] = np.zeros((capacity,) + shape, dtype=dtype)
+            else:
+                # the file is sparse until rows are written
+                self._columns[name] = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+',
+                                                                dtype=dtype, shape=(capacity,) + shape)
+                if hasattr(mmap, 'MADV_RANDOM'):
+                    # sampled rows are scattered, read ahead pages would mostly be wasted
+                    self._columns[name]._mmap.madvise(mmap.MADV_RANDOM)
+            if self._hot_window:
+                self._hot[name] = np.zeros((self._hot_window,) + shape, dtype=dtype)
+        # a disk-backed memory keeps a copy of its column files as of the last snapshot, which the next
+        # snapshot brings up to date with the rows added since instead of copying the whole files again, at
+        # the cost of twice the disk space
+        self._snapshot_columns = {}
+        self._snapshot_added = 0
+        if directory is not None:
+            os.makedirs(os.path.join(directory, 'snapshot'), exist_ok=True)
+            for name, column in self._columns.items():
+                self._snapshot_columns[name] = np.lib.format.open_memmap(
+                    os.path.join(directory, 'snapshot', name + '.npy'), mode='w+', dtype=column.dtype, shape=column.shape)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, state, action, reward, next_state, done):
+        '''
+        Add a transition, overwriting the oldest one once the memory is full.
+        '''
+        i = self._next_index
+        columns = self._columns
+        columns['positions'][i] = state[0].reshape(columns['positions'].shape[1:])
+        columns['speeds'][i] = state[1].reshape(columns['speeds'].shape[1:])
+        columns['lights'][i] = state[2].flat[1]     # light state [0, 1] (NS green) is stored as a 1 bit
+        columns['next_positions'][i] = next_state[0].reshape(columns['positions'].shape[1:])
+        columns['next_speeds'][i] = next_state[1].reshape(columns['speeds'].shape[1:])
+        columns['next_lights'][i] = next_state[2].flat[1]
+        columns['actions'][i] = action
+        columns['rewards'][i] = reward
+        columns['dones'][i] = done
+        if self._hot_window:
+            slot = self._added % self._hot_window
+            for name, hot in self._hot.items():
+                hot[slot] = columns[name][i]
+
+        self._next_index = (i + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+        self._added += 1
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        '''
+        Add a batch of transitions given as batched model inputs, as stack_states returns them, with one
+        contiguous write per column. Returns the indices they were stored at.
+        '''
+        n = len(actions)
+        if n > self._capacity:
+            raise ValueError('batch of %d transitions exceeds the capacity %d' % (n, self._capacity))
+        indices = (self._next_index + np.arange(n)) % self._capacity
+        shape = self._columns['positions'].shape[1:]
+        values = dict(positions=np.reshape(states[0], (n,) + shape), speeds=np.reshape(states[1], (n,) + shape),
+                      lights=np.reshape(states[2], (n, 2))[:, 1], next_positions=np.reshape(next_states[0], (n,) + shape),
+                      next_speeds=np.reshape(next_states[1], (n,) + shape),
+                      next_lights=np.reshape(next_states[2], (n, 2))[:, 1], actions=actions, rewards=rewards, dones=dones)
+        # at most two contiguous ranges, before and after the end of the ring
+        first = min(n, self._capacity - self._next_index)
+        for name, value in values.items():
+            column = self._columns[name]
+            column[self._next_index:self._next_index + first] = value[:first]
+            column[:n - first] = value[first:]
+            if self._hot_window:
+                slots = (self._added + np.arange(max(0, n - self._hot_window), n)) % self._hot_window
+                self._hot[name][slots] = value[max(0, n - self._hot_window):]
+
+        self._next_index = (self._next_index + n) % self._capacity
+        self._size = min(self._size + n, self._capacity)
+        self._added += n
+        return indices
+
+    def mark_last_terminal(self):
+        '''
+        Mark the most recently added transition as the end of an episode.
+        '''
+        if self._size > 0:
+            self._columns['dones'][(self._next_index - 1) % self._capacity] = True
+            if self._hot_window:
+                self._hot['dones'][(self._added - 1) % self._hot_window] = True
+
+    def sample_indices(self, batch_size):
+        '''
+        Sample distinct transition indices uniformly at random.
+        '''
+        return np.array(random.sample(range(self._size), batch_size))
+
+    def gather(self, indices):
+        '''
+        Gather the transitions at the given indices as batched model inputs.
+        '''
+        if self._directory is None:
+            columns = {name: column[indices] for name, column in self._columns.items()}
+        else:
+            columns = {name: self._gather_column(name, indices) for name in COLUMNS}
+        states = self._unpack(columns['positions'], columns['speeds'], columns['lights'])
+        next_states = self._unpack(columns['next_positions'], columns['next_speeds'], columns['next_lights'])
+        return states, columns['actions'], columns['rewards'], next_states, columns['dones']
+
+    def _gather_column(self, name, indices):
+        '''
+        Gather the rows of a column of a disk-backed memory, the recent ones from the hot window and the
+        others from the file in increasing index order, so only their pages are read and in file order.
+        '''
+        indices = np.asarray(indices)
+        column = self._columns[name]
+        rows = np.empty((len(indices),) + column.shape[1:], dtype=column.dtype)
+        hot = np.zeros(len(indices), dtype=bool)
+        if self._hot_window:
+            age = (self._next_index - 1 - indices) % self._capacity
+            hot = age < self._hot_window
+            rows[hot] = self._hot[name][(self._added - 1 - age[hot]) % self._hot_window]
+        cold = np.flatnonzero(~hot)
+        if len(cold):
+            order = cold[np.argsort(indices[cold])]
+            rows[order] = column[indices[order]]
+        return rows
+
+    def sample(self, batch_size):
+        '''
+        Sample a mini-batch of transitions as (states, actions, rewards, next_states, dones).
+        '''
+        return self.gather(self.sample_indices(batch_size))
+
+    def snapshot(self, deferred=False):
+        '''
+        Return copies of the columns and counters as a dictionary of arrays, e.g. for a checkpoint. A
+        disk-backed memory, if deferred, returns a DeferredColumnCopy per column instead, whose save writes
+        the column file as of now. Only the rows added since the last snapshot are copied here, into RAM.
+        '''
+        if self._directory is not None and deferred:
+            # the rows added since the last snapshot and the one before them, which mark_last_terminal may
+            # have changed since
+            n = min(self._added - self._snapshot_added + 1, self._size)
+            indices = (self._next_index - n + np.arange(n)) % self._capacity
+            snapshot = {name: DeferredColumnCopy(self._snapshot_columns[name], indices, self._gather_column(name, indices))
+                        for name in COLUMNS}
+            self._snapshot_added = self._added
+        else:
+            snapshot = {name: column.copy() for name, column in self._columns.items()}
+        snapshot.update(size=np.array(self._size), next_index=np.array(self._next_index))
+        return snapshot
+
+    def restore(self, snapshot):
+        '''
+        Restore the columns and counters from a snapshot of a memory of the same capacity.
+        '''
+        if len(snapshot['actions']) != self._capacity:
+            raise ValueError('snapshot of capacity %d, expected %d' % (len(snapshot['actions']), self._capacity))
+        for name, column in self._columns.items():
+            column[...] = snapshot[name]
+        self._size = int(snapshot['size'])
+        self._next_index = int(snapshot['next_index'])
+        self._added = self._size
+        for name, column in self._snapshot_columns.items():
+            column[...] = self._columns[name]
+        self._snapshot_added = self._added
+        if self._hot_window:
+            # refill the hot window with the most recent transitions
+            recent = (self._next_index - 1 - np.arange(min(self._size, self._hot_window))) % self._capacity
+            slots = (self._added - 1 - np.arange(len(recent))) % self._hot_window
+            for name, hot in self._hot.items():
+                hot[slots] = self._columns[name][recent]
+
+    def nbytes(self):
+        '''
+        Return the number of bytes held by the preallocated columns, in files for a disk-backed memory.
+        '''
+        return sum(column.nbytes for column in self._columns.values())
+
+    def hot_nbytes(self):
+        '''
+        Return the number of bytes of RAM held by the hot window of a disk-backed memory.
+        '''
+        return sum(hot.nbytes for hot in self._hot.values())
+
+    @staticmethod
+    def _unpack(positions, speeds, lights):
+        '''
+        Convert stored columns back to the [position, speed, light] inputs of the Q-network.
+        '''
+        p = positions.astype(np.float32)[..., np.newaxis]
+        v = speeds.astype(np.float32)[..., np.newaxis]
+        l = np.stack([1 - lights, lights], axis=1).astype(np.float32)[..., np.newaxis]
+        return [p, v, l]
+
+
+class DeferredColumnCopy:
+    def __init__(self, base, indices, rows):
+        # base is the snapshot copy of a column file as of the previous snapshot, rows the rows at indices
+        # added since; the copies of one column must be saved in the order they were taken
+        self._base = base
+        self._indices = indices
+        self._rows = rows
+
+    def save(self, path):
+        '''
+        Bring the snapshot copy of the column up to date and copy it to the .npy file path.
+        '''
+        self._base[self._indices] = self._rows
+        self._base.flush()
+        shutil.copyfile(self._base.filename, path)
+
+
+class SumTree:
+    def __init__(self, capacity):
+        # leaves are stored at [leaf_offset, leaf_offset + capacity) of a binary heap laid out in an array
+        self._capacity = capacity
+        self._depth = max(1, int(np.ceil(np.log2(capacity))))
+        self._leaf_offset = 2 ** self._depth
+        self._tree = np.zeros(2 * self._leaf_offset, dtype=np.float64)
+
+    def total(self):
+        '''
+        Return the sum of all priorities.
+        '''
+        return self._tree[1]
+
+    def get(self, indices):
+        '''
+        Return the priorities stored at the given leaves.
+        '''
+        return self._tree[np.asarray(indices) + self._leaf_offset]
+
+    def update(self, indices, priorities):
+        '''
+        Set the priorities of a batch of leaves and recompute their ancestors, O(k log n).
+        '''
+        nodes = np.asarray(indices) + self._leaf_offset
+        self._tree[nodes] = priorities
+        for level in range(self._depth):
+            # recomputing parents from their children makes duplicate indices harmless
+            nodes = np.unique(nodes // 2)
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+
+    def find(self, values):
+        '''
+        Find the leaves whose cumulative priority ranges contain the given values, O(k log n).
+        Returns the leaf indices and their priorities.
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for level in range(self._depth):
+            left = 2 * nodes
+            go_right = values > self._tree[left]
+            values = np.where(go_right, values - self._tree[left], values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self._leaf_offset, self._tree[nodes]
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    def __init__(self, capacity, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-6, **kwargs):
+        super().__init__(capacity, **kwargs)
+        self._alpha = alpha
+        self._beta = beta
+        self._beta_increment = beta_increment
+        self._epsilon = epsilon
+        self._max_priority = 1.0
+        self._tree = SumTree(capacity)
+
+    def add(self, state, action, reward, next_state, done):
+        '''
+        Add a transition with the highest priority seen so far so it is replayed at least once.
+        '''
+        i = super().add(state, action, reward, next_state, done)
+        self._tree.update([i], [self._max_priority ** self._alpha])
+        return i
+
+    def sample_prioritized(self, batch_size):
+        '''
+        Sample a mini-batch proportionally to priority. Returns the transitions, their indices and
+        the normalized importance-sampling weights. sample still samples uniformly, like ReplayMemory.
+        '''
+        # stratified sampling: one value from each of batch_size equal segments of the total priority
+        segment = self._tree.total() / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        indices, priorities = self._tree.find(values)
+        if indices.max() >= self._size:
+            # rounding can step past the last filled leaf
+            indices = np.minimum(indices, self._size - 1)
+            priorities = self._tree.get(indices)
+
+        probabilities = priorities / self._tree.total()
+        weights = (self._size * probabilities) ** -self._beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self._beta = min(1.0, self._beta + self._beta_increment)
+
+        return self.gather(indices), indices, weights
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        '''
+        Add a batch of transitions with the highest priority seen so far.
+        '''
+        indices = super().add_batch(states, actions, rewards, next_states, dones)
+        self._tree.update(indices, np.full(len(indices), self._max_priority ** self._alpha))
+        return indices
+
+    def snapshot(self, deferred=False):
+        '''
+        Return copies of the columns, counters, priorities and annealing state as a dictionary of arrays.
+        '''
+        snapshot = super().snapshot(deferred)
+        snapshot.update(priority_tree=self._tree._tree.copy(), beta=np.array(self._beta),
+                        max_priority=np.array(self._max_priority))
+        return snapshot
+
+    def restore(self, snapshot):
+        '''
+        Restore the memory from a snapshot of a prioritized memory of the same capacity.
+        '''
+        super().restore(snapshot)
+        self._tree._tree[...] = snapshot['priority_tree']
+        self._beta = float(snapshot['beta'])
+        self._max_priority = float(snapshot['max_priority'])
+
+    def update_priorities(self, indices, td_errors):
+        '''
+        Update the priorities of sampled transitions from the absolute TD errors of a mini-batch.
+        '''
+        priorities = np.abs(td_errors) + self._epsilon
+        self._max_priority = max(self._max_priority, priorities.max())
+        self._tree.update(indices, priorities ** self._alpha)
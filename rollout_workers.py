@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import queue
+import random
+import timeit
+from metrics import EPISODES
+from traffic_signal_env import TrafficSignalEnv
+
+# seconds the learner waits for a transition before it checks that the workers are still alive
+WORKER_POLL_SECONDS = 5.0
+
+
+def rollout_worker(worker_id, seeds, time_steps, agent_params, backend_name, transition_queue, weights_queue,
+                   warm_up_steps=0, state_cache_dir=os.path.join('config', 'state_cache')):
+    '''
+    Run the episodes of the given seeds in one SUMO instance with the current epsilon-greedy policy and
+    stream the transitions to the learner. Runs in its own process.
+    '''
+    # keep every worker on one core so that N workers do not oversubscribe the machine
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from dqn_agent import DQNAgent
+
+    random.seed(worker_id)
+    env = TrafficSignalEnv(time_steps, label='worker%d' % worker_id, backend_name=backend_name,
+                           warm_up_steps=warm_up_steps, state_cache_dir=state_cache_dir)
+    # the worker only acts, so the weights change only with a broadcast and the numpy inference path
+    # can keep using its weight snapshot between broadcasts, and it needs no replay memory
+    agent = DQNAgent(**dict(agent_params, inference='numpy', memory_capacity=1))
+    agent.set_model_weights(weights_queue.get())
+
+    for seed in seeds:
+        state = env.reset(seed)
+        pending = None  # the last transition is held back until it is known whether it ends the episode
+
+        start_time = timeit.default_timer()
+        done = False
+        while not done:
+            # use the most recent weights broadcast by the learner
+            weights = None
+            try:
+                while True:
+                    weights = weights_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if weights is not None:
+                agent.set_model_weights(weights)
+
+            action = agent.choose_action(state)
+            next_state, reward, done, info = env.step(action)
+
+            if pending is not None:
+                transition_queue.put(('transition', worker_id, pending))
+            pending = (state, action, reward, next_state, False, seed, env.current_step(), info)
+            state = next_state
+
+        transition_queue.put(('transition', worker_id, pending[:4] + (True,) + pending[5:]))
+        execution_time = timeit.default_timer() - start_time
+        transition_queue.put(('episode', worker_id, (seed, info['sum_of_staying_times'],
+                                                     info['average_highway_speed'], execution_time)))
+
+    env.close()
+    transition_queue.put(('done', worker_id, None))
+
+
+def train_parallel(agent, agent_params, episodes, time_steps, workers, broadcast_interval=10, metrics=None,
+                   backend_name='traci', warm_up_steps=0, state_cache_dir=os.path.join('config', 'state_cache'),
+                   end_episode=None):
+    '''
+    Train the agent from the transitions of parallel rollout workers. The calling process is the learner:
+    it owns the agent, trains on every transition it receives and broadcasts the model weights to the
+    workers every broadcast_interval updates. The steps and episodes are recorded to the metrics writer,
+    if given. end_episode is called with the number of finished episodes and the record of each one as
+    it arrives; the workers finish their episodes out of seed order. Returns the environment steps per second.
+    '''
+    # spawn rather than fork, TensorFlow is not fork safe once it has been initialised
+    context = multiprocessing.get_context('spawn')
+    transition_queue = context.Queue(maxsize=1000)
+    weights_queues = [context.Queue() for i in range(workers)]
+    processes = [context.Process(target=rollout_worker, daemon=True,
+                                 args=(i, list(range(i, episodes, workers)), time_steps, agent_params, backend_name,
+                                       transition_queue, weights_queues[i], warm_up_steps, state_cache_dir))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for weights_queue in weights_queues:
+        weights_queue.put(agent.get_model_weights())
+
+    env_steps = 0
+    updates = 0
+    active = set(range(workers))
+    completed_episodes = 0
+    start_time = None
+    while active:
+        try:
+            kind, worker_id, payload = transition_queue.get(timeout=WORKER_POLL_SECONDS)
+        except queue.Empty:
+            # a worker that crashed or was killed never sends 'done'; one that finished exits with code 0
+            failed = [i for i in active if processes[i].exitcode not in (None, 0)]
+            if failed:
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError('rollout worker %d exited with code %d before finishing its episodes'
+                                   % (failed[0], processes[failed[0]].exitcode))
+            continue
+        if start_time is None:
+            # time from the first transition so that worker start-up is not counted
+            start_time = timeit.default_timer()
+        if kind == 'transition':
+            state, action, reward, next_state, done, seed, step, info = payload
+            if metrics is not None:
+                metrics.log_step(seed + 1, step, action, reward, info['queue'], info['staying_time'])
+            agent.add_experience(state, action, reward, next_state, done)
+            agent.replay_experience()
+            env_steps += info['steps']
+            updates += 1
+            if updates % broadcast_interval == 0:
+                weights = agent.get_model_weights()
+                for i in active:
+                    weights_queues[i].put(weights)
+        elif kind == 'episode':
+            seed, sum_of_staying_times, highway_speed, execution_time = payload
+            completed_episodes += 1
+            record = dict(sum_of_staying_times=sum_of_staying_times, average_highway_speed=highway_speed,
+                          execution_time=execution_time)
+            if metrics is not None:
+                metrics.log_episode(episode=seed + 1, **record)
+            if end_episode is not None:
+                end_episode(completed_episodes, record)
+        else:
+            active.discard(worker_id)
+
+    for process in processes:
+        process.join()
+    for weights_queue in weights_queues:
+        # weights broadcast after a worker's last read are never consumed
+        weights_queue.cancel_join_thread()
+
+    elapsed = timeit.default_timer() - start_time
+    steps_per_second = env_steps / elapsed
+    if metrics is None or metrics.verbosity() >= EPISODES:
+        print('workers:', workers, 'episodes:', completed_episodes, 'env steps:', env_steps,
+              'updates:', updates, 'env steps/sec:', steps_per_second)
+    return steps_per_second
@@ -0,0 +1,48 @@
+class StayingTimeTracker:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget all vehicles and the sum of staying times in preparation of a new episode.
+        '''
+        self._step = 0
+        # a vehicle on the roads has stayed (current step - its entry step) steps; keeping entry steps instead
+        # of staying times means that a simulation step only touches the vehicles that entered or left
+        self._entry_steps = {}
+        self._entry_sum = 0
+        # staying times of vehicles that left since the last read, kept in case they come back before it
+        self._departed = {}
+        self._sum_of_staying_times = 0
+
+    def update(self, vehicle_ids):
+        '''
+        Record one simulation step given the IDs of the vehicles currently on the roads.
+        '''
+        vehicles = set(vehicle_ids)
+        self._step += 1
+        for vehID in self._entry_steps.keys() - vehicles:
+            entry_step = self._entry_steps.pop(vehID)
+            self._entry_sum -= entry_step
+            self._departed[vehID] = self._step - 1 - entry_step
+        for vehID in vehicles - self._entry_steps.keys():
+            entry_step = self._step - 1 - self._departed.pop(vehID, 0)
+            self._entry_steps[vehID] = entry_step
+            self._entry_sum += entry_step
+
+    def cumultative_staying_time(self):
+        '''
+        Get the cumultative staying time of the vehicles on the roads and add it to the sum of staying times.
+        Vehicles that left the roads since the last call no longer count.
+        '''
+        self._departed.clear()
+        cumultative_staying_time = len(self._entry_steps) * self._step - self._entry_sum
+        self._sum_of_staying_times += cumultative_staying_time
+        return cumultative_staying_time
+
+    def sum_of_staying_times(self):
+        '''
+        Return the sum of staying time across the episode.
+        '''
+        return self._sum_of_staying_times
+
@@ -0,0 +1,367 @@
+'''
+Hyperparameter sweep of the agent. Every trial samples the hyperparameters from a search space and trains
+on intersection one for a number of episodes, as main.py does. Every trial runs in a process of its own,
+at most --workers at once. Each process is pinned to a core no other trial holds, and TensorFlow and the
+math libraries are limited to one thread, so the trials do not oversubscribe the cores. A trial is pruned once its mean sum of
+staying times over the episodes so far is worse than the median of the other trials at the same episode.
+Every trial uses the route seeds of main.py, so the curves compare episode by episode.
+
+The sweep is kept in a store directory and is resumable: complete and pruned trials are skipped, and a
+trial that was interrupted or failed, e.g. when SUMO did not start or its process crashed, runs again from
+the checkpoint of its last episode.
+
+    <store>/sweep.json                       search space and settings, checked when resuming
+    <store>/trial-0003/params.json           sampled hyperparameters
+    <store>/trial-0003/curve.jsonl           one line per finished episode, read for pruning
+    <store>/trial-0003/metrics/              metrics.MetricsWriter run directory
+    <store>/trial-0003/checkpoints/          checkpoint of the last episode until the trial completes or is pruned
+    <store>/trial-0003/result.json           status (complete, pruned or failed) and score
+
+    python sweep.py --store sweeps/lr --trials 16 --workers 4 --episodes 20
+'''
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import optparse
+import os
+import random
+import shutil
+import timeit
+import numpy as np
+
+# bump when the layout of the store or the meaning of its results changes
+SWEEP_FORMAT_VERSION = 1
+
+# name -> [distribution, arguments...]: choice of the values, uniform or log_uniform between two bounds,
+# or int_uniform between two bounds inclusive
+DEFAULT_SPACE = {
+    'discount_rate': ['choice', [0.9, 0.95, 0.99]],
+    'exploration_rate': ['uniform', 0.01, 0.2],
+    'learning_rate': ['log_uniform', 1e-5, 1e-3],
+    'memory_capacity': ['choice', [200, 1000, 10000]],
+    'batch_size': ['choice', [32, 64]],
+    'update_rate': ['log_uniform', 1e-4, 1e-2],
+}
+
+# the agent parameters of main.py that are not searched by default
+BASE_PARAMS = dict(discount_rate=0.95, exploration_rate=0.1, learning_rate=0.0002, memory_capacity=200,
+                   action_size=2, batch_size=32, update_rate=0.001)
+
+class TrialPruned(Exception):
+    pass
+
+
+def sample_params(space, seed, trial):
+    '''
+    Sample the hyperparameters of a trial. The same seed and trial always give the same ones.
+    '''
+    rng = np.random.default_rng([seed, trial])
+    params = {}
+    for name, (distribution, *args) in sorted(space.items()):
+        if distribution == 'choice':
+            value = args[0][int(rng.integers(len(args[0])))]
+        elif distribution == 'uniform':
+            value = float(rng.uniform(args[0], args[1]))
+        elif distribution == 'log_uniform':
+            value = float(math.exp(rng.uniform(math.log(args[0]), math.log(args[1]))))
+        elif distribution == 'int_uniform':
+            value = int(rng.integers(args[0], args[1] + 1))
+        else:
+            raise ValueError("unknown distribution '%s' of %s" % (distribution, name))
+        params[name] = value
+    return params
+
+
+def trial_dir(store, trial):
+    '''
+    Return the directory of a trial in the store.
+    '''
+    return os.path.join(store, 'trial-%04d' % trial)
+
+
+def _write_json(path, value):
+    '''
+    Write a JSON file under a temporary name and rename it into place.
+    '''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(value, json_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    '''
+    Read a JSON file, or return None if it does not exist.
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def read_curve(directory, episodes=None):
+    '''
+    Return the per-episode records of a trial, the first episodes ones if given.
+    '''
+    path = os.path.join(directory, 'curve.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path) as curve_file:
+        # a line cut short by a crash is dropped
+        lines = [line for line in curve_file.read().split('\n') if line.endswith('}')]
+    return [json.loads(line) for line in lines[:episodes]]
+
+
+def running_mean(curve, episodes):
+    '''
+    Return the mean sum of staying times of the first episodes episodes of a curve.
+    '''
+    return float(np.mean([record['sum_of_staying_times'] for record in curve[:episodes]]))
+
+
+def should_prune(store, trial, curve, settings):
+    '''
+    Return whether a trial is worse than the median of the other trials that reached the same episode,
+    once it ran the episodes settings['prune_after'] requires and enough other trials compare.
+    '''
+    episodes = len(curve)
+    if episodes < settings['prune_after'] or episodes >= settings['episodes']:
+        return False
+    others = []
+    for name in os.listdir(store):
+        if name.startswith('trial-') and name != os.path.basename(trial_dir(store, trial)):
+            other = read_curve(os.path.join(store, name), episodes)
+            if len(other) == episodes:
+                others.append(running_mean(other, episodes))
+    if len(others) < settings['prune_min_trials']:
+        return False
+    return running_mean(curve, episodes) > np.median(others)
+
+
+def _run_trial(store, trial, settings, core):
+    '''
+    Train the agent of a trial in this process, pinned to core, resuming it from its checkpoint if there
+    is one, and write its result. The checkpoint is kept if the trial failed, to run it again from there.
+    '''
+    if hasattr(os, 'sched_setaffinity'):
+        # its sumo process inherits the pinning
+        os.sched_setaffinity(0, {core})
+    directory = trial_dir(store, trial)
+    params = _read_json(os.path.join(directory, 'params.json'))
+    start_time = timeit.default_timer()
+    try:
+        result = _train_trial(store, trial, directory, params, settings)
+    except TrialPruned as pruned:
+        result = dict(status='pruned', episodes=pruned.args[0])
+    except Exception as error:
+        result = dict(status='failed', error='%s: %s' % (type(error).__name__, error),
+                      episodes=len(read_curve(directory)))
+    curve = read_curve(directory)
+    if curve and result['status'] != 'failed':
+        # the score is the mean of the last episodes, lower is better
+        result['score'] = running_mean(curve[-settings['score_episodes']:], settings['score_episodes'])
+    result.update(trial=trial, params=params, worker_core=core, seconds=timeit.default_timer() - start_time)
+    _write_json(os.path.join(directory, 'result.json'), result)
+    if result['status'] != 'failed':
+        shutil.rmtree(os.path.join(directory, 'checkpoints'), ignore_errors=True)
+
+
+def _train_trial(store, trial, directory, params, settings):
+    '''
+    Train the agent with the trial hyperparameters, appending every episode to the curve and
+    checkpointing after it. Raises TrialPruned with the number of episodes run when pruned.
+    '''
+    # one thread per worker, like the rollout workers
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from checkpoint import CheckpointManager
+    from dqn_agent import DQNAgent
+    from main import train_single_intersection
+    from metrics import QUIET, MetricsWriter, truncate_run
+    from traffic_signal_env import TrafficSignalEnv
+
+    random.seed(0)
+    agent = DQNAgent(**dict(BASE_PARAMS, **params))
+    checkpoints = CheckpointManager(os.path.join(directory, 'checkpoints'), keep=1)
+    metrics_dir = os.path.join(directory, 'metrics')
+    first_episode = 0
+    if checkpoints.latest() is not None:
+        checkpoint = checkpoints.restore(agent)
+        first_episode = checkpoint['episode']
+        truncate_run(metrics_dir, checkpoint['extra']['metrics_chunks'])
+    curve = read_curve(directory, first_episode)
+    with open(os.path.join(directory, 'curve.jsonl'), 'w') as curve_file:
+        curve_file.write(''.join(json.dumps(record) + '\n' for record in curve))
+
+    metrics = MetricsWriter(metrics_dir, verbosity=QUIET)
+    env = TrafficSignalEnv(settings['time_steps'], label='trial%d' % trial, backend_name=settings['backend'],
+                           warm_up_steps=settings['warm_up_steps'])
+
+    def end_episode(episode, record):
+        '''
+        Append the episode to the curve, checkpoint the trial and prune it if it is behind.
+        '''
+        record = dict(episode=episode, sum_of_staying_times=int(record['sum_of_staying_times']),
+                      average_highway_speed=float(record['average_highway_speed']))
+        curve.append(record)
+        with open(os.path.join(directory, 'curve.jsonl'), 'a') as curve_file:
+            curve_file.write(json.dumps(record) + '\n')
+        checkpoints.save(agent, episode, metrics_chunks=metrics.chunk_counts())
+        if should_prune(store, trial, curve, settings):
+            raise TrialPruned(episode)
+
+    try:
+        train_single_intersection(agent, env, settings['episodes'], metrics, first_episode=first_episode,
+                                  end_episode=end_episode)
+    finally:
+        env.close()
+        metrics.close()
+        checkpoints.wait()
+    return dict(status='complete', episodes=settings['episodes'])
+
+
+def open_store(store, space, settings):
+    '''
+    Create the store of a sweep, or check that an existing one has the same search space and settings.
+    '''
+    os.makedirs(store, exist_ok=True)
+    sweep = dict(version=SWEEP_FORMAT_VERSION, space=space, settings=settings)
+    existing = _read_json(os.path.join(store, 'sweep.json'))
+    if existing is None:
+        _write_json(os.path.join(store, 'sweep.json'), sweep)
+    elif json.loads(json.dumps(sweep)) != existing:
+        raise ValueError('%s holds a sweep with another search space or settings' % store)
+
+
+def _finish_trial(store, trial, process, core, start_time):
+    '''
+    Return the result of a trial whose process exited, writing a failed result if the process died
+    before it wrote one, e.g. killed or crashed in SUMO or TensorFlow.
+    '''
+    directory = trial_dir(store, trial)
+    result = _read_json(os.path.join(directory, 'result.json'))
+    if result is None:
+        result = dict(status='failed', error='trial process exited with code %s' % process.exitcode,
+                      episodes=len(read_curve(directory)), trial=trial,
+                      params=_read_json(os.path.join(directory, 'params.json')), worker_core=core,
+                      seconds=timeit.default_timer() - start_time)
+        _write_json(os.path.join(directory, 'result.json'), result)
+    return result
+
+
+def run_sweep(store, space, settings, trials, workers, progress=None):
+    '''
+    Run the trials 0 to trials - 1 that are not complete or pruned yet, at most workers at once, and
+    return the results of all of them. progress is called with every trial and result that finished.
+    '''
+    open_store(store, space, settings)
+    pending = []
+    for trial in range(trials):
+        directory = trial_dir(store, trial)
+        result = _read_json(os.path.join(directory, 'result.json'))
+        if result is None or result['status'] == 'failed':
+            os.makedirs(directory, exist_ok=True)
+            _write_json(os.path.join(directory, 'params.json'), sample_params(space, settings['seed'], trial))
+            pending.append(trial)
+    if not pending:
+        return load_results(store)
+
+    # inherited by the trial processes: numpy and TensorFlow math libraries use one thread each
+    for variable in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ.setdefault(variable, '1')
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    # one core per running trial, shared round-robin only if there are more workers than cores; the
+    # parent takes a core back when the process of its trial exits, however it exited
+    free_cores = [cores[i % len(cores)] for i in range(min(workers, len(pending)))]
+    # spawn rather than fork, TensorFlow is not fork safe once it has been initialised
+    context = multiprocessing.get_context('spawn')
+    running = {}
+    try:
+        while pending or running:
+            while pending and free_cores:
+                # a process per trial, so a crash or leak of a trial never reaches the next one
+                trial, core = pending.pop(0), free_cores.pop(0)
+                result_path = os.path.join(trial_dir(store, trial), 'result.json')
+                if os.path.exists(result_path):
+                    # the result of an earlier failed run
+                    os.remove(result_path)
+                process = context.Process(target=_run_trial, args=(store, trial, settings, core), daemon=True)
+                process.start()
+                running[process.sentinel] = (trial, process, core, timeit.default_timer())
+            for sentinel in multiprocessing.connection.wait(list(running)):
+                trial, process, core, start_time = running.pop(sentinel)
+                process.join()
+                free_cores.append(core)
+                result = _finish_trial(store, trial, process, core, start_time)
+                if progress is not None:
+                    progress(trial, result)
+    finally:
+        for trial, process, core, start_time in running.values():
+            process.terminate()
+    return load_results(store)
+
+
+def load_results(store):
+    '''
+    Return the results of the finished trials of a store, the complete ones first, best score first.
+    '''
+    results = []
+    for name in sorted(os.listdir(store)):
+        result = _read_json(os.path.join(store, name, 'result.json')) if name.startswith('trial-') else None
+        if result is not None:
+            results.append(result)
+    # a pruned trial is scored on earlier episodes, so it never ranks above a complete one
+    return sorted(results, key=lambda result: (result['status'] != 'complete', result.get('score', math.inf)))
+
+
+def get_options():
+    '''
+    Parse the command line options.
+    '''
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option('--store', default=os.path.join('sweeps', 'default'),
+                          help='directory of the sweep, resumed if it exists')
+    opt_parser.add_option('--space', default=None,
+                          help='JSON file of the search space, {name: [distribution, arguments...]}, by default %s'
+                               % ', '.join(sorted(DEFAULT_SPACE)))
+    opt_parser.add_option('--trials', type='int', default=16, help='number of trials of the sweep')
+    opt_parser.add_option('--workers', type='int', default=os.cpu_count(),
+                          help='number of trials run at once, one process and core each')
+    opt_parser.add_option('--episodes', type='int', default=20, help='training episodes of every trial')
+    opt_parser.add_option('--time-steps', type='int', default=3600, help='simulation steps of every episode')
+    opt_parser.add_option('--warm-up-steps', type='int', default=0,
+                          help='start every episode from the simulation state after this many fixed-time steps')
+    opt_parser.add_option('--backend', choices=['traci', 'libsumo'], default='traci', help='simulation backend')
+    opt_parser.add_option('--seed', type='int', default=0, help='seed of the sampled hyperparameters')
+    opt_parser.add_option('--score-episodes', type='int', default=3,
+                          help='last episodes whose mean sum of staying times is the score of a trial')
+    opt_parser.add_option('--prune-after', type='int', default=3,
+                          help='episodes a trial runs before it can be pruned')
+    opt_parser.add_option('--prune-min-trials', type='int', default=3,
+                          help='other trials that must have reached an episode before a trial is pruned at it')
+    options, args = opt_parser.parse_args()
+    return options
+
+
+if __name__ == '__main__':
+    options = get_options()
+    space = DEFAULT_SPACE
+    if options.space is not None:
+        with open(options.space) as space_file:
+            space = json.load(space_file)
+    settings = dict(episodes=options.episodes, time_steps=options.time_steps, warm_up_steps=options.warm_up_steps,
+                    backend=options.backend, seed=options.seed, score_episodes=options.score_episodes,
+                    prune_after=options.prune_after, prune_min_trials=options.prune_min_trials)
+
+    def progress(trial, result):
+        print('trial %d: %s after %d episodes, score %s'
+              % (trial, result['status'], result['episodes'], '%.0f' % result['score'] if 'score' in result else '-'))
+
+    results = run_sweep(options.store, space, settings, options.trials, options.workers, progress)
+    print('%6s %9s %9s %12s  %s' % ('trial', 'status', 'episodes', 'score', 'hyperparameters'))
+    for result in results:
+        print('%6d %9s %9d %12s  %s' % (result['trial'], result['status'], result['episodes'],
+                                        '%.0f' % result['score'] if 'score' in result else '-',
+                                        json.dumps(result['params'], sort_keys=True)))
@@ -0,0 +1,87 @@
+import timeit
+import tensorflow as tf
+
+# 'soft': Polyak averaging target += update_rate * (online - target) on every training step,
+# 'hard': copy the online weights to the target every hard_update_interval training steps
+TARGET_SYNC_MODES = ('soft', 'hard')
+
+
+class TargetNetworkSync:
+    def __init__(self, model, target_model, mode='soft', update_rate=0.001, hard_update_interval=1000):
+        if mode not in TARGET_SYNC_MODES:
+            raise ValueError("unknown target sync mode '%s', expected one of %s" % (mode, TARGET_SYNC_MODES))
+        self._mode = mode
+        self._update_rate = tf.constant(update_rate, dtype=tf.float32)
+        self._hard_update_interval = hard_update_interval
+        self._variables = list(zip(model.weights, target_model.weights))
+        self._steps = 0
+        self._updates = 0
+        self._total_time = 0.0
+        self._timing_hook = None
+
+    @tf.function
+    def _soft_update(self, update_rate):
+        # assign in place on the variables, the weights never leave the device
+        for variable, target_variable in self._variables:
+            target_variable.assign(target_variable + update_rate * (variable - target_variable))
+
+    @tf.function
+    def _hard_update(self):
+        for variable, target_variable in self._variables:
+            target_variable.assign(variable)
+
+    def step(self):
+        '''
+        Count a training step and update the target network as the mode requires. Must be called exactly
+        once per training step. Returns whether the target network changed.
+        '''
+        self._steps += 1
+        if self._mode == 'hard' and self._steps % self._hard_update_interval != 0:
+            return False
+        start_time = timeit.default_timer()
+        if self._mode == 'soft':
+            self._soft_update(self._update_rate)
+        else:
+            self._hard_update()
+        elapsed = timeit.default_timer() - start_time
+        self._updates += 1
+        self._total_time += elapsed
+        if self._timing_hook is not None:
+            self._timing_hook(self._mode, elapsed)
+        return True
+
+    def soft_update(self):
+        '''
+        Perform one soft update regardless of the mode, outside of the training step count.
+        '''
+        self._soft_update(self._update_rate)
+
+    def set_timing_hook(self, hook):
+        '''
+        Call hook(mode, seconds) after every target update, or stop calling it if hook is None.
+        '''
+        self._timing_hook = hook
+
+    def steps(self):
+        '''
+        Return the number of training steps counted.
+        '''
+        return self._steps
+
+    def set_steps(self, steps):
+        '''
+        Set the training step count, e.g. when training resumes, so hard updates keep their schedule.
+        '''
+        self._steps = steps
+
+    def updates(self):
+        '''
+        Return the number of target updates performed by step.
+        '''
+        return self._updates
+
+    def total_time(self):
+        '''
+        Return the wall time in seconds spent in the target updates performed by step.
+        '''
+        return self._total_time
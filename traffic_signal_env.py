@@ -0,0 +1,270 @@
+import multiprocessing
+import os
+import numpy as np
+import backend
+import instrumentation
+from corridor_stats import CorridorStats
+from intersection import Intersection, TrafficGenerator, set_sumo
+from phase_scheduler import PhaseScheduler, program_duration
+from warm_start import SimulationSession
+
+NE_HIGHWAY_ID = 'hwn'
+SE_HIGHWAY_ID = 'hws'
+TLS_INT1_ID = 'int1'
+TLS_INT2_ID = 'int2'
+INT1_JUNCTION_ID = 'int1'
+INT2_JUNCTION_ID = 'int2'
+NS_GREEN_PHASE = 0
+WE_GREEN_PHASE = 4
+INT1_W = 'we1'
+INT1_E = 'ew3'
+INT1_N = 'int1ns1'
+INT1_S = 'int1sn1'
+INT2_W = 'we2'
+INT2_E = 'ew2'
+INT2_N = 'int2ns1'
+INT2_S = 'int2sn1'
+INT_SPEED_LIMIT = 15.64
+HALTING_SPEED = 0.1 # m/s, below which SUMO counts a vehicle as halting
+
+def create_highway_stats():
+    '''
+    Create the entry speed statistics of the two highways.
+    '''
+    return CorridorStats([NE_HIGHWAY_ID, SE_HIGHWAY_ID])
+
+def queue_length(state, speed_limit=INT_SPEED_LIMIT):
+    '''
+    Count the occupied cells of a state whose vehicle is halting.
+    '''
+    p, v = state[0], state[1]
+    return int(np.count_nonzero((p > 0) & (v < HALTING_SPEED / speed_limit)))
+
+def create_int1():
+    '''
+    Create the controlled intersection one.
+    '''
+    return Intersection(n_id=INT1_N, e_id=INT1_E, s_id=INT1_S, w_id=INT1_W, 
+                        tls_id=TLS_INT1_ID, junction_id=INT1_JUNCTION_ID, 
+                        ns_green_phase=NS_GREEN_PHASE, we_green_phase=WE_GREEN_PHASE, 
+                        road_length=500, cell_length=40, speed_limit=15.64)
+
+def create_int2():
+    '''
+    Create the controlled intersection two.
+    '''
+    return Intersection(n_id=INT2_N, e_id=INT2_E, s_id=INT2_S, w_id=INT2_W, 
+                        tls_id=TLS_INT2_ID, junction_id=INT2_JUNCTION_ID, 
+                        ns_green_phase=NS_GREEN_PHASE, we_green_phase=WE_GREEN_PHASE, 
+                        road_length=500, cell_length=40, speed_limit=15.64)
+
+def phase_program(action, state):
+    '''
+    Return the (phase, duration) program of the traffic signal for an action taken in the given state.
+    '''
+    if (action != state[2][0][0][0]):
+        # chosen action is the same so keep traffic signal light unchanged
+        if action == 1:
+            phase = NS_GREEN_PHASE
+        else:
+            phase = WE_GREEN_PHASE
+        return [(phase, 10)]
+
+    # chosen action is not the same
+    # transition phase
+    if action == 1:
+        phase = WE_GREEN_PHASE
+    else:
+        phase = NS_GREEN_PHASE
+    return [(phase + 1, 6),             # turn on yellow light for either NS traffic or WE traffic
+            (phase + 2, 10),            # turn on green light for left turn
+            (phase + 3, 6),             # turn on yellow light for left turn
+            ((phase + 4) % 8, 10)]      # turn on green light for phase transitioning to
+
+def execute_action(scheduler, intersection, action, state, highway_stats):
+    '''
+    Run the phase program of the chosen action on traffic signal 0 of the scheduler, updating the highway
+    speed statistics and staying times after every step, and return the number of simulation steps taken.
+    '''
+    program = phase_program(action, state)
+    scheduler.start(0, program)
+    while not scheduler.finished(0):
+        with instrumentation.phase('simulation_step'):
+            scheduler.step()
+        with instrumentation.phase('update_highway_speeds'):
+            highway_stats.update()
+        with instrumentation.phase('update_staying_times'):
+            intersection.update_staying_times()
+    return program_duration(program)
+
+class TrafficSignalEnv:
+    def __init__(self, time_steps, label='default', backend_name='traci', routes_file=None, warm_up_steps=0,
+                 state_cache_dir=os.path.join('config', 'state_cache')):
+        self._time_steps = time_steps
+        self._label = label
+        self._backend_name = backend_name
+        if routes_file is None and label != 'default':
+            # simultaneous simulations need their own route files
+            routes_file = os.path.join('config', 'routes_%s.rou.xml' % label)
+        sumo_cmd = set_sumo('run.sumocfg', time_steps, nogui=True, backend_name=backend_name)
+        # an episode starts after the warm-up, so the routes cover both
+        if routes_file is None:
+            self._traffic_gen = TrafficGenerator(time_steps + warm_up_steps)
+            self._routes_file = os.path.join('config', 'routes.rou.xml')
+        else:
+            self._traffic_gen = TrafficGenerator(time_steps + warm_up_steps, routes_file=routes_file)
+            self._routes_file = routes_file
+            sumo_cmd += ['--route-files', routes_file]
+        self._session = SimulationSession(sumo_cmd, label=label, warm_up_steps=warm_up_steps,
+                                          cache_dir=state_cache_dir)
+        self._int1 = create_int1()
+        self._scheduler = PhaseScheduler([TLS_INT1_ID])
+        self._step = 0
+        self._state = None
+        self._highway_stats = create_highway_stats()
+
+    def reset(self, seed):
+        '''
+        Start a new episode with the routes of the given seed, after the warm-up, and return the first state.
+        The sumo process of the previous episode is reused.
+        '''
+        self._traffic_gen.generate_routefile(seed)
+        with instrumentation.phase('start_episode'):
+            self._session.start(self._routes_file)
+        self._int1.subscribe()
+        self._int1.reset_staying_time_info()
+        self._scheduler.reset()
+        self._step = 0
+        self._highway_stats.reset()
+        self._highway_stats.subscribe()
+        with instrumentation.phase('get_state'):
+            self._state = self._int1.get_state()
+        return self._state
+
+    def step(self, action):
+        '''
+        Execute an action and return the next state, the reward, whether the episode is over and an info
+        dictionary with the number of simulation steps taken, the queue length and cumulative staying time
+        after them and, at the end of an episode, its results.
+        '''
+        # get current cumultative waiting time
+        staying_time_start = self._int1.cumultative_staying_time()
+
+        steps = execute_action(self._scheduler, self._int1, action, self._state, self._highway_stats)
+        self._step += steps
+
+        # observe reward
+        staying_time_end = self._int1.cumultative_staying_time()
+        reward = staying_time_start - staying_time_end
+
+        with instrumentation.phase('get_state'):
+            next_state = self._int1.get_state()
+        self._state = next_state
+        done = not (backend.simulation.getMinExpectedNumber() > 0 and self._step < self._time_steps)
+        info = {'steps': steps, 'queue': queue_length(next_state), 'staying_time': staying_time_end}
+        if done:
+            info['sum_of_staying_times'] = self._int1.sum_of_staying_times()
+            info['average_highway_speed'] = self._highway_stats.mean()
+        return next_state, reward, done, info
+
+    def current_step(self):
+        '''
+        Return the simulation step of the running episode.
+        '''
+        return self._step
+
+    def session(self):
+        '''
+        Return the SimulationSession running the episodes.
+        '''
+        return self._session
+
+    def close(self):
+        '''
+        Close the running simulation, if any.
+        '''
+        self._session.close()
+
+def _env_worker(remote, env_kwargs, seed_stride):
+    '''
+    Serve reset/step/close commands for one TrafficSignalEnv in a subprocess. An episode that ends is
+    reset right away with the seed seed_stride further on.
+    '''
+    env = TrafficSignalEnv(**env_kwargs)
+    seed = 0
+    while True:
+        command, data = remote.recv()
+        if command == 'reset':
+            seed = data
+            remote.send(env.reset(seed))
+        elif command == 'step':
+            next_state, reward, done, info = env.step(data)
+            if done:
+                info['final_state'] = next_state
+                seed += seed_stride
+                next_state = env.reset(seed)
+            remote.send((next_state, reward, done, info))
+        else:
+            env.close()
+            remote.close()
+            break
+
+class VectorEnv:
+    def __init__(self, num_envs, time_steps, backend_name='traci', warm_up_steps=0):
+        # spawn rather than fork, TensorFlow is not fork safe once it has been initialised
+        context = multiprocessing.get_context('spawn')
+        self._num_envs = num_envs
+        self._remotes = []
+        self._processes = []
+        for i in range(num_envs):
+            remote, worker_remote = context.Pipe()
+            env_kwargs = dict(time_steps=time_steps, label='env%d' % i, backend_name=backend_name,
+                              warm_up_steps=warm_up_steps)
+            process = context.Process(target=_env_worker, args=(worker_remote, env_kwargs, num_envs), daemon=True)
+            process.start()
+            worker_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+    def num_envs(self):
+        '''
+        Return the number of environments.
+        '''
+        return self._num_envs
+
+    def reset(self, seeds=None):
+        '''
+        Reset every environment, by default environment i with seed i, and return the stacked states.
+        '''
+        if seeds is None:
+            seeds = range(self._num_envs)
+        for remote, seed in zip(self._remotes, seeds):
+            remote.send(('reset', seed))
+        return stack_states([remote.recv() for remote in self._remotes])
+
+    def step(self, actions):
+        '''
+        Step every environment with its action. Returns the stacked next states, rewards, done flags and
+        the info dictionaries. Environments whose episode ended are reset: their next state is the first
+        state of the new episode and info['final_state'] is the last state of the old one.
+        '''
+        for remote, action in zip(self._remotes, actions):
+            remote.send(('step', int(action)))
+        results = [remote.recv() for remote in self._remotes]
+        next_states, rewards, dones, infos = zip(*results)
+        return stack_states(next_states), np.array(rewards), np.array(dones), list(infos)
+
+    def close(self):
+        '''
+        Close every environment and its subprocess.
+        '''
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for process in self._processes:
+            process.join()
+
+def stack_states(states):
+    '''
+    Stack [position, speed, light] states into batched inputs of shape (N, 12, 12, 1) and (N, 2, 1).
+    '''
+    return [np.concatenate([state[i] for state in states]) for i in range(3)]
@@ -0,0 +1,116 @@
+'''
+Episodes that start from a warmed-up simulation. An empty network takes a few hundred steps to fill
+before its state is representative, so the state after warm_up_steps steps of the fixed-time signal
+programs of the network is saved with SUMO's saveState, once per route file and warm-up length, and
+later episodes on the same routes load it instead of simulating the warm-up again. The sumo process (or
+the in-process libsumo) is kept between episodes and loads the next simulation rather than being
+restarted, which saves launching the binary and connecting to it.
+
+    session = SimulationSession(sumo_cmd, warm_up_steps=300)
+    session.start(routes_file)    # after generating the routes of the episode
+    ...
+    session.close()               # after the last episode
+
+The saved states are config/state_cache/<hash>.xml.gz, where the hash covers the contents of the route
+file, the warm-up length and the sumo arguments.
+'''
+import hashlib
+import json
+import os
+import timeit
+import backend
+
+# bump when the saved states change for the same routes, warm-up length and sumo arguments
+STATE_CACHE_VERSION = 1
+
+# sumo saves states with two decimals and without its random number generators by default
+STATE_OPTIONS = ['--save-state.precision', '8', '--save-state.rng', 'true']
+
+
+class SimulationSession:
+    def __init__(self, sumo_cmd, label='default', warm_up_steps=0, cache_dir=os.path.join('config', 'state_cache')):
+        self._sumo_cmd = list(sumo_cmd) + STATE_OPTIONS
+        self._label = label
+        self._warm_up_steps = warm_up_steps
+        self._cache_dir = cache_dir
+        self._running = False
+        self._counts = dict(episodes=0, starts=0, loads=0, cached_states=0, warm_up_steps=0, startup_time=0.0)
+
+    def warm_up_steps(self):
+        '''
+        Return the number of steps every episode is warmed up by before it starts.
+        '''
+        return self._warm_up_steps
+
+    def state_file(self, routes_file):
+        '''
+        Return the path of the saved warm state of the routes in routes_file.
+        '''
+        with open(routes_file, 'rb') as routes:
+            routes_hash = hashlib.sha1(routes.read()).hexdigest()
+        args = self._sumo_cmd[1:]
+        if '--route-files' in args:
+            # the routes are hashed by contents, simultaneous sessions write them to different files
+            i = args.index('--route-files')
+            args = args[:i] + args[i + 2:]
+        key = json.dumps([STATE_CACHE_VERSION, self._warm_up_steps, args, routes_hash])
+        return os.path.join(self._cache_dir, hashlib.sha1(key.encode('utf8')).hexdigest() + '.xml.gz')
+
+    def start(self, routes_file=os.path.join('config', 'routes.rou.xml')):
+        '''
+        Start an episode on the routes in routes_file, which the sumo command must load, warmed up from the
+        saved state, which is simulated and saved first if there is none. Returns the number of warm-up
+        steps simulated.
+        '''
+        start_time = timeit.default_timer()
+        state_file = self.state_file(routes_file) if self._warm_up_steps > 0 else None
+        cached = state_file is not None and os.path.exists(state_file)
+        self._launch(['--load-state', state_file] if cached else [])
+
+        warm_up_steps = 0
+        if state_file is not None and not cached:
+            # one call runs all the steps, the step listeners only see the episode
+            backend.simulation.step(backend.simulation.getTime() + self._warm_up_steps * backend.simulation.getDeltaT())
+            warm_up_steps = self._warm_up_steps
+            # write to a temporary file first so that simultaneous sessions never load a partial state
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_file = '%s.%d.tmp.xml.gz' % (state_file[:-len('.xml.gz')], os.getpid())
+            backend.simulation.saveState(tmp_file)
+            os.replace(tmp_file, state_file)
+            # a loaded state is not bit for bit the simulated one, and every episode on these routes must
+            # start from the same state
+            self._launch(['--load-state', state_file])
+
+        self._counts['episodes'] += 1
+        self._counts['cached_states'] += int(cached)
+        self._counts['warm_up_steps'] += warm_up_steps
+        self._counts['startup_time'] += timeit.default_timer() - start_time
+        return warm_up_steps
+
+    def _launch(self, extra_args):
+        '''
+        Load a simulation with the sumo command and extra_args into the running one, or start it.
+        '''
+        if self._running and backend.can_load():
+            backend.load(self._sumo_cmd[1:] + extra_args, label=self._label)
+            self._counts['loads'] += 1
+        else:
+            self.close()
+            backend.start(self._sumo_cmd + extra_args, label=self._label)
+            self._running = True
+            self._counts['starts'] += 1
+
+    def counts(self):
+        '''
+        Return the number of episodes started, of sumo starts and loads, of episodes started from a saved
+        state, the warm-up steps simulated and the seconds spent starting episodes, warm-up included.
+        '''
+        return dict(self._counts)
+
+    def close(self):
+        '''
+        Close the running simulation, if any.
+        '''
+        if self._running:
+            backend.close()
+            self._running = False